@@ -5,6 +5,8 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Запуск: uvicorn project.asgi:application --workers 4 --no-access-log
 """
 
 import os
@@ -12,5 +14,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# лента, теги и страница вопроса — async-версии (questions/async_views.py)
+os.environ.setdefault('ASYNC_VIEWS', '1')
+# под ASGI каждый запрос работает в своём потоке, постоянное соединение (CONN_MAX_AGE) не переживает запрос
+os.environ.setdefault('DB_CONN_MODE', 'pool')
+
+django_application = get_asgi_application()
+
+# SSE-потоки вопросов (/question/<id>/events/) обслуживаются в обход Django
+from questions.live import asgi_router  # noqa: E402 — после настройки Django
 
-application = get_asgi_application()
+application = asgi_router(django_application)
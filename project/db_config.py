@@ -9,3 +9,23 @@ DB_PASSWORD = os.environ.get('DB_PASSWORD', 'postgres')
 DB_HOST = os.environ.get('DB_HOST', 'localhost')
 DB_PORT = os.environ.get('DB_PORT', '5432')
 
+# postgresql или sqlite3 (тогда DB_NAME — путь к файлу базы)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+# Реплики для чтения через запятую: для postgresql — host[:port], для sqlite3 — пути к копиям файла.
+# Пусто — всё читается из основной базы.
+DB_REPLICAS = [replica.strip() for replica in os.environ.get('DB_REPLICAS', '').split(',') if replica.strip()]
+
+# Соединения с PostgreSQL:
+#   off        — новое соединение на каждый запрос
+#   persistent — соединение живёт DB_CONN_MAX_AGE секунд и проверяется перед повторным использованием
+#   pool       — пул psycopg 3 на процесс (min/max размер, ожидание свободного, пересоздание старых)
+DB_CONN_MODE = os.environ.get('DB_CONN_MODE', 'persistent')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+# сколько ждать свободное соединение, прежде чем запрос упадёт с ошибкой
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# соединения старше этого пересоздаются, простаивающие сверх min_size — закрываются
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))
+
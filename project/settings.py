@@ -12,7 +12,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
-from project.db_config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from project.db_config import (
+    DB_ENGINE, DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_REPLICAS,
+    DB_CONN_MODE, DB_CONN_MAX_AGE, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME, DB_POOL_MAX_IDLE,
+)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,12 +46,19 @@ INSTALLED_APPS = [
     'questions',
 ]
 
+# Server-Timing и гистограммы /metrics; PERF_METRICS=0 убирает middleware из цепочки
+PERF_METRICS = os.environ.get('PERF_METRICS', '1') == '1'
+# /metrics выдаёт маршруты и нагрузку сайта: отвечает только сборщику с этих адресов и персоналу (is_staff)
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+
 MIDDLEWARE = [
+    'questions.middleware.PerformanceMiddleware',
+    'questions.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'questions.middleware.CachedUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -56,7 +67,10 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': (
+            'questions.template_backends.TimedDjangoTemplates' if PERF_METRICS
+            else 'django.template.backends.django.DjangoTemplates'
+        ),
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -64,6 +78,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'questions.context_processors.liked',
             ],
         },
     },
@@ -71,21 +86,95 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project.wsgi.application'
 
+# Живые обновления страницы вопроса (questions/live.py): questions.live.LocalBackend — только свой
+# процесс; questions.live.PostgresBackend — LISTEN/NOTIFY между всеми процессами
+LIVE_EVENTS_BACKEND = os.environ.get('LIVE_EVENTS_BACKEND', 'questions.live.LocalBackend')
+LIVE_KEEPALIVE_SECONDS = int(os.environ.get('LIVE_KEEPALIVE_SECONDS', 15))
+
+# Отложенная запись лайков (questions/like_buffer.py): клики копятся в буфере и раз в LIKES_FLUSH_MS
+# применяются пачкой. LIKES_BUFFER — questions.like_buffer.LocalBuffer (память процесса) или
+# questions.like_buffer.CacheBuffer (общий кеш, Redis); LIKES_FLUSH_MS=0 — только python manage.py flush_likes
+LIKES_WRITE_BEHIND = os.environ.get('LIKES_WRITE_BEHIND', '0') == '1'
+LIKES_BUFFER = os.environ.get('LIKES_BUFFER', 'questions.like_buffer.LocalBuffer')
+LIKES_FLUSH_MS = int(os.environ.get('LIKES_FLUSH_MS', 200))
+LIKES_FLUSH_BATCH = int(os.environ.get('LIKES_FLUSH_BATCH', 1000))
+
+# Асинхронные страницы чтения (questions/async_views.py); project/asgi.py включает их сам
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+
+def database(name=DB_NAME, host=DB_HOST, port=DB_PORT):
+    if DB_ENGINE == 'sqlite3':
+        return {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+    config = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': DB_NAME,
+        'NAME': name,
         'USER': DB_USER,
         'PASSWORD': DB_PASSWORD,
-        'HOST': DB_HOST,
-        'PORT': DB_PORT,
+        'HOST': host,
+        'PORT': port,
+        # перед повторным использованием соединение проверяется (в режиме pool — при выдаче из пула)
+        'CONN_HEALTH_CHECKS': DB_CONN_MODE != 'off',
+    }
+    if DB_CONN_MODE == 'persistent':
+        config['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    elif DB_CONN_MODE == 'pool':
+        config['OPTIONS'] = {'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+            'max_idle': DB_POOL_MAX_IDLE,
+        }}
+    return config
+
+
+DATABASES = {
+    'default': database(),
+}
+
+# Реплики: replica1, replica2, ... (questions/routers.py)
+for number, replica in enumerate(DB_REPLICAS, 1):
+    if DB_ENGINE == 'sqlite3':
+        DATABASES[f'replica{number}'] = database(name=replica)
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[f'replica{number}'] = database(host=host, port=port or DB_PORT)
+    # в тестах реплика — то же соединение, что и default
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['questions.routers.PrimaryReplicaRouter']
+# сколько секунд после записи пользователь читает из основной базы
+PRIMARY_PIN_SECONDS = int(os.environ.get('PRIMARY_PIN_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Для нескольких процессов/серверов укажите общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Сессии: db (по умолчанию), cached_db — чтение из кеша, запись и в базу; signed_cookies — сессия целиком
+# в подписанной cookie, без хранилища на сервере (выход не отзывает уже скопированную cookie).
+# Вошедший пользователь с профилем кешируется на USER_CACHE_SECONDS (0 — читать из базы, как Django).
+# cached_db и кеш пользователей рассчитаны на общий кеш: с LocMemCache у каждого процесса своя копия,
+# и выход или смена пароля доходят до других процессов только по истечении ключа.
+# То же с отметками «лайкнуто мной» (questions/liked.py): клик сбрасывает их в кеше своего процесса,
+# в остальных они обновятся через LIKED_CACHE_TIMEOUT (10 минут).
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+USER_CACHE_SECONDS = int(os.environ.get('USER_CACHE_SECONDS', 60))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,6 +216,21 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'questions', 'static')
 ]
 
+# collectstatic: имена с хешем содержимого + рядом .gz/.br (questions/storage.py)
+STATIC_ROOT = os.environ.get('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'questions.storage.CompressedManifestStaticFilesStorage'},
+}
+# Без манифеста (collectstatic не запускали) ссылаться на статику без хеша; вне разработки — ошибка
+STATICFILES_UNHASHED_FALLBACK = DEBUG
+
+# Загруженные аватары и их миниатюры (questions/avatars.py)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -15,9 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+from questions.views import media, static_files
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    re_path(r'^media/(?P<path>.*)$', media, name='media'),
+    re_path(r'^static/(?P<path>.*)$', static_files, name='static_files'),
     path('', include('questions.urls')),
 ]
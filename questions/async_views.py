@@ -0,0 +1,143 @@
+"""
+Асинхронные страницы чтения для ASGI (uvicorn project.asgi:application).
+
+Данные читаются через async ORM; независимые запросы (страница ленты и
+популярные теги, вопрос и его ответы) запускаются одновременно. Шаблоны
+рендерятся в потоке через sync_to_async, поэтому цикл событий не ждёт
+ни рендеринга, ни запросов, которые шаблон делает сам (теги карточек).
+
+Под WSGI подключаются синхронные версии из views.py (см. questions/urls.py).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.urls import reverse
+from questions import live
+from questions.cache import aget_popular_tags
+from questions.forms import AnswerForm
+from questions.like_buffer import merge_pending
+from questions.liked import liked_loader
+from questions.models import Answer, Question
+from questions.page_cache import anonymous_page_cache, add_surrogate_keys
+from questions.pagination import apaginate_cursor
+from questions.related import related_questions
+from questions.views import ANSWERS_ORDERING, FEED_ORDERING, HOT_ORDERING, question_keys
+
+arender = sync_to_async(render)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@anonymous_page_cache
+async def index(request):
+    tag_name = request.GET.get("tag")
+
+    if tag_name:
+        questions = Question.objects.by_tag(tag_name)
+    else:
+        questions = Question.objects.new()
+
+    page, tags = await asyncio.gather(
+        apaginate_cursor(questions, request, FEED_ORDERING),
+        aget_popular_tags(),
+    )
+    add_surrogate_keys(request, f'tag:{tag_name}' if tag_name else 'feed:new', *question_keys(page))
+
+    return await arender(request, 'questions/index.html', {
+        'questions': page.object_list,
+        'page_obj': page,
+        'tags': tags,
+        'active_tag': tag_name,
+    })
+
+
+@anonymous_page_cache
+async def hot_questions(request):
+    page, tags = await asyncio.gather(
+        apaginate_cursor(Question.objects.hot(), request, HOT_ORDERING, per_page=3),
+        aget_popular_tags(),
+    )
+    add_surrogate_keys(request, 'feed:hot', *question_keys(page))
+
+    return await arender(request, 'questions/hot.html', {
+        'page_obj': page,
+        'questions': page.object_list,
+        'tags': tags,
+    })
+
+
+@anonymous_page_cache
+async def question(request, question_id):
+    # ответам нужен только id вопроса из URL, поэтому их можно читать, не дожидаясь самого вопроса
+    answers = Answer.objects.filter(question_id=question_id).select_related('user')
+    current_question, page, tags, related = await asyncio.gather(
+        aget_object_or_404(Question.objects.with_card_data(), id=question_id),
+        apaginate_cursor(answers, request, ANSWERS_ORDERING, per_page=5),
+        aget_popular_tags(),
+        alist(related_questions(question_id)),
+    )
+    add_surrogate_keys(request, f'question:{question_id}', *(f'answer:{a.id}' for a in page))
+    if settings.LIKES_WRITE_BEHIND:
+        await sync_to_async(merge_pending)('question', [current_question])
+        await sync_to_async(merge_pending)('answer', page.object_list)
+    # состояние «лайкнуто мной» загрузится в шаблоне, при рендере в потоке
+    liked = liked_loader(request)
+    liked.add('question', [current_question])
+    liked.add('answer', page.object_list)
+
+    # request.user, а не auser(): шаблон берёт ленивый request.user, и так пользователь загрузится один раз
+    is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+    if request.method == 'POST' and is_authenticated:
+        form = AnswerForm(request.POST, user=request.user, question=current_question)
+        if await sync_to_async(form.is_valid)():
+            answer = await sync_to_async(form.save)()
+            query = request.GET.urlencode()
+            url = reverse('questions:question', args=[question_id])
+            return redirect(url + (f'?{query}' if query else '') + f'#answer-{answer.id}')
+    else:
+        form = AnswerForm(user=request.user, question=current_question)
+
+    return await arender(request, 'questions/question.html', {
+        'question': current_question,
+        'answers': page.object_list,
+        'page_obj': page,
+        'form': form,
+        'tags': tags,
+        'related': related,
+    })
+
+
+@anonymous_page_cache
+async def tag(request, tag):
+    page, tags = await asyncio.gather(
+        apaginate_cursor(Question.objects.by_tag(tag), request, FEED_ORDERING),
+        aget_popular_tags(),
+    )
+    add_surrogate_keys(request, f'tag:{tag}', *question_keys(page))
+
+    return await arender(request, 'questions/tag.html', {
+        'questions': page.object_list,
+        'page_obj': page,
+        'tag': tag,
+        'tags': tags,
+    })
+
+
+async def question_events(request, question_id):
+    """
+    SSE-поток вопроса через Django (runserver, тесты). Под uvicorn тот же путь
+    раньше перехватывает live.asgi_router — без middleware и потока на соединение.
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI дочитал бы бесконечный поток до конца; после 204 EventSource не переподключается
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(live.event_stream(question_id), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,114 @@
+"""
+Миниатюры аватаров: квадратные 50/100/200 px в WebP и JPEG.
+
+Имена файлов содержат хеш содержимого оригинала (avatars/<hash>-100.webp),
+поэтому их можно отдавать с Cache-Control: immutable — новый аватар
+получает новое имя. Пока миниатюры не готовы, Profile.avatar_hash пуст
+и шаблоны показывают оригинал.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from questions.cache import invalidate_user
+from questions.models import Profile
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (50, 100, 200)
+# расширение -> (формат Pillow, параметры сохранения)
+AVATAR_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+AVATAR_DIR = 'avatars'
+DEFAULT_AVATAR = 'default.jpg'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def has_custom_avatar(profile):
+    return bool(profile.avatar) and profile.avatar.name != DEFAULT_AVATAR
+
+
+def thumbnail_name(digest, size, extension):
+    return f'{AVATAR_DIR}/{digest}-{size}.{extension}'
+
+
+def build_thumbnails(profile):
+    """Создаёт все варианты для текущего аватара и записывает avatar_hash. Возвращает хеш."""
+    source_name = profile.avatar.name
+    with default_storage.open(source_name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for size in AVATAR_SIZES:
+        thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in AVATAR_FORMATS.items():
+            name = thumbnail_name(digest, size, extension)
+            if default_storage.exists(name):
+                continue
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, image_format, **options)
+            saved = default_storage.save(name, ContentFile(buffer.getvalue()))
+            if saved != name:
+                # параллельный воркер успел первым: лишняя копия не нужна
+                default_storage.delete(saved)
+
+    # аватар могли сменить, пока считались миниатюры: тогда хеш относится к старому файлу
+    Profile.objects.filter(id=profile.id, avatar=source_name).update(avatar_hash=digest)
+    # update() не отправляет post_save: шапка с аватаром берёт профиль из кеша пользователей
+    invalidate_user(profile.user_id)
+    return digest
+
+
+def _build(profile_id):
+    try:
+        profile = Profile.objects.get(id=profile_id)
+        if has_custom_avatar(profile):
+            build_thumbnails(profile)
+    except Exception:
+        logger.exception('avatar thumbnails failed for profile %s', profile_id)
+
+
+def _build_in_worker(profile_id):
+    # у потока пула свои соединения с БД: закрываем их, как это делает обработчик запроса
+    close_old_connections()
+    try:
+        _build(profile_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AVATAR_WORKERS', 2), thread_name_prefix='avatars',
+            )
+        return _executor
+
+
+def schedule_thumbnails(profile):
+    """После коммита: миниатюры строятся в пуле потоков, запрос их не ждёт."""
+    if not has_custom_avatar(profile):
+        return
+
+    def submit():
+        if getattr(settings, 'AVATAR_THUMBNAILS_SYNC', False):
+            _build(profile.id)
+        else:
+            _get_executor().submit(_build_in_worker, profile.id)
+
+    transaction.on_commit(submit)
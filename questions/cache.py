@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import models, router, transaction
+from questions.models import Tag
+
+logger = logging.getLogger(__name__)
+
+POPULAR_TAGS_LIMIT = 15
+POPULAR_TAGS_CACHE_KEY = 'questions:popular_tags'
+POPULAR_TAGS_CACHE_TIMEOUT = 300
+# Сколько секунд процесс верит своей копии, не спрашивая общий кеш.
+# Это же и максимальная задержка инвалидации для остальных процессов.
+POPULAR_TAGS_MEMO_TTL = 5
+
+_memo = None  # (expires_at, tags)
+_stats = {'memo_hits': 0, 'cache_hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def popular_tags_queryset():
+    return Tag.objects.annotate(
+        num_questions=models.Count('question')
+    ).order_by('-num_questions')[:POPULAR_TAGS_LIMIT]
+
+
+def _memoized_tags(now):
+    memo = _memo
+    if memo is not None and memo[0] > now:
+        _stats['memo_hits'] += 1
+        return memo[1]
+    return None
+
+
+def _remember_tags(now, tags):
+    global _memo
+    _memo = (now + POPULAR_TAGS_MEMO_TTL, tags)
+    return tags
+
+
+def get_popular_tags():
+    """Боковая панель тегов: память процесса -> кеш Django -> БД."""
+    now = time.monotonic()
+    tags = _memoized_tags(now)
+    if tags is not None:
+        return tags
+
+    tags = cache.get(POPULAR_TAGS_CACHE_KEY)
+    if tags is None:
+        _stats['misses'] += 1
+        logger.debug('popular tags cache miss')
+        tags = list(popular_tags_queryset())
+        cache.set(POPULAR_TAGS_CACHE_KEY, tags, POPULAR_TAGS_CACHE_TIMEOUT)
+    else:
+        _stats['cache_hits'] += 1
+    return _remember_tags(now, tags)
+
+
+async def aget_popular_tags():
+    """get_popular_tags для асинхронных view: кеш и БД без блокировки цикла событий."""
+    now = time.monotonic()
+    tags = _memoized_tags(now)
+    if tags is not None:
+        return tags
+
+    tags = await cache.aget(POPULAR_TAGS_CACHE_KEY)
+    if tags is None:
+        _stats['misses'] += 1
+        logger.debug('popular tags cache miss')
+        tags = [tag async for tag in popular_tags_queryset()]
+        await cache.aset(POPULAR_TAGS_CACHE_KEY, tags, POPULAR_TAGS_CACHE_TIMEOUT)
+    else:
+        _stats['cache_hits'] += 1
+    return _remember_tags(now, tags)
+
+
+def invalidate_popular_tags():
+    global _memo
+    _memo = None
+    _stats['invalidations'] += 1
+    cache.delete(POPULAR_TAGS_CACHE_KEY)
+
+
+def popular_tags_stats():
+    return dict(_stats)
+
+
+# Карточки вопросов в лентах. Ключ содержит версию: всё, что видно на карточке
+# (updated_at — текст и теги, answers_count, аватар автора и его миниатюры). Старые версии не удаляются,
+# а просто истекают. CARD_TEMPLATE_VERSION меняется вместе с разметкой question_card.html.
+CARD_TEMPLATE_VERSION = 1
+CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+_card_stats = {'hits': 0, 'misses': 0}
+
+
+def card_cache_key(question):
+    author = question.user
+    version = f'{question.updated_at.isoformat()}|{question.answers_count}|{author.avatar.name}|{author.avatar_hash}'
+    digest = hashlib.md5(version.encode(), usedforsecurity=False).hexdigest()[:16]
+    return f'questions:card:{CARD_TEMPLATE_VERSION}:{question.id}:{digest}'
+
+
+def get_cards(questions):
+    """{id вопроса: HTML} для карточек, которые уже есть в кеше (один get_many)."""
+    keys = {card_cache_key(question): question.id for question in questions}
+    found = cache.get_many(keys)
+    _card_stats['hits'] += len(found)
+    _card_stats['misses'] += len(keys) - len(found)
+    return {keys[key]: html for key, html in found.items()}
+
+
+def set_cards(cards):
+    """cards: {вопрос: HTML}."""
+    cache.set_many({card_cache_key(question): html for question, html in cards.items()}, CARD_CACHE_TIMEOUT)
+
+
+def card_cache_stats():
+    stats = dict(_card_stats)
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+# Вошедший пользователь вместе с профилем (CachedUserMiddleware): один ключ на пользователя,
+# сбрасывается сигналами при сохранении User и Profile — настройки, смена пароля, новый аватар.
+USER_CACHE_KEY = 'questions:user:{}'
+
+
+def get_user_with_profile(user_id):
+    """User с загруженным profile: кеш Django -> основная база; None, если пользователя нет."""
+    key = USER_CACHE_KEY.format(user_id)
+    user = cache.get(key)
+    if user is None:
+        # из основной базы: сразу после смены пароля реплика может отдать старый хеш, а он осел бы в кеше
+        user = User.objects.using(router.db_for_write(User)).select_related('profile').filter(pk=user_id).first()
+        if user is not None:
+            cache.set(key, user, settings.USER_CACHE_SECONDS)
+    return user
+
+
+def invalidate_user(user_id):
+    """Сбросить пользователя в кеше — после коммита текущей транзакции."""
+    transaction.on_commit(lambda: cache.delete(USER_CACHE_KEY.format(user_id)))
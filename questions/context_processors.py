@@ -0,0 +1,7 @@
+from questions.liked import liked_loader
+
+
+def liked(request):
+    """liked_questions / liked_answers: лайки текущего пользователя среди объектов страницы."""
+    loader = liked_loader(request)
+    return {'liked_questions': loader.sets['question'], 'liked_answers': loader.sets['answer']}
@@ -1,7 +1,24 @@
 from django import forms
+from django.db import transaction
+from django.db.models import F
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from questions.models import Profile, Question, Answer, Tag
+from questions.models import Profile, Question, Answer, Tag, HOT_ANSWER_WEIGHT
+from questions import live
+from questions.page_cache import purge_surrogate_keys
+from questions.services import attach_tags
+from questions.avatars import schedule_thumbnails
+
+
+def clean_tag_names(names):
+    """Имена тегов без пробелов по краям и повторов, в исходном порядке."""
+    names = [name.strip() for name in names if name.strip()]
+    max_length = Tag._meta.get_field('name').max_length
+    if any(len(name) > max_length for name in names):
+        raise forms.ValidationError(f"Тег должен быть не длиннее {max_length} символов")
+    if any(',' in name for name in names):
+        raise forms.ValidationError("Тег не может содержать запятую")
+    return list(dict.fromkeys(names))
 
 
 class LoginForm(forms.Form):
@@ -38,6 +55,7 @@ class SignUpForm(UserCreationForm):
             if avatar:
                 profile.avatar = avatar
             profile.save()
+            schedule_thumbnails(profile)
         return user
 
 
@@ -60,6 +78,17 @@ class ProfileForm(forms.ModelForm):
             'avatar': forms.ClearableFileInput(attrs={'class': 'form-control'})
         }
 
+    def save(self, commit=True):
+        profile = super().save(commit=False)
+        if 'avatar' in self.changed_data:
+            # старые миниатюры относятся к прежнему файлу
+            profile.avatar_hash = ''
+        if commit:
+            profile.save()
+            if 'avatar' in self.changed_data:
+                schedule_thumbnails(profile)
+        return profile
+
 
 class QuestionForm(forms.ModelForm):
     tags = forms.CharField(
@@ -91,6 +120,9 @@ class QuestionForm(forms.ModelForm):
             raise forms.ValidationError("Текст должен содержать не менее 20 символов")
         return text
 
+    def clean_tags(self):
+        return clean_tag_names(self.cleaned_data.get('tags', '').split(','))
+
     def save(self, commit=True):
         question = super().save(commit=False)
         if self.user:
@@ -98,17 +130,15 @@ class QuestionForm(forms.ModelForm):
             question.user = profile
 
         if commit:
-            question.save()
-            self._save_tags(question)
+            with transaction.atomic():
+                question.save()
+                self._save_tags(question)
+                purge_surrogate_keys('feed:new', 'feed:hot')
         return question
 
     def _save_tags(self, question):
-        tags_input = self.cleaned_data.get('tags', '')
-        if tags_input:
-            tag_names = [name.strip() for name in tags_input.split(',') if name.strip()]
-            for tag_name in tag_names:
-                tag, created = Tag.objects.get_or_create(name=tag_name)
-                question.tags.add(tag)
+        # тот же пакетный путь, что и у create_questions: upsert тегов + одна вставка связей
+        attach_tags({question.id: self.cleaned_data.get('tags', [])})
 
 
 class AnswerForm(forms.ModelForm):
@@ -138,5 +168,10 @@ class AnswerForm(forms.ModelForm):
             answer.question = self.question
 
         if commit:
-            answer.save()
-        return answer
\ No newline at end of file
+            with transaction.atomic():
+                answer.save()
+                Question.objects.filter(id=answer.question_id).update(answers_count=F('answers_count') + 1)
+                Question.objects.bump_hot_score(answer.question_id, HOT_ANSWER_WEIGHT)
+                purge_surrogate_keys(f'question:{answer.question_id}')
+                live.publish(answer.question_id, 'answer', id=answer.id)
+        return answer
@@ -0,0 +1,445 @@
+"""
+Отложенная запись лайков (LIKES_WRITE_BEHIND=1).
+
+Клик не трогает таблицы лайков: переключение дописывается в буфер, а фоновый
+поток раз в LIKES_FLUSH_MS схлопывает накопленное по парам (пользователь, цель)
+— важно только последнее состояние — и применяет одной вставкой, одним удалением
+и одним UPDATE счётчиков на модель. Горячий вопрос получает одну транзакцию
+на пачку кликов вместо транзакции на каждый.
+
+Пока запись не применена, буфер помнит состояние пары (чтобы следующий клик
+переключал правильно) и сумму изменений по цели — её прибавляют к likes_count
+ответ на клик, страница вопроса и ленты.
+
+LIKES_BUFFER:
+  questions.like_buffer.LocalBuffer — в памяти процесса, у каждого воркера свой;
+  questions.like_buffer.CacheBuffer — журнал в общем кеше (Redis): все процессы
+  видят ожидающие лайки, применяет их тот, кто первым взял блокировку.
+"""
+import atexit
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from questions.models import Answer, AnswerLike, HOT_LIKE_WEIGHT, Question, QuestionLike, decayed_weight
+from questions.page_cache import purge_surrogate_keys
+
+logger = logging.getLogger(__name__)
+
+# вид цели -> (модель лайка, модель цели, поле цели в лайке, поле цели с id вопроса, вес в hot_score)
+KINDS = {
+    'question': (QuestionLike, Question, 'question', 'id', HOT_LIKE_WEIGHT),
+    'answer': (AnswerLike, Answer, 'answer', 'question', None),
+}
+
+# attempts — сколько раз пачка с этой операцией уже не записалась
+Op = namedtuple('Op', 'seq kind user target liked created attempts', defaults=(0,))
+# после стольких неудачных записей пачка выбрасывается (в лог), а не блокирует все следующие
+FLUSH_ATTEMPTS = 5
+
+# счётчик цели, есть ли лайк пользователя и id вопроса — одним запросом без ORM: это путь каждого клика
+STATE_SQL = """
+SELECT likes_count, EXISTS (SELECT 1 FROM {like_table} WHERE user_id = %s AND {target_column} = %s), {question_column}
+FROM {target_table} WHERE id = %s
+"""
+
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _log_dropped(ops, reason):
+    for op in ops:
+        logger.error('like op %s dropped (%s): %s %s by %s -> %s', op.seq, reason, op.kind, op.target, op.user, op.liked)
+
+
+class LocalBuffer:
+    PAIR_LOCKS = 64
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # блокировки пар пользователь-цель (по хешу пары): чтение базы в toggle не держит общий self.lock
+        self.pair_locks = [threading.Lock() for _ in range(self.PAIR_LOCKS)]
+        self.seq = 0
+        self.ops = []
+        # (вид, пользователь, цель) -> (liked, seq последнего клика), пока он не записан в базу
+        self.states = {}
+        # (вид, цель) -> изменение likes_count, ещё не записанное в базу
+        self.deltas = Counter()
+
+    def toggle(self, kind, user, target, read_liked):
+        """
+        Переключает лайк относительно ожидающих кликов, а без них — относительно базы (read_liked()
+        вызывается под блокировкой пары); возвращает (liked, ожидающее изменение цели).
+        """
+        key = (kind, user, target)
+        with self.pair_locks[hash(key) % self.PAIR_LOCKS]:
+            with self.lock:
+                pending = self.states.get(key)
+            db_liked = read_liked() if pending is None else None
+            with self.lock:
+                liked = not (db_liked if pending is None else pending[0])
+                self.seq += 1
+                self.ops.append(Op(self.seq, kind, user, target, liked, time.time()))
+                self.states[key] = (liked, self.seq)
+                self.deltas[(kind, target)] += 1 if liked else -1
+                return liked, self.deltas[(kind, target)]
+
+    def pending_deltas(self, kind, targets):
+        with self.lock:
+            return {target: self.deltas[(kind, target)] for target in targets if (kind, target) in self.deltas}
+
+    def pending_states(self, kind, user, targets):
+        with self.lock:
+            return {target: self.states[(kind, user, target)][0]
+                    for target in targets if (kind, user, target) in self.states}
+
+    def take(self, limit):
+        with self.lock:
+            ops = self.ops[:limit]
+            del self.ops[:limit]
+        return ops, None
+
+    def done(self, ops, token):
+        with self.lock:
+            for op in ops:
+                key = (op.kind, op.target)
+                self.deltas[key] -= 1 if op.liked else -1
+                if not self.deltas[key]:
+                    del self.deltas[key]
+                # состояние пары больше не нужно, если после этого клика не было новых
+                if self.states.get((op.kind, op.user, op.target), (None, None))[1] == op.seq:
+                    del self.states[(op.kind, op.user, op.target)]
+
+    def failed(self, ops, token):
+        retry = [op._replace(attempts=op.attempts + 1) for op in ops if op.attempts + 1 < FLUSH_ATTEMPTS]
+        dropped = [op for op in ops if op.attempts + 1 >= FLUSH_ATTEMPTS]
+        with self.lock:
+            self.ops[:0] = retry
+        if dropped:
+            _log_dropped(dropped, f'{FLUSH_ATTEMPTS} failed flushes')
+            # как записанные: иначе их состояние и счётчик остались бы в буфере навсегда
+            self.done(dropped, token)
+
+
+class CacheBuffer:
+    """
+    Журнал в кеше: номер операции — cache.incr('likes:seq'), сама операция —
+    ключ likes:op:<номер> без срока: его удаляет только запись в базу. Клик читает и пишет
+    состояние пары под блокировкой cache.add(likes:lock:…). Нужен кеш с атомарными add
+    и incr/decr и отрицательными значениями (Redis; LocMemCache — для одного процесса и тестов).
+    """
+    PREFIX = 'likes'
+    # состояние пары и изменение счётчика цели; каждый клик продлевает срок, он много больше LOCK_TIMEOUT
+    STATE_TIMEOUT = 24 * 60 * 60
+    LOCK_TIMEOUT = 30
+    # блокировка пары пользователь-цель на время переключения; у упавшего процесса истекает сама
+    PAIR_LOCK_TIMEOUT = 5
+    PAIR_LOCK_POLL = 0.005
+    # операция, номер которой выдан, но ключ так и не появился (процесс упал), пропускается через
+    MISSING_GRACE = 5
+
+    def __init__(self):
+        self.missing_since = {}
+
+    def key(self, *parts):
+        return ':'.join((self.PREFIX, *map(str, parts)))
+
+    def toggle(self, kind, user, target, read_liked):
+        state_key, delta_key = self.key('state', kind, user, target), self.key('delta', kind, target)
+        # чтение и запись состояния пары — под блокировкой: два почти одновременных клика
+        # из разных процессов иначе оба увидят «не лайкнуто» и оба запишут «лайкнуто»
+        lock_key = self.key('lock', kind, user, target)
+        while not cache.add(lock_key, 1, self.PAIR_LOCK_TIMEOUT):
+            time.sleep(self.PAIR_LOCK_POLL)
+        try:
+            pending = cache.get(state_key)
+            liked = not (read_liked() if pending is None else pending)
+            cache.add(self.key('seq'), 0, None)
+            seq = cache.incr(self.key('seq'))
+            cache.set(self.key('op', seq), Op(seq, kind, user, target, liked, time.time()), None)
+            cache.set(state_key, liked, self.STATE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        cache.add(delta_key, 0, self.STATE_TIMEOUT)
+        delta = cache.incr(delta_key, 1 if liked else -1)
+        cache.touch(delta_key, self.STATE_TIMEOUT)
+        return liked, delta
+
+    def pending_deltas(self, kind, targets):
+        keys = {self.key('delta', kind, target): target for target in targets}
+        return {keys[key]: delta for key, delta in cache.get_many(keys).items() if delta}
+
+    def pending_states(self, kind, user, targets):
+        keys = {self.key('state', kind, user, target): target for target in targets}
+        return {keys[key]: liked for key, liked in cache.get_many(keys).items()}
+
+    def take(self, limit):
+        if not cache.add(self.key('flush-lock'), 1, self.LOCK_TIMEOUT):
+            return [], None
+        start = cache.get(self.key('flushed'), 0) + 1
+        end = min(cache.get(self.key('seq'), 0), start + limit - 1)
+        found = cache.get_many([self.key('op', seq) for seq in range(start, end + 1)])
+        ops, cursor = [], start - 1
+        for seq in range(start, end + 1):
+            op = found.get(self.key('op', seq))
+            if op is None:
+                # номер уже выдан, а операцию ещё пишут: ждём, чтобы не нарушить порядок
+                first_seen = self.missing_since.setdefault(seq, time.monotonic())
+                if time.monotonic() - first_seen < self.MISSING_GRACE:
+                    break
+                logger.error('like op %s never reached the cache, skipped', seq)
+            else:
+                ops.append(op)
+            self.missing_since.pop(seq, None)
+            cursor = seq
+        if not ops:
+            # применять нечего; пропущенные номера всё равно остаются позади
+            if cursor >= start:
+                cache.set(self.key('flushed'), cursor, None)
+            cache.delete(self.key('flush-lock'))
+            return [], None
+        return ops, cursor
+
+    def done(self, ops, cursor):
+        deltas = Counter()
+        for op in ops:
+            deltas[(op.kind, op.target)] += 1 if op.liked else -1
+        for (kind, target), delta in deltas.items():
+            if not delta:
+                continue
+            try:
+                cache.incr(self.key('delta', kind, target), -delta)
+            except ValueError:
+                # ключ истёк (STATE_TIMEOUT без кликов): лайки записаны, но страницы до записи их не учитывали
+                logger.warning('pending like delta %s %s expired before flush (%+d)', kind, target, delta)
+        cache.set(self.key('flushed'), cursor, None)
+        cache.delete_many([self.key('op', op.seq) for op in ops] + [self.key('attempts', ops[0].seq)])
+        cache.delete(self.key('flush-lock'))
+
+    def failed(self, ops, cursor):
+        # следующая попытка возьмёт ту же пачку с того же номера: считаем попытки по её первой операции
+        attempts_key = self.key('attempts', ops[0].seq)
+        cache.add(attempts_key, 0, None)
+        if cache.incr(attempts_key) >= FLUSH_ATTEMPTS:
+            _log_dropped(ops, f'{FLUSH_ATTEMPTS} failed flushes')
+            self.done(ops, cursor)
+        else:
+            cache.delete(self.key('flush-lock'))
+
+
+@lru_cache(maxsize=None)
+def get_buffer():
+    return import_string(settings.LIKES_BUFFER)()
+
+
+def toggle(kind, profile_id, target_id):
+    """Лайк через буфер: (liked, likes_count с учётом ожидающих кликов, id вопроса)."""
+    like_model, target_model, target_field, question_field, _ = KINDS[kind]
+    sql = STATE_SQL.format(
+        like_table=like_model._meta.db_table,
+        target_column=like_model._meta.get_field(target_field).column,
+        target_table=target_model._meta.db_table,
+        question_column=target_model._meta.get_field(question_field).column,
+    )
+    row = None
+
+    def read_liked():
+        nonlocal row
+        # из основной базы: реплика может ещё не знать о прошлых записях из буфера
+        with connections[router.db_for_write(target_model)].cursor() as cursor:
+            cursor.execute(sql, [profile_id, target_id, target_id])
+            row = cursor.fetchone()
+        if row is None:
+            raise target_model.DoesNotExist
+        return bool(row[1])
+
+    # базу буфер читает под блокировкой пары и только если у пары нет ожидающих кликов: прочитанное
+    # до блокировки могло устареть — пачка с кликом пары успела записаться, и клик повторил бы его
+    liked, pending = get_buffer().toggle(kind, profile_id, target_id, read_liked)
+    if row is None:
+        read_liked()
+    likes_count, _, question_id = row
+    flusher.start_once()
+    return liked, likes_count + pending, question_id
+
+
+def merge_pending(kind, objects):
+    """Прибавляет к likes_count объектов клики, которые ещё лежат в буфере."""
+    if not settings.LIKES_WRITE_BEHIND:
+        return
+    objects = list(objects)
+    deltas = get_buffer().pending_deltas(kind, [obj.id for obj in objects])
+    for obj in objects:
+        obj.likes_count += deltas.get(obj.id, 0)
+
+
+def pending_states(kind, profile_id, targets):
+    """{id цели: liked} для кликов пользователя, которые ещё лежат в буфере."""
+    return get_buffer().pending_states(kind, profile_id, targets)
+
+
+def apply(ops):
+    """Записывает последнее состояние каждой пары; возвращает [(вид, id цели)] с изменённым счётчиком."""
+    final = {}
+    for op in ops:
+        final[(op.kind, op.user, op.target)] = op.liked
+
+    changed = []
+    for kind, (like_model, target_model, target_field, _, hot_weight) in KINDS.items():
+        pairs = {(user, target): liked for (k, user, target), liked in final.items() if k == kind}
+        if not pairs:
+            continue
+        target_column = f'{target_field}_id'
+        targets = sorted({target for _, target in pairs})
+        with transaction.atomic(using=router.db_for_write(target_model)):
+            # строки целей блокируются по возрастанию id: параллельные сбросы не взаимоблокируются
+            created = dict(target_model.objects.select_for_update().filter(id__in=targets).order_by('id')
+                           .values_list('id', 'created_at'))
+            # цель или пользователь удалены, пока клик ждал в буфере: вставка нарушила бы внешний ключ
+            # и роняла бы каждую следующую пачку, а снимать уже нечего — лайки удалены каскадом
+            user_model = like_model._meta.get_field('user').related_model
+            users = set(user_model.objects.filter(id__in={user for user, _ in pairs}).values_list('id', flat=True))
+            gone = {(user, target) for user, target in pairs if target not in created or user not in users}
+            if gone:
+                logger.warning('likes for deleted %ss or users dropped: %s', kind, sorted(gone)[:10])
+                pairs = {pair: liked for pair, liked in pairs.items() if pair not in gone}
+                targets = [target for target in targets if target in created]
+            liked_at = {}
+            existing = {}
+            for like_id, user, target, *timed in like_model.objects.filter(**{
+                f'{target_column}__in': targets, 'user_id__in': users,
+            }).values_list('id', 'user_id', target_column, *(['created_at'] if hot_weight else [])):
+                existing[(user, target)] = like_id
+                liked_at[(user, target)] = timed[0] if timed else None
+            inserts = [pair for pair, liked in pairs.items() if liked and pair not in existing]
+            removals = [pair for pair, liked in pairs.items() if not liked and pair in existing]
+            like_model.objects.bulk_create(
+                [like_model(user_id=user, **{target_column: target}) for user, target in inserts],
+                ignore_conflicts=True,
+            )
+            like_model.objects.filter(id__in=[existing[pair] for pair in removals]).delete()
+
+            deltas = Counter(target for _, target in inserts)
+            deltas.subtract(target for _, target in removals)
+            deltas = {target: delta for target, delta in deltas.items() if delta}
+            # hot_score: новый лайк — полный вес, снятый — его погашенный вес (как в services._toggle)
+            hot_deltas = Counter()
+            if hot_weight:
+                now = timezone.now()
+                for user, target in inserts:
+                    hot_deltas[target] += hot_weight
+                for pair in removals:
+                    hot_deltas[pair[1]] -= decayed_weight(hot_weight, liked_at[pair] or created[pair[1]], now)
+                hot_deltas = {target: delta for target, delta in hot_deltas.items() if delta}
+            if deltas or hot_deltas:
+                changes = {}
+                if deltas:
+                    delta = Case(*(When(id=target, then=Value(value)) for target, value in deltas.items()), default=0)
+                    changes['likes_count'] = F('likes_count') + delta
+                if hot_deltas:
+                    hot_delta = Case(*(When(id=target, then=Value(value)) for target, value in hot_deltas.items()),
+                                     default=Value(0.0))
+                    changes['hot_score'] = Greatest(F('hot_score') + hot_delta, 0.0)
+                target_model.objects.filter(id__in={*deltas, *hot_deltas}).update(**changes)
+        changed += [(kind, target) for target in deltas]
+    return changed
+
+
+_stats_lock = threading.Lock()
+_stats = {'flushes': 0, 'ops': 0, 'rows': 0, 'errors': 0}
+# [счётчики корзин..., +Inf, сумма] для размера пачки и задержки записи
+_batch_series = [0] * (len(BATCH_BUCKETS) + 2)
+_lag_series = [0] * (len(LAG_BUCKETS) + 2)
+
+
+def _observe(series, buckets, value):
+    series[bisect_left(buckets, value)] += 1
+    series[-1] += value
+
+
+def flush_stats():
+    with _stats_lock:
+        return {**_stats, 'batch': list(_batch_series), 'lag': list(_lag_series)}
+
+
+def flush(limit=None):
+    """Применяет одну пачку из буфера; возвращает число операций в ней."""
+    buffer = get_buffer()
+    ops, token = buffer.take(limit or settings.LIKES_FLUSH_BATCH)
+    if not ops:
+        return 0
+    try:
+        changed = apply(ops)
+    except Exception:
+        buffer.failed(ops, token)
+        with _stats_lock:
+            _stats['errors'] += 1
+        raise
+    buffer.done(ops, token)
+    purge_surrogate_keys(*(f'{kind}:{target}' for kind, target in changed))
+
+    lag = time.time() - min(op.created for op in ops)
+    with _stats_lock:
+        _stats['flushes'] += 1
+        _stats['ops'] += len(ops)
+        _stats['rows'] += len({(op.kind, op.user, op.target) for op in ops})
+        _observe(_batch_series, BATCH_BUCKETS, len(ops))
+        _observe(_lag_series, LAG_BUCKETS, lag)
+    return len(ops)
+
+
+def flush_all():
+    """Записывает всё, что есть в буфере, включая клики, пришедшие во время записи."""
+    total = 0
+    while batch := flush():
+        total += batch
+    return total
+
+
+class Flusher:
+    """Фоновый поток процесса: flush_all() раз в LIKES_FLUSH_MS (0 — только вручную, flush_likes)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start_once(self):
+        if self.thread is not None or not settings.LIKES_FLUSH_MS:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='like-flusher', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush_quietly)
+
+    def run(self):
+        while True:
+            time.sleep(settings.LIKES_FLUSH_MS / 1000)
+            self.flush_quietly(drain=False)
+
+    def flush_quietly(self, drain=True):
+        try:
+            if drain:
+                flush_all()
+            else:
+                # клики, пришедшие во время записи, ждут следующего такта; сразу — только если буфер не влез в пачку
+                while flush() == settings.LIKES_FLUSH_BATCH:
+                    pass
+        except Exception:
+            logger.exception('like buffer flush failed')
+        finally:
+            # как в конце запроса: с пулом соединение возвращается в пул, сломанное закрывается
+            close_old_connections()
+
+
+flusher = Flusher()
@@ -0,0 +1,141 @@
+"""
+Что из показанного на странице пользователь уже лайкнул.
+
+Лента и страница вопроса регистрируют свои объекты в загрузчике запроса
+(liked_loader(request).add(...)), шаблон спрашивает `q.id in liked_questions`.
+При первой проверке загрузчик одним get_many берёт из кеша известные состояния
+пользователя и одним запросом на вид дочитывает из базы недостающие id страницы;
+повторный показ тех же вопросов не стоит запросов. При LIKES_WRITE_BEHIND поверх
+базы кладутся ещё не записанные клики из буфера, и в кеш попадает уже итоговое
+состояние — после записи пачки оно совпадает с базой.
+
+Состояния лежат под версией пользователя; клик (invalidate_liked) увеличивает
+её атомарным incr, так что загрузка, прочитавшая базу до клика, пишет в старую
+версию, которую уже никто не прочитает. Версия общая для процессов только при
+общем кеше (Redis): с LocMemCache другие процессы видят клик через LIKED_CACHE_TIMEOUT.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from questions import like_buffer
+from questions.models import AnswerLike, Profile, QuestionLike
+
+# вид цели -> (модель лайка, колонка цели)
+LIKE_MODELS = {
+    'question': (QuestionLike, 'question_id'),
+    'answer': (AnswerLike, 'answer_id'),
+}
+LIKED_CACHE_TIMEOUT = 10 * 60
+# сколько последних состояний на вид хранится для пользователя
+LIKED_CACHE_SIZE = 1000
+
+
+def _version_key(profile_id):
+    return f'questions:liked:version:{profile_id}'
+
+
+def _cache_key(kind, profile_id, version):
+    return f'questions:liked:{kind}:{profile_id}:{version}'
+
+
+def _version(profile_id):
+    key = _version_key(profile_id)
+    version = cache.get(key)
+    if version is None:
+        # ключа ещё нет или его вытеснили: новое значение не совпадёт ни с одной прежней версией
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _trimmed(states):
+    if len(states) <= LIKED_CACHE_SIZE:
+        return states
+    return dict(list(states.items())[-LIKED_CACHE_SIZE:])
+
+
+def invalidate_liked(profile_id):
+    """Клик пользователя: закешированные состояния его лайков больше не годятся."""
+    try:
+        cache.incr(_version_key(profile_id))
+    except ValueError:
+        # версии нет — загрузка, которая её создаст, прочитает базу уже после клика
+        pass
+
+
+class LikedSet:
+    """`id in liked_questions` в шаблоне; загрузка — при первой проверке."""
+
+    def __init__(self, loader, kind):
+        self.loader = loader
+        self.kind = kind
+
+    def __contains__(self, target_id):
+        self.loader.resolve()
+        return target_id in self.loader.liked[self.kind]
+
+
+class LikedLoader:
+    def __init__(self, user):
+        self.user = user
+        self.wanted = {kind: set() for kind in LIKE_MODELS}
+        self.liked = {kind: set() for kind in LIKE_MODELS}
+        self.checked = {kind: set() for kind in LIKE_MODELS}
+        self.sets = {kind: LikedSet(self, kind) for kind in LIKE_MODELS}
+
+    def add(self, kind, objects):
+        self.wanted[kind].update(obj.id for obj in objects)
+
+    def profile_id(self):
+        if not self.user.is_authenticated:
+            return None
+        try:
+            return self.user.profile.id
+        except Profile.DoesNotExist:
+            return None
+
+    def resolve(self):
+        pending = {kind: ids - self.checked[kind] for kind, ids in self.wanted.items()}
+        pending = {kind: ids for kind, ids in pending.items() if ids}
+        if not pending:
+            return
+        for kind, ids in pending.items():
+            self.checked[kind] |= ids
+        profile_id = self.profile_id()
+        if profile_id is None:
+            return
+
+        version = _version(profile_id)
+        keys = {kind: _cache_key(kind, profile_id, version) for kind in pending}
+        cached = cache.get_many(keys.values())
+        updates = {}
+        for kind, ids in pending.items():
+            states = cached.get(keys[kind], {})
+            missing = ids - states.keys()
+            changed = bool(missing)
+            if missing:
+                like_model, column = LIKE_MODELS[kind]
+                found = set(like_model.objects.filter(
+                    user_id=profile_id, **{f'{column}__in': missing},
+                ).values_list(column, flat=True))
+                states.update((target_id, target_id in found) for target_id in missing)
+            if settings.LIKES_WRITE_BEHIND:
+                # незаписанные клики кешируются вместе с базой: после записи пачки буфер их забудет
+                overlay = like_buffer.pending_states(kind, profile_id, ids)
+                if any(states[target_id] != liked for target_id, liked in overlay.items()):
+                    changed = True
+                    states.update(overlay)
+            if changed:
+                updates[keys[kind]] = _trimmed(states)
+            self.liked[kind].update(target_id for target_id in ids if states[target_id])
+        if updates:
+            cache.set_many(updates, LIKED_CACHE_TIMEOUT)
+
+
+def liked_loader(request):
+    """Загрузчик лайков текущего запроса (один на запрос)."""
+    loader = getattr(request, '_liked_loader', None)
+    if loader is None:
+        loader = request._liked_loader = LikedLoader(request.user)
+    return loader
@@ -0,0 +1,189 @@
+"""
+Живые обновления страницы вопроса по SSE: новые ответы и счётчики лайков.
+
+Поток /question/<id>/events/ обслуживает asgi_router (project/asgi.py) в обход
+Django: без middleware и без потока на соединение, только корутина и очередь,
+поэтому процесс uvicorn держит тысячи простаивающих подписчиков.
+
+Внутри процесса события раздаёт Hub: у каждого вопроса — множество очередей
+подписчиков, одно событие кладётся во все сразу. Между процессами события
+передаёт бэкенд (LIVE_EVENTS_BACKEND):
+  LocalBackend    — только свой процесс (runserver, один воркер);
+  PostgresBackend — LISTEN/NOTIFY, каждый процесс слушает канал одним соединением.
+"""
+import asyncio
+import json
+import logging
+import re
+from collections import defaultdict
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH_RE = re.compile(r'^/question/(?P<question_id>\d+)/events/$')
+# медленный клиент не копит события бесконечно: лишние отбрасываются
+QUEUE_SIZE = 100
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # nginx не должен буферизовать поток
+    (b'x-accel-buffering', b'no'),
+]
+
+
+class Hub:
+    """Подписчики этого процесса по вопросам."""
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.loop = None
+        self.listener_task = None
+
+    def subscribe(self, question_id):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # одна подписка на бэкенд на процесс (на цикл событий)
+            self.loop = loop
+            self.listener_task = loop.create_task(get_backend().listen(self.deliver))
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.listeners[question_id].add(queue)
+        return queue
+
+    def unsubscribe(self, question_id, queue):
+        queues = self.listeners.get(question_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.listeners[question_id]
+
+    def deliver(self, question_id, event):
+        """Раздаёт событие подписчикам вопроса; вызывается в цикле событий."""
+        for queue in self.listeners.get(question_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    def deliver_threadsafe(self, question_id, event):
+        # публикуют из потоков синхронного кода; подписчиков в процессе нет — делать нечего
+        if self.loop is not None and not self.loop.is_closed() and question_id in self.listeners:
+            self.loop.call_soon_threadsafe(self.deliver, question_id, event)
+
+    def connections(self):
+        return sum(len(queues) for queues in self.listeners.values())
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    def publish(self, question_id, event):
+        hub.deliver_threadsafe(question_id, event)
+
+    async def listen(self, deliver):
+        """Событий из других процессов нет."""
+
+
+class PostgresBackend:
+    CHANNEL = 'question_events'
+
+    def publish(self, question_id, event):
+        # NOTIFY получат все процессы, включая этот, — локально не раздаём
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, json.dumps([question_id, event])])
+
+    async def listen(self, deliver):
+        import psycopg
+
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        params = {
+            'dbname': database['NAME'], 'user': database['USER'], 'password': database['PASSWORD'],
+            'host': database['HOST'], 'port': database['PORT'],
+        }
+        delay = 1
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(autocommit=True, **params) as connection:
+                    await connection.execute(f'LISTEN {self.CHANNEL}')
+                    delay = 1
+                    async for notify in connection.notifies():
+                        question_id, event = json.loads(notify.payload)
+                        deliver(question_id, event)
+            except Exception:
+                logger.warning('LISTEN %s failed, reconnecting in %s s', self.CHANNEL, delay, exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.LIVE_EVENTS_BACKEND)()
+
+
+def publish(question_id, event_type, **data):
+    """Событие для страницы вопроса; уходит подписчикам после коммита транзакции."""
+    event = {'type': event_type, **data}
+    transaction.on_commit(partial(get_backend().publish, question_id, event))
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+async def event_stream(question_id):
+    """Байты SSE-потока вопроса; пустой комментарий раз в LIVE_KEEPALIVE_SECONDS держит соединение."""
+    queue = hub.subscribe(question_id)
+    try:
+        # после обрыва браузер переподключится через 5 секунд
+        yield b'retry: 5000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), settings.LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+            else:
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(question_id, queue)
+
+
+async def sse_application(scope, receive, send, question_id):
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    task = asyncio.current_task()
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        task.cancel()
+
+    watcher = asyncio.create_task(wait_for_disconnect())
+    stream = event_stream(question_id)
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+        async for chunk in stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    except (asyncio.CancelledError, OSError):
+        # клиент ушёл
+        pass
+    finally:
+        watcher.cancel()
+        await stream.aclose()
+
+
+def asgi_router(django_application):
+    """ASGI-приложение: SSE-потоки вопросов обслуживаются здесь, всё остальное — Django."""
+    async def application(scope, receive, send):
+        if scope['type'] == 'http':
+            match = EVENTS_PATH_RE.match(scope['path'])
+            if match:
+                return await sse_application(scope, receive, send, int(match['question_id']))
+        return await django_application(scope, receive, send)
+    return application
@@ -0,0 +1,233 @@
+import json
+import math
+import statistics
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import urlencode
+from questions.middleware import QueryTimer
+from questions.urls import urlpatterns
+from questions.models import Profile, Question, Tag
+from questions.pagination import encode_cursor
+from questions.views import FEED_ORDERING, HOT_ORDERING, ANSWERS_ORDERING
+
+# POST-маршруты меняют данные, поэтому в замер не входят; /metrics и SSE-поток — не страницы сайта
+SKIPPED_ROUTES = {
+    'logout', 'like_question', 'like_answer', 'like_question_json', 'like_answer_json', 'metrics',
+    'bulk_questions_json', 'question_events',
+}
+ANONYMOUS_ONLY = {'login', 'signup'}
+LOGGED_IN_ONLY = {'ask', 'settings'}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def connection_mode(database):
+    if database.get('OPTIONS', {}).get('pool'):
+        return 'pool'
+    return f"persistent (CONN_MAX_AGE={database['CONN_MAX_AGE']})" if database.get('CONN_MAX_AGE') else 'off'
+
+
+def cursor_at(queryset, ordering, position):
+    """?after= для страницы, которая начинается сразу после строки position."""
+    if position < 0:
+        return None
+    fields = [name.lstrip('-') for name in ordering]
+    rows = queryset.select_related(None).prefetch_related(None).order_by(*ordering).only(*fields)
+    obj = next(iter(rows[position:position + 1]), None)
+    return encode_cursor(obj, ordering) if obj else None
+
+
+def page_urls(name, url, queryset, ordering, per_page):
+    """Первая, средняя и последняя страница ленты."""
+    total = queryset.count()
+    urls = [(f'{name} [first]', url)]
+    for label, position in (('middle', total // 2 - 1), ('last', total - per_page - 1)):
+        token = cursor_at(queryset, ordering, position)
+        if token:
+            separator = '&' if '?' in url else '?'
+            urls.append((f'{name} [{label}]', f'{url}{separator}after={token}'))
+    return urls
+
+
+def server_timing(response, name):
+    """Длительность метрики из заголовка Server-Timing (PerformanceMiddleware), иначе 0."""
+    for entry in response.get('Server-Timing', '').split(','):
+        metric, *params = entry.strip().split(';')
+        if metric == name:
+            for param in params:
+                if param.startswith('dur='):
+                    return float(param[4:])
+    return 0.0
+
+
+class Command(BaseCommand):
+    help = 'Задержка, число SQL-запросов, время в БД и размер ответа для каждой страницы сайта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, metavar='RATIO', help='Сначала заполнить БД через fill_db RATIO')
+        parser.add_argument('--iterations', type=int, default=20, help='Запросов на каждый сценарий')
+        parser.add_argument('--warmup', type=int, default=2, help='Запросов на прогрев (не учитываются)')
+        parser.add_argument('--only', help='Только сценарии, в названии которых есть эта строка')
+        parser.add_argument('--json', metavar='FILE', help="Сохранить результаты в JSON ('-' — в stdout)")
+        parser.add_argument('--compare', metavar='FILE', help='JSON прошлого запуска для сравнения')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            call_command('fill_db', options['seed'], stdout=self.stdout)
+
+        profile = Profile.objects.select_related('user').order_by('id').first()
+        if profile is None or not Question.objects.exists():
+            raise CommandError('Нет данных: выполните fill_db или передайте --seed')
+
+        # при DEBUG=False Django принимает только хосты из ALLOWED_HOSTS
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        anonymous = Client(SERVER_NAME=host)
+        logged_in = Client(SERVER_NAME=host)
+        logged_in.force_login(profile.user)
+
+        results = []
+        for name, url, route in self.scenarios():
+            if options['only'] and options['only'] not in name:
+                continue
+            clients = [('anon', anonymous), ('user', logged_in)]
+            if route in ANONYMOUS_ONLY:
+                clients = clients[:1]
+            elif route in LOGGED_IN_ONLY:
+                clients = clients[1:]
+            for user, client in clients:
+                results.append(self.measure(client, name, user, url, options['iterations'], options['warmup']))
+
+        baseline = self.load_baseline(options['compare'])
+        self.print_table(results, baseline)
+
+        report = {
+            'database': connections['default'].vendor,
+            'questions': Question.objects.count(),
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        if options['json'] == '-':
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        elif options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты сохранены в {options['json']}")
+
+    def scenarios(self):
+        """(название, url, имя маршрута) для всех GET-страниц из questions/urls.py."""
+        scenarios = []
+        for name, url in page_urls('new', reverse('questions:new_questions'), Question.objects.new(),
+                                   FEED_ORDERING, 10):
+            scenarios.append((name, url, 'new_questions'))
+        for name, url in page_urls('hot', reverse('questions:hot_questions'), Question.objects.hot(),
+                                   HOT_ORDERING, 3):
+            scenarios.append((name, url, 'hot_questions'))
+
+        tags = Tag.objects.annotate(num_questions=Count('question')).order_by('-num_questions')
+        popular, rare = tags.first(), tags.filter(num_questions__gt=0).last()
+        for label, tag in (('popular', popular), ('rare', rare)):
+            if tag is None:
+                continue
+            for name, url in page_urls(f'tag {label}', reverse('questions:tag', args=[tag.name]),
+                                       Question.objects.by_tag(tag.name), FEED_ORDERING, 10):
+                scenarios.append((name, url, 'tag'))
+
+        busiest = Question.objects.order_by('-answers_count', 'id').first()
+        typical = Question.objects.order_by('id')[Question.objects.count() // 2]
+        for label, question in (('most answers', busiest), ('typical', typical)):
+            for name, url in page_urls(f'question {label}', reverse('questions:question', args=[question.id]),
+                                       question.answer_set.all(), ANSWERS_ORDERING, 5):
+                scenarios.append((name, url, 'question'))
+
+        if popular is not None:
+            prefix = urlencode({'prefix': popular.name[:2]})
+            scenarios.append(('tag suggest', f"{reverse('questions:tag_suggest')}?{prefix}", 'tag_suggest'))
+
+        word = busiest.title.split()[-1].strip('?.,!')
+        scenarios.append(('search', f"{reverse('questions:search')}?{urlencode({'q': word})}", 'search'))
+        for route in ('ask', 'settings', 'login', 'signup'):
+            scenarios.append((route, reverse(f'questions:{route}'), route))
+
+        missing = {p.name for p in urlpatterns} - SKIPPED_ROUTES - {route for _, _, route in scenarios}
+        if missing:
+            self.stderr.write(f"Маршруты без сценария: {', '.join(sorted(missing))}")
+        return scenarios
+
+    def request(self, client, url):
+        response = client.get(url)
+        # тестовый Client не закрывает соединения в конце запроса, как WSGIHandler;
+        # закрываем сами, чтобы замер учитывал CONN_MAX_AGE / пул (переподключение — в следующем запросе).
+        # Внутри транзакции (тесты) соединение закрывать нельзя.
+        for connection in connections.all(initialized_only=True):
+            if not connection.in_atomic_block:
+                connection.close_if_unusable_or_obsolete()
+        return response
+
+    def measure(self, client, name, user, url, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+
+        timings, queries, db_times, template_times = [], [], [], []
+        for _ in range(iterations):
+            recorder = QueryTimer()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                start = time.perf_counter()
+                response = self.request(client, url)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(recorder.queries)
+            db_times.append(recorder.seconds * 1000)
+            template_times.append(server_timing(response, 'tpl'))
+
+        return {
+            'name': name,
+            'user': user,
+            'url': url,
+            'status': response.status_code,
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'p99': round(percentile(timings, 99), 2),
+            'queries': round(statistics.mean(queries), 1),
+            'db_ms': round(statistics.mean(db_times), 2),
+            'tpl_ms': round(statistics.mean(template_times), 2),
+            'bytes': len(response.content),
+        }
+
+    def load_baseline(self, path):
+        if not path:
+            return {}
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return {(row['name'], row['user']): row for row in data['results']}
+
+    def print_table(self, results, baseline):
+        header = f"{'сценарий':<30} {'кто':<5} {'код':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} " \
+                 f"{'SQL':>5} {'БД ms':>7} {'шабл ms':>7} {'байт':>8}"
+        if baseline:
+            header += f" {'Δp50':>8} {'ΔSQL':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in results:
+            line = f"{row['name']:<30} {row['user']:<5} {row['status']:>4} {row['p50']:>8.2f} {row['p95']:>8.2f} " \
+                   f"{row['p99']:>8.2f} {row['queries']:>5g} {row['db_ms']:>7.2f} {row.get('tpl_ms', 0):>7.2f} " \
+                   f"{row['bytes']:>8}"
+            old = baseline.get((row['name'], row['user']))
+            if old:
+                change = (row['p50'] - old['p50']) / old['p50'] * 100 if old['p50'] else 0
+                line += f" {change:>+7.0f}% {row['queries'] - old['queries']:>+6g}"
+            self.stdout.write(line)
+        self.stdout.write(f'Соединения с БД: {connection_mode(settings.DATABASES["default"])}')
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG=True: шаблоны и SQL работают медленнее, чем в продакшене'))
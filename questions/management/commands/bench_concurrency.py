@@ -0,0 +1,128 @@
+import http.client
+import threading
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from questions.management.commands.bench import percentile
+from questions.models import Profile, Question
+
+
+def login_cookie(user):
+    """Cookie сессии пользователя: сервер читает ту же базу, что и команда."""
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+class Worker(threading.Thread):
+    """Клиент с keep-alive соединением: запросы по кругу до дедлайна."""
+
+    def __init__(self, base, paths, headers, deadline):
+        super().__init__(daemon=True)
+        self.base = base
+        self.paths = paths
+        self.headers = headers
+        self.deadline = deadline
+        self.timings = []
+        self.errors = 0
+
+    def connect(self):
+        cls = http.client.HTTPSConnection if self.base.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.base.hostname, self.base.port, timeout=30)
+
+    def run(self):
+        connection = self.connect()
+        i = 0
+        while time.perf_counter() < self.deadline:
+            path = self.paths[i % len(self.paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                continue
+            if response.status >= 400:
+                self.errors += 1
+            else:
+                self.timings.append((time.perf_counter() - start) * 1000)
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Нагрузка на запущенный сервер (gunicorn/uvicorn): запросов в секунду и задержки при N одновременных клиентах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help='Число одновременных клиентов, через запятую (по умолчанию 1,8,32)')
+        parser.add_argument('--duration', type=float, default=10, help='Секунд на каждый уровень')
+        parser.add_argument('--paths', nargs='*', help='Страницы; по умолчанию лента, /hot/, тег и вопрос')
+        parser.add_argument('--user', action='store_true',
+                            help='Запросы от пользователя (мимо кеша страниц для анонимов)')
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        if base.scheme not in ('http', 'https') or not base.hostname:
+            raise CommandError('Нужен адрес вида http://host:port')
+        paths = options['paths'] or self.default_paths()
+
+        headers = {'Host': base.netloc}
+        if options['user']:
+            profile = Profile.objects.select_related('user').order_by('id').first()
+            if profile is None:
+                raise CommandError('Нет пользователей: выполните fill_db')
+            headers['Cookie'] = login_cookie(profile.user)
+
+        self.stdout.write(f"{options['url']}  {'пользователь' if options['user'] else 'аноним'}  "
+                          f"страницы: {', '.join(paths)}")
+        header = f"{'клиентов':>8} {'запр/с':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ошибок':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for concurrency in (int(n) for n in options['concurrency'].split(',')):
+            self.run_level(base, paths, headers, concurrency, options['duration'])
+
+    def default_paths(self):
+        question = Question.objects.order_by('-answers_count', 'id').first()
+        if question is None:
+            raise CommandError('Нет данных: выполните fill_db')
+        tag = question.tags.order_by('name').first()
+        paths = [reverse('questions:new_questions'), reverse('questions:hot_questions'),
+                 reverse('questions:question', args=[question.id])]
+        if tag:
+            paths.append(reverse('questions:tag', args=[tag.name]))
+        return paths
+
+    def run_level(self, base, paths, headers, concurrency, duration):
+        start = time.perf_counter()
+        deadline = start + duration
+        # каждый клиент начинает со своей страницы, чтобы все страницы нагружались одновременно
+        workers = [Worker(base, paths[i % len(paths):] + paths[:i % len(paths)], headers, deadline)
+                   for i in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        timings = [t for worker in workers for t in worker.timings]
+        errors = sum(worker.errors for worker in workers)
+        if not timings:
+            self.stdout.write(f'{concurrency:>8} {"-":>8} {"-":>8} {"-":>8} {"-":>8} {errors:>7}')
+            return
+        self.stdout.write(
+            f'{concurrency:>8} {len(timings) / elapsed:>8.1f} {percentile(timings, 50):>8.2f} '
+            f'{percentile(timings, 95):>8.2f} {percentile(timings, 99):>8.2f} {errors:>7}'
+        )
@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from questions.models import Profile, Question, QuestionLike
+
+
+def old_hot_page(per_page=3):
+    # так /hot/ работал раньше: COUNT лайков по всей таблице + COUNT(*) пагинатора
+    questions = Question.objects.annotate(num_likes=models.Count('likes')).order_by('-num_likes')
+    questions.count()
+    return list(questions[:per_page])
+
+
+def new_hot_page(per_page=3):
+    return list(Question.objects.hot()[:per_page + 1])
+
+
+class Command(BaseCommand):
+    help = 'Сравнить старый (COUNT по лайкам) и новый (hot_score) запрос /hot/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=0,
+                            help='Сгенерировать столько вопросов во временной транзакции (откатывается)')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['questions']:
+                self.seed(options['questions'])
+            total = Question.objects.count()
+            self.stdout.write(f"Вопросов в базе: {total}")
+            for name, func in (('old hot()', old_hot_page), ('new hot()', new_hot_page)):
+                timings = self.measure(func, options['repeat'])
+                self.stdout.write(
+                    f"  {name:<10} median {statistics.median(timings):8.2f} ms   "
+                    f"max {max(timings):8.2f} ms"
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, func, repeat):
+        func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def seed(self, count, batch_size=5000):
+        self.stdout.write(f"Генерация {count} вопросов...")
+        users = User.objects.bulk_create([User(username=f'bench_hot_{i}') for i in range(5)])
+        profiles = Profile.objects.bulk_create([Profile(user=user) for user in users])
+        first_id = (Question.objects.aggregate(last=models.Max('id'))['last'] or 0) + 1
+
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            Question.objects.bulk_create([
+                Question(title='bench', text='bench', user=profiles[0], hot_score=random.random() * 10)
+                for _ in range(size)
+            ])
+        ids = Question.objects.filter(id__gte=first_id).values_list('id', flat=True)
+
+        likes = []
+        for question_id in ids.iterator(chunk_size=batch_size):
+            for profile in random.sample(profiles, random.randint(0, len(profiles) - 1)):
+                likes.append(QuestionLike(user=profile, question_id=question_id))
+            if len(likes) >= batch_size:
+                QuestionLike.objects.bulk_create(likes)
+                likes = []
+        QuestionLike.objects.bulk_create(likes)
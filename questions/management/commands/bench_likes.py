@@ -0,0 +1,108 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from questions import like_buffer
+from questions.management.commands.bench import percentile
+from questions.management.commands.recount_counters import count_subquery
+from questions.models import Answer, AnswerLike, Profile, Question, QuestionLike
+from questions.services import toggle_answer_like, toggle_question_like
+
+
+class Clicker(threading.Thread):
+    """Пользователь, который до дедлайна ставит и снимает лайки на горячем вопросе и его ответах."""
+
+    def __init__(self, profile_id, targets, deadline):
+        super().__init__(daemon=True)
+        self.profile_id = profile_id
+        self.targets = targets
+        self.deadline = deadline
+        self.timings = []
+        self.errors = 0
+
+    def run(self):
+        try:
+            i = 0
+            while time.perf_counter() < self.deadline:
+                toggle, target_id = self.targets[i % len(self.targets)]
+                i += 1
+                # парами: лайк и снятие, чтобы данные после замера не изменились
+                for _ in range(2):
+                    start = time.perf_counter()
+                    try:
+                        toggle(self.profile_id, target_id)
+                    except Exception:
+                        self.errors += 1
+                    self.timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность лайков на одном горячем вопросе: запись сразу и через буфер (LIKES_WRITE_BEHIND)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Одновременных пользователей')
+        parser.add_argument('--duration', type=float, default=10, help='Секунд на каждый режим')
+        parser.add_argument('--flush-ms', type=int, default=200, help='LIKES_FLUSH_MS для режима с буфером')
+
+    def handle(self, *args, **options):
+        question = Question.objects.order_by('-likes_count', 'id').first()
+        profiles = list(Profile.objects.order_by('id').values_list('id', flat=True)[:options['threads']])
+        if question is None or len(profiles) < options['threads']:
+            raise CommandError('Мало данных: выполните fill_db (пользователей должно быть не меньше --threads)')
+        answers = list(question.answer_set.order_by('id').values_list('id', flat=True)[:3])
+        targets = [(toggle_question_like, question.id)] + [(toggle_answer_like, answer) for answer in answers]
+        self.stdout.write(f'Вопрос {question.id} и ответов: {len(answers)}; пользователей: {len(profiles)}')
+
+        header = f"{'режим':<14} {'кликов/с':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ошибок':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        self.run_mode('сразу', profiles, targets, options['duration'])
+
+        before = like_buffer.flush_stats()
+        with override_settings(LIKES_WRITE_BEHIND=True, LIKES_FLUSH_MS=options['flush_ms']):
+            self.run_mode(f"буфер {options['flush_ms']} мс", profiles, targets, options['duration'])
+            like_buffer.flush_all()
+        self.print_flushes(before, like_buffer.flush_stats())
+        self.check_counters(question.id, answers)
+
+    def run_mode(self, label, profiles, targets, duration):
+        deadline = time.perf_counter() + duration
+        clickers = [Clicker(profile, targets[i % len(targets):] + targets[:i % len(targets)], deadline)
+                    for i, profile in enumerate(profiles)]
+        start = time.perf_counter()
+        for clicker in clickers:
+            clicker.start()
+        for clicker in clickers:
+            clicker.join()
+        elapsed = time.perf_counter() - start
+        timings = [t for clicker in clickers for t in clicker.timings]
+        errors = sum(clicker.errors for clicker in clickers)
+        self.stdout.write(
+            f'{label:<14} {len(timings) / elapsed:>9.0f} {percentile(timings, 50):>8.2f} '
+            f'{percentile(timings, 95):>8.2f} {percentile(timings, 99):>8.2f} {errors:>7}'
+        )
+
+    def print_flushes(self, before, after):
+        flushes = after['flushes'] - before['flushes']
+        ops = after['ops'] - before['ops']
+        rows = after['rows'] - before['rows']
+        lag = after['lag'][-1] - before['lag'][-1]
+        if not flushes:
+            self.stdout.write('Пачек не было')
+            return
+        self.stdout.write(
+            f'Пачек: {flushes}, кликов в пачке в среднем {ops / flushes:.0f}, '
+            f'после схлопывания пар {rows / flushes:.0f}; средняя задержка записи {lag / flushes * 1000:.0f} мс'
+        )
+
+    def check_counters(self, question_id, answer_ids):
+        stale = Question.objects.filter(id=question_id).exclude(likes_count=count_subquery(QuestionLike, 'question'))
+        stale_answers = Answer.objects.filter(id__in=answer_ids).exclude(likes_count=count_subquery(AnswerLike, 'answer'))
+        if stale.exists() or stale_answers.exists():
+            self.stderr.write(self.style.ERROR('Счётчики лайков разошлись с таблицами лайков'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики лайков совпадают с таблицами лайков'))
@@ -0,0 +1,38 @@
+import random
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from questions.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Время поиска (COUNT + первая страница) по словам из заголовков существующих вопросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50, help='Сколько случайных запросов выполнить')
+        parser.add_argument('--per-page', type=int, default=10)
+
+    def handle(self, *args, **options):
+        titles = list(Question.objects.order_by('?').values_list('title', flat=True)[:200])
+        words = [w for title in titles for w in re.findall(r'\w{4,}', title) if not w.isdigit()]
+        if not words:
+            raise CommandError('Нет вопросов: сначала выполните fill_db')
+
+        timings, found = [], []
+        for _ in range(options['queries']):
+            query = ' '.join(random.sample(words, random.choice((1, 1, 2))))
+            start = time.perf_counter()
+            results = Question.objects.search(query)
+            found.append(results.count())
+            list(results[:options['per_page']])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"Вопросов: {Question.objects.count()}, запросов: {len(timings)}, "
+            f"найдено в среднем: {statistics.mean(found):.0f}\n"
+            f"  median {statistics.median(timings):.2f} ms   "
+            f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms   max {timings[-1]:.2f} ms"
+        )
@@ -0,0 +1,92 @@
+import asyncio
+import resource
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from questions import live
+from questions.models import Question
+
+
+def rss_kib(pid):
+    """Резидентная память процесса, КиБ."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    raise CommandError(f'Нет VmRSS у процесса {pid}')
+
+
+async def open_stream(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: text/event-stream\r\n\r\n'.encode())
+    await writer.drain()
+    status = await reader.readline()
+    if b' 200 ' not in status:
+        raise CommandError(f'{path}: {status.decode().strip()}')
+    # заголовки и первое сообщение (retry:) — подписка на сервере уже есть
+    while b'retry:' not in await reader.readline():
+        pass
+    return reader, writer
+
+
+async def wait_for_event(reader):
+    while not (await reader.readline()).startswith(b'event:'):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Память сервера на одно простаивающее SSE-соединение и время раздачи события всем подписчикам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес сервера uvicorn, например http://127.0.0.1:8000')
+        parser.add_argument('--connections', type=int, default=1000, help='Число соединений')
+        parser.add_argument('--pid', type=int, help='PID процесса сервера (uvicorn с одним воркером) для замера памяти')
+        parser.add_argument('--publish', action='store_true',
+                            help='Опубликовать событие через LIVE_EVENTS_BACKEND (между процессами — PostgresBackend) '
+                                 'и измерить, за сколько оно дойдёт до всех')
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        if base.scheme != 'http' or not base.hostname:
+            raise CommandError('Нужен адрес вида http://host:port')
+        question = Question.objects.order_by('id').first()
+        if question is None:
+            raise CommandError('Нет данных: выполните fill_db')
+
+        limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if options['connections'] + 50 > limit:
+            raise CommandError(f'Лимит открытых файлов {limit}: увеличьте ulimit -n')
+        asyncio.run(self.run(base, question.id, options))
+
+    async def run(self, base, question_id, options):
+        path = reverse('questions:question_events', args=[question_id])
+        pid, count = options['pid'], options['connections']
+        before = rss_kib(pid) if pid else None
+
+        start = time.perf_counter()
+        streams = []
+        # открываем пачками, чтобы не упереться в очередь accept сервера
+        for offset in range(0, count, 100):
+            streams += await asyncio.gather(*(
+                open_stream(base.hostname, base.port or 80, path) for _ in range(min(100, count - offset))
+            ))
+        self.stdout.write(f'{count} соединений открыто за {time.perf_counter() - start:.1f} с')
+
+        if pid:
+            await asyncio.sleep(1)
+            after = rss_kib(pid)
+            self.stdout.write(
+                f'память сервера: {before / 1024:.1f} → {after / 1024:.1f} МиБ, '
+                f'{(after - before) / count:.1f} КиБ на соединение'
+            )
+
+        if options['publish']:
+            start = time.perf_counter()
+            await asyncio.to_thread(live.get_backend().publish, question_id, {'type': 'likes', 'likes': 0})
+            await asyncio.wait_for(asyncio.gather(*(wait_for_event(reader) for reader, _ in streams)), 30)
+            self.stdout.write(f'событие дошло до всех {count} за {(time.perf_counter() - start) * 1000:.1f} мс')
+
+        for _, writer in streams:
+            writer.close()
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from questions.avatars import DEFAULT_AVATAR, build_thumbnails
+from questions.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Построить миниатюры для уже загруженных аватаров (и для новых, если воркер не успел)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересобрать и там, где avatar_hash уже есть')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков для обработки; 1 — без пула')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(avatar='').exclude(avatar=DEFAULT_AVATAR).order_by('id')
+        if not options['force']:
+            profiles = profiles.filter(avatar_hash='')
+        profiles = list(profiles)
+        self.stdout.write(f"Профилей с аватарами для обработки: {len(profiles)}")
+
+        def build(profile):
+            try:
+                return build_thumbnails(profile), None
+            except Exception as exc:
+                return None, f'{profile.id} ({profile.avatar.name}): {exc}'
+
+        def build_in_worker(profile):
+            try:
+                return build(profile)
+            finally:
+                close_old_connections()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(build_in_worker, profiles))
+        else:
+            results = [build(profile) for profile in profiles]
+
+        errors = [error for _, error in results if error]
+        for error in errors:
+            self.stderr.write(f"  ошибка: {error}")
+        self.stdout.write(f"Готово: {len(results) - len(errors)}, ошибок: {len(errors)}")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from questions import related
+
+
+class Command(BaseCommand):
+    help = (
+        'Похожие вопросы по общим тегам (вес тега — idf): пересчитать top-K соседей всех вопросов. '
+        'Запускать после fill_db и периодически (cron): при назначении тегов списки правятся на месте, '
+        'но веса тегов не пересчитываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=related.RELATED_TOP_K, help='Соседей на вопрос')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = related.build_all(options['top'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пар записано: {total} за {time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,127 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Count
+from questions.cache import popular_tags_queryset
+from questions.models import Question, Tag
+from questions.pagination import keyset_filter
+from questions.related import related_questions
+from questions.views import FEED_ORDERING, HOT_ORDERING, ANSWERS_ORDERING
+
+# что считается подозрительным в плане
+PLAN_WARNINGS = {
+    'postgresql': [
+        (re.compile(r'Seq Scan on (\w+)'), 'последовательное чтение {0}'),
+        # узел плана, а не строки Sort Key / Sort Method под ним
+        (re.compile(r'(?:^|->)\s*Sort\s+\(', re.MULTILINE), 'сортировка'),
+    ],
+    'sqlite': [
+        # SCAN ... USING INDEX — проход по индексу в нужном порядке, VIRTUAL TABLE — поиск FTS5
+        (re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX| VIRTUAL TABLE)(?!\w)'), 'последовательное чтение {0}'),
+        (re.compile(r'USE TEMP B-TREE FOR (\w+(?: \w+)*)'), 'сортировка во временном B-дереве ({0})'),
+    ],
+}
+
+
+def explain(connection, sql, params):
+    """План запроса: EXPLAIN ANALYZE на PostgreSQL, EXPLAIN QUERY PLAN на SQLite."""
+    analyze = connection.vendor == 'postgresql'
+    prefix = connection.ops.explain_query_prefix(analyze=True, buffers=True) if analyze \
+        else connection.ops.explain_query_prefix()
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        return '\n'.join(f"{'  ' * _depth(rows, row)}{row[3]}" for row in rows)
+    return '\n'.join(row[0] for row in rows)
+
+
+def _depth(rows, row):
+    parents = {r[0]: r[1] for r in rows}
+    depth, parent = 0, row[1]
+    while parent:
+        depth += 1
+        parent = parents.get(parent, 0)
+    return depth
+
+
+def queryset_sql(queryset):
+    return queryset.query.get_compiler(using=queryset.db).as_sql()
+
+
+class Command(BaseCommand):
+    help = 'Планы основных запросов сайта на текущих данных; отмечает полные проходы по таблицам и сортировки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strict', action='store_true',
+                            help='Завершиться с ошибкой, если в неожиданных местах есть полный проход или сортировка')
+        parser.add_argument('--only', help='Только запросы, в названии которых есть эта строка')
+
+    def handle(self, *args, **options):
+        connection = connections[router.db_for_read(Question)]
+        warnings = PLAN_WARNINGS.get(connection.vendor)
+        if warnings is None:
+            raise CommandError(f'Разбор планов для {connection.vendor} не поддерживается')
+
+        total_flagged = 0
+        for name, (sql, params), expected in self.hot_paths(connection):
+            if options['only'] and options['only'] not in name:
+                continue
+            plan = explain(connection, sql, params)
+            flags = [
+                message.format(*match.groups())
+                for pattern, message in warnings
+                for match in pattern.finditer(plan)
+            ]
+            unexpected = [flag for flag in flags if not any(allowed in flag for allowed in expected)]
+            total_flagged += bool(unexpected)
+
+            status = self.style.WARNING('ПРОВЕРИТЬ') if unexpected else self.style.SUCCESS('ok')
+            self.stdout.write(f'\n=== {name}: {status}')
+            self.stdout.write(plan)
+            for flag in flags:
+                marker = '!' if flag in unexpected else '~'
+                self.stdout.write(f'  {marker} {flag}' + ('' if flag in unexpected else ' (ожидаемо)'))
+
+        self.stdout.write(f'\nЗапросов с подозрительными планами: {total_flagged}')
+        if options['strict'] and total_flagged:
+            raise CommandError('Есть планы с полным проходом или сортировкой')
+
+    def hot_paths(self, connection):
+        """(название, (sql, params), ожидаемые пометки) для каждого горячего запроса."""
+        question = Question.objects.order_by('-answers_count', 'id').first()
+        if question is None:
+            raise CommandError('Нет вопросов: сначала выполните fill_db')
+        tag = Tag.objects.annotate(num=Count('question')).order_by('-num').first()
+        middle = Question.objects.order_by(*FEED_ORDERING)[Question.objects.count() // 2]
+        hot_middle = Question.objects.order_by(*HOT_ORDERING)[Question.objects.count() // 2]
+
+        paths = [
+            ('new() первая страница', queryset_sql(Question.objects.new()[:11]), []),
+            ('new() середина ленты', queryset_sql(
+                Question.objects.new().filter(keyset_filter(FEED_ORDERING, [middle.created_at, middle.id]))[:11]
+            ), []),
+            ('hot() первая страница', queryset_sql(Question.objects.hot()[:4]), []),
+            ('hot() середина ленты', queryset_sql(
+                Question.objects.hot().filter(keyset_filter(HOT_ORDERING, [hot_middle.hot_score, hot_middle.id]))[:4]
+            ), []),
+            # популярный тег: вопросы тега сортируются по дате после соединения
+            (f'by_tag({tag.name!r}) первая страница', queryset_sql(Question.objects.by_tag(tag.name)[:11]),
+             ['сортировка']),
+            ('ответы на вопрос', queryset_sql(
+                question.answer_set.select_related('user').order_by(*ANSWERS_ORDERING)[:6]
+            ), []),
+            ('похожие вопросы', queryset_sql(related_questions(question.id)), []),
+            # агрегат по всем связям вопрос-тег — поэтому результат и кешируется (questions/cache.py)
+            ('get_popular_tags()', queryset_sql(popular_tags_queryset()), ['последовательное чтение', 'сортировка']),
+            ('decay_hot_scores() выбор строк', queryset_sql(Question.objects.filter(hot_score__gt=0).values('id')), []),
+            ('bump_hot_score()', queryset_sql(Question.objects.filter(id=question.id).values('id')), []),
+        ]
+        word = next(iter(re.findall(r'\w{4,}', question.title)), None)
+        if word:
+            results = Question.objects.search(word)
+            sql = results._sql('id' if connection.vendor == 'postgresql' else 'rowid', 'LIMIT 11')
+            if sql:
+                paths.append((f'search({word!r})', sql, []))
+        return paths
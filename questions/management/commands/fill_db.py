@@ -1,21 +1,132 @@
+import csv
+import io
+import multiprocessing
+import os
 import random
-from django.core.management.base import BaseCommand
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.utils import timezone
 from faker import Faker
 from questions.models import Profile, Tag, Question, Answer, QuestionLike, AnswerLike
+from questions.management.commands.recount_counters import recount_counters
 
 fake = Faker('ru_RU')
 
+BASE_TAGS = [
+    'python', 'django', 'javascript', 'react', 'java', 'sql', 'docker',
+    'git', 'html', 'css', 'api', 'rest', 'linux', 'devops', 'ai',
+    'machine-learning', 'security', 'testing', 'cloud', 'aws'
+]
+
+
+def generate_texts(task):
+    """Выполняется в отдельном процессе: только Faker, без обращения к БД."""
+    kind, seed, start, count = task
+    faker = Faker('ru_RU')
+    faker.seed_instance(seed)
+    if kind == 'question':
+        return [
+            (f"Вопрос #{start + i + 1}: {faker.sentence(nb_words=6)}", faker.paragraph(nb_sentences=3))
+            for i in range(count)
+        ]
+    return [faker.paragraph(nb_sentences=2) for _ in range(count)]
+
+
+def worker_pid(_):
+    """Пробная задача: заставляет пул запустить процесс."""
+    return os.getpid()
+
+
+class Phase:
+    def __init__(self, stdout, name):
+        self.stdout = stdout
+        self.name = name
+        self.rows = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            elapsed = time.perf_counter() - self.started
+            rate = self.rows / elapsed if elapsed else 0
+            self.stdout.write(f"  {self.name}: {self.rows} строк за {elapsed:.1f} с ({rate:,.0f} строк/с)")
+
+
+class BulkWriter:
+    """
+    Пишет строки пачками: COPY ... FROM STDIN на PostgreSQL, executemany на остальных базах.
+    ignore_conflicts: повторный запуск не падает на уникальных индексах (лайки, теги вопросов).
+    nullable: колонки, где None — это NULL (csv пишет его пустой строкой в кавычках).
+    """
+
+    def __init__(self, model, columns, ignore_conflicts=False, nullable=()):
+        self.table = model._meta.db_table
+        self.columns = columns
+        self.ignore_conflicts = ignore_conflicts
+        self.nullable = nullable
+        self.postgres = connection.vendor == 'postgresql'
+        self.stage = None
+        if self.postgres and ignore_conflicts:
+            self.stage = f'fill_db_stage_{self.table}'
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {self.stage} ON COMMIT DROP AS "
+                    f"SELECT {', '.join(columns)} FROM {self.table} WITH NO DATA"
+                )
+
+    def write(self, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            if self.postgres:
+                self._copy(cursor, self.stage or self.table, rows)
+                if self.stage:
+                    cols = ', '.join(self.columns)
+                    cursor.execute(
+                        f"INSERT INTO {self.table} ({cols}) SELECT {cols} FROM {self.stage} ON CONFLICT DO NOTHING"
+                    )
+                    cursor.execute(f"TRUNCATE {self.stage}")
+            else:
+                verb = 'INSERT OR IGNORE' if self.ignore_conflicts and connection.vendor == 'sqlite' else 'INSERT'
+                placeholders = ', '.join(['%s'] * len(self.columns))
+                cursor.executemany(
+                    f"{verb} INTO {self.table} ({', '.join(self.columns)}) VALUES ({placeholders})", rows
+                )
+
+    def _copy(self, cursor, table, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        force_null = f", FORCE_NULL ({', '.join(self.nullable)})" if self.nullable else ''
+        sql = f"COPY {table} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv{force_null})"
+        if hasattr(cursor, 'copy_expert'):  # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
 
 class Command(BaseCommand):
     help = 'Заполнить базу тестовыми данными: users=ratio, questions=ratio*10, answers=ratio*100, tags=ratio, likes=ratio*200'
 
     def add_arguments(self, parser):
         parser.add_argument('ratio', type=int, help='Коэффициент заполнения')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Процессов для генерации текста')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Строк в одной пачке вставки')
 
     def handle(self, *args, **options):
         ratio = options['ratio']
+        self.batch_size = options['batch_size']
+        self.workers = max(1, options['workers'] or 1)
         self.stdout.write(f"Запуск заполнения с ratio = {ratio}")
 
         num_users = ratio
@@ -23,146 +134,209 @@ class Command(BaseCommand):
         num_answers = ratio * 100
         num_tags = ratio
         num_likes = ratio * 200
+        self.now = timezone.now()
 
+        # пул запускает процессы лениво, на первом submit — а он был бы уже внутри atomic(), и дети
+        # унаследовали бы открытое соединение. Поэтому соединения закрываются, а все процессы
+        # форкаются пробными задачами до транзакции. fork задан явно: spawn и forkserver импортировали
+        # бы этот модуль без django.setup()
+        connections.close_all()
+        started = time.perf_counter()
         try:
-            with transaction.atomic():
-                users = self.create_users(num_users)
-                profiles = self.create_profiles_for_all()
-                tags = self.create_tags(num_tags)
-                questions = self.create_questions(num_questions, profiles, tags)
-                answers = self.create_answers(num_answers, questions, profiles)
-                self.create_likes(num_likes, profiles, questions, answers)
+            fork = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=fork) as self.pool:
+                list(self.pool.map(worker_pid, range(self.workers)))
+                with transaction.atomic():
+                    self.create_users(num_users)
+                    profile_ids = self.create_profiles_for_all()
+                    tag_ids = self.create_tags(num_tags)
+                    question_ids = self.create_questions(num_questions, profile_ids, tag_ids)
+                    answer_ids = self.create_answers(num_answers, question_ids, profile_ids)
+                    self.create_likes(num_likes, profile_ids, question_ids, answer_ids)
+                    with Phase(self.stdout, "Пересчёт счётчиков") as phase:
+                        phase.rows = sum(recount_counters())
+                    with Phase(self.stdout, "Рейтинг горячих вопросов") as phase:
+                        phase.rows = Question.objects.rebuild_hot_scores()
 
             self.stdout.write(self.style.SUCCESS(
-                f"Успешно создано:\n"
+                f"Успешно создано за {time.perf_counter() - started:.1f} с:\n"
                 f"  Пользователей: {num_users}\n"
-                f"  Вопросов: {len(questions)}\n"
-                f"  Ответов: {len(answers)}\n"
-                f"  Тегов: {len(tags)}\n"
+                f"  Вопросов: {len(question_ids)}\n"
+                f"  Ответов: {len(answer_ids)}\n"
+                f"  Тегов: {len(tag_ids)}\n"
                 f"  Лайков: {num_likes}"
             ))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"Ошибка: {e}"))
             raise
 
+    def texts(self, kind, count):
+        """Поток пачек текста из пула процессов; в памяти не больше 2 пачек на процесс."""
+        tasks = iter(
+            (kind, random.getrandbits(32), start, min(self.batch_size, count - start))
+            for start in range(0, count, self.batch_size)
+        )
+        pending = []
+        for task in tasks:
+            pending.append(self.pool.submit(generate_texts, task))
+            if len(pending) >= self.workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    def db_time(self, value):
+        # в формате, в котором Django сам пишет datetime в эту базу
+        return connection.ops.adapt_datetimefield_value(value)
+
+    def random_time(self, days=365):
+        return self.db_time(self.now - timedelta(seconds=random.randint(0, days * 86400)))
+
+    def ids_after(self, model, last_id):
+        rows = model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)
+        return array('q', rows.iterator(chunk_size=self.batch_size))
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
     def create_users(self, count):
         self.stdout.write(f"Создание {count} пользователей...")
-        users = []
-        for i in range(count):
-            username = f"user_{i+1}"
-            if not User.objects.filter(username=username).exists():
-                user = User(
-                    username=username,
-                    email=f"{username}@example.com",
-                    first_name=fake.first_name(),
-                    last_name=fake.last_name(),
-                )
-                user.set_password('test123')
-                users.append(user)
-        User.objects.bulk_create(users, ignore_conflicts=True)
-        return list(User.objects.filter(username__startswith='user_')[:count])
+        existing = set(User.objects.filter(username__startswith='user_').values_list('username', flat=True))
+        # хеш пароля один на всех: PBKDF2 на каждого пользователя занимал почти всё время
+        password = make_password('test123')
+        writer = BulkWriter(User, [
+            'username', 'email', 'first_name', 'last_name', 'password',
+            'is_superuser', 'is_staff', 'is_active', 'date_joined',
+        ])
+        with Phase(self.stdout, "Пользователи") as phase:
+            batch = []
+            for i in range(count):
+                username = f"user_{i+1}"
+                if username in existing:
+                    continue
+                batch.append((
+                    username, f"{username}@example.com", fake.first_name(), fake.last_name(), password,
+                    False, False, True, self.db_time(self.now),
+                ))
+                if len(batch) >= self.batch_size:
+                    writer.write(batch)
+                    phase.rows += len(batch)
+                    batch = []
+            writer.write(batch)
+            phase.rows += len(batch)
 
     def create_profiles_for_all(self):
         self.stdout.write("Создание профилей для всех пользователей...")
-        profiles = []
-        for user in User.objects.all():
-            profile, _ = Profile.objects.get_or_create(
-                user=user,
-                defaults={'avatar': 'default.jpg'}
+        with Phase(self.stdout, "Профили") as phase, connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {Profile._meta.db_table} (user_id, avatar, avatar_hash) "
+                f"SELECT id, %s, %s FROM {User._meta.db_table} u WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {Profile._meta.db_table} p WHERE p.user_id = u.id)",
+                ['default.jpg', ''],
             )
-            profiles.append(profile)
-        return profiles
+            phase.rows = cursor.rowcount
+        return array('q', Profile.objects.order_by('id').values_list('id', flat=True))
 
     def create_tags(self, count):
         self.stdout.write(f"Создание {count} тегов...")
-        base_tags = [
-            'python', 'django', 'javascript', 'react', 'java', 'sql', 'docker',
-            'git', 'html', 'css', 'api', 'rest', 'linux', 'devops', 'ai',
-            'machine-learning', 'security', 'testing', 'cloud', 'aws'
+        names = [
+            BASE_TAGS[i % len(BASE_TAGS)] + (f"-{i // len(BASE_TAGS)}" if i >= len(BASE_TAGS) else '')
+            for i in range(count)
         ]
-        extended = (base_tags * (count // len(base_tags) + 1))[:count]
-        tags = []
-        for name in extended:
-            tag, _ = Tag.objects.get_or_create(name=name)
-            tags.append(tag)
-        return tags
-
-    def create_questions(self, count, profiles, tags):
+        with Phase(self.stdout, "Теги") as phase:
+            for start in range(0, count, self.batch_size):
+                chunk = names[start:start + self.batch_size]
+                Tag.objects.bulk_create([Tag(name=name) for name in chunk], ignore_conflicts=True)
+            tag_ids = array('q')
+            for start in range(0, count, self.batch_size):
+                chunk = names[start:start + self.batch_size]
+                tag_ids.extend(Tag.objects.filter(name__in=chunk).values_list('id', flat=True))
+            phase.rows = len(tag_ids)
+        return tag_ids
+
+    def create_questions(self, count, profile_ids, tag_ids):
         self.stdout.write(f"Создание {count} вопросов...")
-        batch_size = 1000
-        for i in range(0, count, batch_size):
-            batch = []
-            for j in range(i, min(i + batch_size, count)):
-                q = Question(
-                    title=f"Вопрос #{j+1}: {fake.sentence(nb_words=6)}",
-                    text=fake.paragraph(nb_sentences=3),
-                    user=random.choice(profiles),
-                )
-                batch.append(q)
-            Question.objects.bulk_create(batch, ignore_conflicts=True)
+        last_id = self.last_id(Question)
+        writer = BulkWriter(Question, [
+            'title', 'text', 'user_id', 'created_at', 'updated_at', 'likes_count', 'answers_count', 'hot_score',
+        ])
+        with Phase(self.stdout, "Вопросы") as phase:
+            for texts in self.texts('question', count):
+                rows = []
+                for title, text in texts:
+                    created_at = self.random_time()
+                    rows.append((title, text, random.choice(profile_ids), created_at, created_at, 0, 0, 0.0))
+                writer.write(rows)
+                phase.rows += len(rows)
 
-        questions = list(Question.objects.order_by('id')[:count])
-        self.assign_tags_to_questions(questions, tags)
-        return questions
+        question_ids = self.ids_after(Question, last_id)
+        self.assign_tags_to_questions(question_ids, tag_ids)
+        return question_ids
 
-    def assign_tags_to_questions(self, questions, tags):
+    def assign_tags_to_questions(self, question_ids, tag_ids):
         self.stdout.write("Привязка тегов к вопросам...")
-        through = Question.tags.through
-        relations = []
-        for q in questions:
-            num = random.randint(1, min(3, len(tags)))
-            for tag in random.sample(tags, num):
-                relations.append(through(question=q, tag=tag))
-        through.objects.bulk_create(relations, ignore_conflicts=True)
-
-    def create_answers(self, count, questions, profiles):
-        self.stdout.write(f"Создание {count} ответов...")
-        batch_size = 1000
-        for i in range(0, count, batch_size):
+        writer = BulkWriter(Question.tags.through, ['question_id', 'tag_id'], ignore_conflicts=True)
+        with Phase(self.stdout, "Теги вопросов") as phase:
             batch = []
-            for j in range(i, min(i + batch_size, count)):
-                a = Answer(
-                    question=random.choice(questions),
-                    text=fake.paragraph(nb_sentences=2),
-                    user=random.choice(profiles),
-                    is_correct=random.random() < 0.1,
-                )
-                batch.append(a)
-            Answer.objects.bulk_create(batch, ignore_conflicts=True)
-        return list(Answer.objects.order_by('id')[:count])
+            for question_id in question_ids:
+                num = random.randint(1, min(3, len(tag_ids)))
+                batch.extend((question_id, tag_id) for tag_id in random.sample(tag_ids, num))
+                if len(batch) >= self.batch_size:
+                    writer.write(batch)
+                    phase.rows += len(batch)
+                    batch = []
+            writer.write(batch)
+            phase.rows += len(batch)
+
+    def create_answers(self, count, question_ids, profile_ids):
+        self.stdout.write(f"Создание {count} ответов...")
+        last_id = self.last_id(Answer)
+        writer = BulkWriter(Answer, [
+            'question_id', 'text', 'user_id', 'is_correct', 'created_at', 'updated_at', 'likes_count',
+        ])
+        with Phase(self.stdout, "Ответы") as phase:
+            for texts in self.texts('answer', count):
+                rows = []
+                for text in texts:
+                    created_at = self.random_time()
+                    rows.append((
+                        random.choice(question_ids), text, random.choice(profile_ids),
+                        random.random() < 0.1, created_at, created_at, 0,
+                    ))
+                writer.write(rows)
+                phase.rows += len(rows)
+        return self.ids_after(Answer, last_id)
 
-    def create_likes(self, total_likes, profiles, questions, answers):
+    def create_likes(self, total_likes, profile_ids, question_ids, answer_ids):
         self.stdout.write(f"Создание {total_likes} лайков...")
         q_likes = int(total_likes * 0.6)
         a_likes = total_likes - q_likes
-        self.create_question_likes(q_likes, profiles, questions)
-        self.create_answer_likes(a_likes, profiles, answers)
-
-    def create_question_likes(self, count, profiles, questions):
-        self.stdout.write(f"  Лайки на вопросы: {count}")
-        likes = []
-        for _ in range(count):
-            user = random.choice(profiles)
-            q = random.choice(questions)
-            if not QuestionLike.objects.filter(user=user, question=q).exists():
-                likes.append(QuestionLike(user=user, question=q))
-            if len(likes) >= 1000:
-                QuestionLike.objects.bulk_create(likes, ignore_conflicts=True)
-                likes = []
-        if likes:
-            QuestionLike.objects.bulk_create(likes, ignore_conflicts=True)
-
-    def create_answer_likes(self, count, profiles, answers):
-        self.stdout.write(f"  Лайки на ответы: {count}")
-        likes = []
-        for _ in range(count):
-            user = random.choice(profiles)
-            a = random.choice(answers)
-            if not AnswerLike.objects.filter(user=user, answer=a).exists():
-                likes.append(AnswerLike(user=user, answer=a))
-            if len(likes) >= 1000:
-                AnswerLike.objects.bulk_create(likes, ignore_conflicts=True)
-                likes = []
-        if likes:
-            AnswerLike.objects.bulk_create(likes, ignore_conflicts=True)
+        with Phase(self.stdout, "Лайки на вопросы") as phase:
+            # время лайка не генерируется: NULL в created_at — «ровесник вопроса» для hot_score
+            phase.rows = self.create_target_likes(QuestionLike, 'question_id', q_likes, profile_ids, question_ids,
+                                                  undated=True)
+        with Phase(self.stdout, "Лайки на ответы") as phase:
+            phase.rows = self.create_target_likes(AnswerLike, 'answer_id', a_likes, profile_ids, answer_ids)
 
+    def create_target_likes(self, model, target_column, count, profile_ids, target_ids, undated=False):
+        """
+        Каждому пользователю достаётся своя доля лайков, цели выбираются без повторов
+        (random.sample), поэтому пары (user, target) уникальны без запросов к БД.
+        undated: явный NULL в created_at вместо умолчания базы (now()).
+        """
+        if not profile_ids or not target_ids:
+            return 0
+        no_date = (None,) if undated else ()
+        dated = ['created_at'] if undated else []
+        writer = BulkWriter(model, ['user_id', target_column] + dated, ignore_conflicts=True, nullable=dated)
+        per_user, extra = divmod(count, len(profile_ids))
+        written = 0
+        batch = []
+        for i, profile_id in enumerate(profile_ids):
+            k = min(per_user + (1 if i < extra else 0), len(target_ids))
+            batch.extend((profile_id, target_ids[idx], *no_date) for idx in random.sample(range(len(target_ids)), k))
+            if len(batch) >= self.batch_size:
+                writer.write(batch)
+                written += len(batch)
+                batch = []
+        writer.write(batch)
+        return written + len(batch)
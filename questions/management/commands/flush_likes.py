@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from questions import like_buffer
+
+
+class Command(BaseCommand):
+    help = 'Записать в базу лайки из общего буфера CacheBuffer (LocalBuffer живёт в памяти своего процесса)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Записано кликов: {like_buffer.flush_all()}')
@@ -0,0 +1,69 @@
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+# ссылки на ресурсы страницы: stylesheet, скрипты, картинки (в srcset берём первый вариант)
+ASSET_RE = re.compile(r'<(?:link|script|img|source)\b[^>]*?\b(?:href|src|srcset)="([^"\s]+)')
+ACCEPT_ENCODING = 'br, gzip'
+
+
+def response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def is_cached_forever(response):
+    cache_control = response.get('Cache-Control', '')
+    return 'immutable' in cache_control
+
+
+class Command(BaseCommand):
+    help = 'Сколько байт и запросов уходит на страницу при первом (холодном) и повторном (тёплом) заходе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/', '/hot/'], help='Страницы, по умолчанию / и /hot/')
+
+    def handle(self, *args, **options):
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        # DEBUG=False: {% static %} даёт имена с хешем, как в продакшене
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[host]):
+            client = Client(HTTP_HOST=host, HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING)
+            for path in options['paths']:
+                self.measure(client, path)
+
+    def measure(self, client, path):
+        page = client.get(path)
+        html = page.content.decode()
+        html_bytes = len(page.content)
+        assets = list(dict.fromkeys(
+            urlsplit(url).path for url in ASSET_RE.findall(html) if not urlsplit(url).netloc
+        ))
+
+        self.stdout.write(f'\n{path}  (HTML {html_bytes} Б)')
+        cold_bytes = warm_bytes = html_bytes
+        warm_requests = 1
+        for url in assets:
+            response = client.get(url)
+            size = response_size(response) if response.status_code == 200 else 0
+            cold_bytes += size
+            if is_cached_forever(response):
+                warm = 'из кеша браузера'
+            else:
+                # без immutable браузер перепроверяет файл: 304 без тела или файл целиком
+                warm_requests += 1
+                revalidation = client.get(url, HTTP_IF_MODIFIED_SINCE=response.get('Last-Modified', ''))
+                warm_size = response_size(revalidation) if revalidation.status_code == 200 else 0
+                warm_bytes += warm_size
+                warm = f'перепроверка: {revalidation.status_code}, {warm_size} Б'
+            encoding = response.get('Content-Encoding', '-')
+            self.stdout.write(f'  {url}  {response.status_code} {size} Б  [{encoding}]  {warm}')
+
+        self.stdout.write(
+            f'  холодная загрузка: {1 + len(assets)} запросов, {cold_bytes} Б; '
+            f'тёплая: {warm_requests} запросов, {warm_bytes} Б'
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from questions.models import Question, Answer, QuestionLike, AnswerLike
+
+
+def count_subquery(model, field):
+    rows = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def recount_counters():
+    """Пересчитывает likes_count/answers_count одним UPDATE на таблицу."""
+    with transaction.atomic():
+        questions = Question.objects.update(
+            likes_count=count_subquery(QuestionLike, 'question'),
+            answers_count=count_subquery(Answer, 'question'),
+        )
+        answers = Answer.objects.update(
+            likes_count=count_subquery(AnswerLike, 'answer'),
+        )
+    return questions, answers
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать денормализованные счётчики лайков и ответов'
+
+    def handle(self, *args, **options):
+        questions, answers = recount_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Счётчики пересчитаны: вопросов {questions}, ответов {answers}"
+        ))
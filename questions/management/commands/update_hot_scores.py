@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from questions.models import Question, HOT_HALF_LIFE_HOURS
+
+
+class Command(BaseCommand):
+    help = (
+        'Затухание hot_score горячих вопросов. Запускать периодически (cron) '
+        'с тем же --hours, что и интервал запуска; --rebuild пересчитывает всё с нуля'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=1.0, help='Сколько часов прошло с прошлого запуска')
+        parser.add_argument('--rebuild', action='store_true', help='Пересчитать счёт всех вопросов по лайкам, ответам и возрасту')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            total = Question.objects.rebuild_hot_scores()
+            self.stdout.write(self.style.SUCCESS(f"Пересчитано вопросов: {total}"))
+            return
+
+        total = Question.objects.decay_hot_scores(options['hours'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Затухание за {options['hours']} ч (период полураспада {HOT_HALF_LIFE_HOURS} ч): "
+            f"обновлено вопросов {total}"
+        ))
@@ -0,0 +1,162 @@
+"""
+Гистограммы времени ответа по именам маршрутов в формате Prometheus.
+
+Данные живут в памяти процесса: при нескольких воркерах gunicorn каждый
+отдаёт свои значения, поэтому Prometheus стоит собирать с каждого процесса
+отдельно (или суммировать по instance).
+"""
+import threading
+from bisect import bisect_left
+
+from django.db import connections
+from questions import like_buffer
+from questions.cache import card_cache_stats, popular_tags_stats
+from questions.page_cache import page_cache_stats
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+HISTOGRAMS = {
+    # имя метрики -> (описание, границы корзин)
+    'questions_request_duration_seconds': ('Время обработки запроса целиком', SECONDS_BUCKETS),
+    'questions_view_duration_seconds': ('Время view, включая SQL и шаблоны', SECONDS_BUCKETS),
+    'questions_db_duration_seconds': ('Суммарное время SQL-запросов за запрос', SECONDS_BUCKETS),
+    'questions_template_duration_seconds': ('Время рендеринга шаблонов', SECONDS_BUCKETS),
+    'questions_db_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+}
+
+# показатели пула psycopg (ConnectionPool.get_stats()) -> (метрика, тип, описание, множитель)
+POOL_STATS = {
+    'pool_size': ('questions_db_pool_connections', 'gauge', 'Соединений в пуле', 1),
+    'pool_available': ('questions_db_pool_available', 'gauge', 'Свободных соединений в пуле', 1),
+    'requests_waiting': ('questions_db_pool_waiting', 'gauge', 'Запросов ждут соединение', 1),
+    'requests_num': ('questions_db_pool_checkouts_total', 'counter', 'Выдач соединения из пула', 1),
+    'requests_wait_ms': ('questions_db_pool_wait_seconds_total', 'counter', 'Суммарное ожидание соединения', 0.001),
+    'requests_errors': ('questions_db_pool_timeouts_total', 'counter', 'Не дождались соединения за timeout', 1),
+    'connections_num': ('questions_db_pool_opened_total', 'counter', 'Новых соединений с базой', 1),
+    'connections_lost': ('questions_db_pool_lost_total', 'counter', 'Соединений, не прошедших проверку', 1),
+}
+
+_lock = threading.Lock()
+# (метрика, view) -> [счётчики корзин..., +Inf, сумма]
+_series = {}
+# база -> сколько раз Django открывал соединение (в режиме pool — брал из пула)
+_connects = {}
+
+
+def observe(view_name, values):
+    """values: {имя метрики: значение} для одного запроса."""
+    with _lock:
+        for name, value in values.items():
+            buckets = HISTOGRAMS[name][1]
+            series = _series.get((name, view_name))
+            if series is None:
+                series = _series[(name, view_name)] = [0] * (len(buckets) + 2)
+            series[bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+
+def count_connect(alias):
+    with _lock:
+        _connects[alias] = _connects.get(alias, 0) + 1
+
+
+def reset():
+    with _lock:
+        _series.clear()
+        _connects.clear()
+
+
+def pool_stats():
+    """{база: статистика пула} для баз, настроенных с пулом соединений."""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, description, buckets, series, labels=None):
+    """series — [корзины..., +Inf, сумма]; с labels — {метка: такой список}, по серии на метку."""
+    lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+    labelled = [('', series)] if labels is None else [(f'{labels}="{_label(value)}"', s) for value, s in series.items()]
+    for label, values in labelled:
+        prefix, suffix = (f'{label},', f'{{{label}}}') if label else ('', '')
+        cumulative = 0
+        for bound, count in zip(buckets, values):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        cumulative += values[-2]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{suffix} {values[-1]:.6f}')
+        lines.append(f'{name}_count{suffix} {cumulative}')
+    return lines
+
+
+def _like_flush_lines(stats):
+    """Отложенная запись лайков: пачки, операции, размер пачки и задержка записи."""
+    lines = []
+    for stat, description in (
+        ('flushes', 'Записанных пачек лайков'),
+        ('ops', 'Кликов, записанных пачками'),
+        ('rows', 'Пар пользователь-цель после схлопывания кликов'),
+        ('errors', 'Пачек, которые не удалось записать'),
+    ):
+        lines.append(f'# HELP questions_like_flush_{stat}_total {description}')
+        lines.append(f'# TYPE questions_like_flush_{stat}_total counter')
+        lines.append(f'questions_like_flush_{stat}_total {stats[stat]}')
+    lines += _histogram_lines('questions_like_flush_batch', 'Кликов в одной пачке',
+                              like_buffer.BATCH_BUCKETS, stats['batch'])
+    lines += _histogram_lines('questions_like_flush_lag_seconds', 'Сколько самый старый клик пачки ждал записи',
+                              like_buffer.LAG_BUCKETS, stats['lag'])
+    return lines
+
+
+def render_metrics():
+    with _lock:
+        snapshot = {key: list(series) for key, series in _series.items()}
+        connects = dict(_connects)
+
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        by_view = {view_name: series for (metric, view_name), series in sorted(snapshot.items()) if metric == name}
+        lines += _histogram_lines(name, description, buckets, by_view, labels='view')
+
+    lines.append('# HELP questions_popular_tags_cache_total Обращения к кешу популярных тегов')
+    lines.append('# TYPE questions_popular_tags_cache_total counter')
+    for result, value in sorted(popular_tags_stats().items()):
+        lines.append(f'questions_popular_tags_cache_total{{result="{result}"}} {value}')
+
+    cards = card_cache_stats()
+    lines.append('# HELP questions_card_cache_total Карточки вопросов: из кеша и отрендеренные заново')
+    lines.append('# TYPE questions_card_cache_total counter')
+    lines.append(f'questions_card_cache_total{{result="hits"}} {cards["hits"]}')
+    lines.append(f'questions_card_cache_total{{result="misses"}} {cards["misses"]}')
+
+    lines.append('# HELP questions_page_cache_total Кеш страниц для анонимных посетителей')
+    lines.append('# TYPE questions_page_cache_total counter')
+    for result, value in sorted(page_cache_stats().items()):
+        lines.append(f'questions_page_cache_total{{result="{result}"}} {value}')
+
+    lines.append('# HELP questions_db_connections_total Открытий соединения с базой (с пулом — выдач из пула)')
+    lines.append('# TYPE questions_db_connections_total counter')
+    for alias, value in sorted(connects.items()):
+        lines.append(f'questions_db_connections_total{{alias="{_label(alias)}"}} {value}')
+
+    lines += _like_flush_lines(like_buffer.flush_stats())
+
+    pools = pool_stats()
+    for stat, (name, kind, description, scale) in POOL_STATS.items():
+        if not pools:
+            break
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for alias, stats in sorted(pools.items()):
+            value = stats.get(stat, 0) * scale
+            lines.append(f'{name}{{alias="{_label(alias)}"}} {value:g}')
+    return '\n'.join(lines) + '\n'
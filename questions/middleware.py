@@ -0,0 +1,208 @@
+import time
+from contextlib import ExitStack
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.db import connections
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from questions import metrics, routers
+from questions.cache import get_user_with_profile
+
+PRIMARY_PIN_COOKIE = 'primary_pin'
+
+
+class QueryTimer:
+    """execute_wrapper: число запросов и суммарное время в базе за один HTTP-запрос (middleware, bench)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class PerformanceMiddleware:
+    """
+    Время запроса, view, SQL и шаблонов: заголовок Server-Timing и гистограммы для /metrics.
+    Должен стоять первым в MIDDLEWARE, чтобы total включал остальные middleware.
+    При PERF_METRICS = False Django исключает его из цепочки целиком.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        # async ORM выполняет SQL в потоке этого запроса (sync_to_async), а соединения
+        # у каждого потока свои — поэтому обёртку ставим и снимаем в том же потоке
+        await sync_to_async(self.attach)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.detach)(timer)
+        return self.finish(request, response, timer, start)
+
+    @staticmethod
+    def attach(timer):
+        for connection in connections.all():
+            connection.execute_wrappers.append(timer)
+
+    @staticmethod
+    def detach(timer):
+        for connection in connections.all():
+            if timer in connection.execute_wrappers:
+                connection.execute_wrappers.remove(timer)
+
+    def finish(self, request, response, timer, start):
+        end = time.perf_counter()
+        view_start = getattr(request, 'view_started_at', None)
+        view_seconds = end - view_start if view_start is not None else 0.0
+        template_seconds = getattr(request, 'template_seconds', 0.0)
+        match = request.resolver_match
+        metrics.observe(match.view_name if match else 'unresolved', {
+            'questions_request_duration_seconds': end - start,
+            'questions_view_duration_seconds': view_seconds,
+            'questions_db_duration_seconds': timer.seconds,
+            'questions_template_duration_seconds': template_seconds,
+            'questions_db_queries': timer.queries,
+        })
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timer.seconds * 1000:.1f};desc="{timer.queries} queries"',
+            f'tpl;dur={template_seconds * 1000:.1f}',
+            f'view;dur={view_seconds * 1000:.1f}',
+            f'total;dur={(end - start) * 1000:.1f}',
+        ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_started_at = time.perf_counter()
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET/HEAD читают с реплик (questions/routers.py), остальные методы — из основной базы.
+    Если запрос что-то записал, cookie primary_pin на PRIMARY_PIN_SECONDS отправляет
+    чтение этого посетителя в основную базу, пока реплика не догонит.
+    Без DATABASE_REPLICAS исключается из цепочки.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.start_request(self.use_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.finish_request(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        # состояние в contextvar: sync_to_async копирует контекст, роутер в потоке видит тот же объект
+        token = routers.start_request(self.use_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = routers.finish_request(token)
+        return self.pin(response, state)
+
+    @staticmethod
+    def use_replicas(request):
+        return request.method in ('GET', 'HEAD') and PRIMARY_PIN_COOKIE not in request.COOKIES
+
+    @staticmethod
+    def pin(response, state):
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=settings.PRIMARY_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+def load_user(request):
+    """
+    django.contrib.auth.get_user, но User вместе с Profile берётся из кеша.
+    Всё необычное (другой бэкенд, неактивный пользователь, хеш сессии не совпал
+    после смены пароля или ротации SECRET_KEY) решает сам Django — он же сбрасывает сессию.
+    """
+    session = request.session
+    try:
+        user_id = User._meta.pk.to_python(session[auth.SESSION_KEY])
+        backend_path = session[auth.BACKEND_SESSION_KEY]
+    except (KeyError, ValidationError):
+        return AnonymousUser()
+    if not settings.USER_CACHE_SECONDS or backend_path != MODEL_BACKEND:
+        return auth.get_user(request)
+
+    user = get_user_with_profile(user_id)
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if (user is None or not user.is_active or not session_hash
+            or not constant_time_compare(session_hash, user.get_session_auth_hash())):
+        return auth.get_user(request)
+    user.backend = backend_path
+    return user
+
+
+def get_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = load_user(request)
+    return request._cached_user
+
+
+async def auser(request):
+    return await sync_to_async(get_user)(request)
+
+
+class CachedUserMiddleware(AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware без двух запросов на каждую страницу: пользователь и его
+    профиль (аватар в шапке, id для лайков) читаются из кеша (questions.cache.get_user_with_profile).
+    Сессия при этом может лежать в базе, в cached_db или в подписанной cookie (SESSION_BACKEND).
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(partial(get_user, request))
+        request.auser = partial(auser, request)
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Question = apps.get_model('questions', 'Question')
+    Answer = apps.get_model('questions', 'Answer')
+    QuestionLike = apps.get_model('questions', 'QuestionLike')
+    AnswerLike = apps.get_model('questions', 'AnswerLike')
+
+    def count_of(model, field):
+        rows = (
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    Question.objects.update(
+        likes_count=count_of(QuestionLike, 'question'),
+        answers_count=count_of(Answer, 'question'),
+    )
+    Answer.objects.update(likes_count=count_of(AnswerLike, 'answer'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0004_alter_answer_is_correct_alter_profile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:09
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_hot_scores(apps, schema_editor):
+    # та же формула, что и в QuestionManager.rebuild_hot_scores
+    Question = apps.get_model('questions', 'Question')
+    now = timezone.now()
+    batch = []
+    rows = Question.objects.order_by().values_list('id', 'created_at', 'likes_count', 'answers_count')
+    for question_id, created_at, likes, answers in rows.iterator(chunk_size=2000):
+        age_hours = (now - created_at).total_seconds() / 3600
+        score = (1.0 + likes + 2.0 * answers) * 0.5 ** (age_hours / 24)
+        batch.append(Question(id=question_id, hot_score=score if score >= 0.001 else 0.0))
+        if len(batch) >= 2000:
+            Question.objects.bulk_update(batch, ['hot_score'])
+            batch = []
+    Question.objects.bulk_update(batch, ['hot_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0005_question_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='hot_score',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+        ),
+        migrations.RunPython(fill_hot_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from questions.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    # search_vector (PostgreSQL) и FTS5-таблица (SQLite) живут вне модели Question,
+    # см. questions/search.py
+
+    dependencies = [
+        ('questions', '0006_question_hot_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_question_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-is_correct', '-created_at', 'id'], name='answer_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_new_idx'),
+        ),
+        # by_tag: tag_id -> question_id прямо из индекса, без обращения к строкам таблицы связей.
+        # Таблица создаётся ManyToManyField автоматически, поэтому индекс задан SQL.
+        migrations.RunSQL(
+            'CREATE INDEX question_tags_tag_question_idx ON questions_question_tags (tag_id, question_id)',
+            'DROP INDEX question_tags_tag_question_idx',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0009_profile_avatar_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='questions.question')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='questions.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['question', '-score', '-related'], name='related_question_idx')],
+                'constraints': [models.UniqueConstraint(fields=('question', 'related'), name='related_question_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0010_related_question'),
+    ]
+
+    operations = [
+        # сначала без умолчания: существующие лайки остаются NULL («ровесники вопроса»),
+        # а не получают время миграции; умолчание в базе — только для новых строк
+        migrations.AddField(
+            model_name='questionlike',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='questionlike',
+            name='created_at',
+            field=models.DateTimeField(null=True, db_default=Now()),
+        ),
+    ]
@@ -1,22 +1,105 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+from questions.search import SearchResults
+
+# Горячие вопросы: hot_score хранится в таблице и меняется инкрементально,
+# а периодический проход (manage.py update_hot_scores) экспоненциально его гасит.
+# Счёт — сумма весов вопроса, его ответов и лайков, каждый погашен со своего момента;
+# снятый лайк вычитает свой уже погашенный вес (по QuestionLike.created_at), поэтому
+# инкрементальный счёт и полный пересчёт (rebuild_hot_scores) совпадают с точностью до
+# шага затухания: вклад, добавленный посреди периода, гасится за весь период, — до 3%
+# веса на клик при запуске раз в час. Накопленное расхождение убирает --rebuild раз в сутки.
+HOT_HALF_LIFE_HOURS = 24
+HOT_NEW_QUESTION_WEIGHT = 1.0
+HOT_LIKE_WEIGHT = 1.0
+HOT_ANSWER_WEIGHT = 2.0
+HOT_MIN_SCORE = 0.001
+
+
+def hot_decay_factor(hours):
+    return 0.5 ** (hours / HOT_HALF_LIFE_HOURS)
+
+
+def decayed_weight(weight, since, now):
+    """Вес, добавленный к hot_score в момент since, к моменту now."""
+    return weight * hot_decay_factor(max((now - since).total_seconds(), 0) / 3600)
 
 
 class QuestionManager(models.Manager):
+    def with_card_data(self):
+        # автор и его профиль одним JOIN; теги догружает {% question_cards %}
+        # одним запросом и только для карточек, которых нет в кеше
+        return self.get_queryset().select_related('user__user')
+
+    def touch(self, question_ids):
+        # меняет версию закешированных карточек (см. questions.cache.card_cache_key)
+        return self.filter(id__in=question_ids).update(updated_at=timezone.now())
+
     def by_tag(self, tag_name): 
-        return self.get_queryset().filter(tags__name=tag_name)
+        return self.with_card_data().filter(tags__name=tag_name).order_by('-created_at', '-id')
     
     def new(self):
-        return self.get_queryset().order_by('-created_at')
+        return self.with_card_data().order_by('-created_at', '-id')
     
     def hot(self):
-        return self.get_queryset().annotate(likes_count=models.Count('likes')).order_by('-likes_count')
+        return self.with_card_data().order_by('-hot_score', '-id')
+
+    def search(self, query):
+        return SearchResults(self.with_card_data(), query, connections[self.db])
+
+    def bump_hot_score(self, question_id, weight):
+        return self.filter(id=question_id).update(hot_score=Greatest(models.F('hot_score') + weight, 0.0))
+
+    def decay_hot_scores(self, hours):
+        """Гасит все ненулевые счёты за hours часов одним UPDATE; совсем малые обнуляет."""
+        factor = hot_decay_factor(hours)
+        return self.filter(hot_score__gt=0).update(hot_score=models.Case(
+            models.When(hot_score__lt=HOT_MIN_SCORE / factor, then=models.Value(0.0)),
+            default=models.F('hot_score') * factor,
+        ))
+
+    def rebuild_hot_scores(self, batch_size=2000):
+        """
+        Полный пересчёт по времени вопроса, его ответов и лайков — та же сумма, что копят
+        клики и ответы (после fill_db, миграции и для сброса накопленного расхождения).
+        Лайк без времени (поставлен до появления QuestionLike.created_at) считается ровесником вопроса.
+        """
+        now = timezone.now()
+        rows = self.order_by('id').values_list('id', 'created_at')
+        batch = {}
+        total = 0
+        for question_id, created_at in rows.iterator(chunk_size=batch_size):
+            batch[question_id] = created_at
+            if len(batch) >= batch_size:
+                total += self._rebuild_batch(batch, now)
+                batch = {}
+        if batch:
+            total += self._rebuild_batch(batch, now)
+        return total
+
+    def _rebuild_batch(self, created, now):
+        scores = {question_id: decayed_weight(HOT_NEW_QUESTION_WEIGHT, at, now) for question_id, at in created.items()}
+        for question_id, liked_at in QuestionLike.objects.filter(question_id__in=created).values_list(
+                'question_id', 'created_at'):
+            scores[question_id] += decayed_weight(HOT_LIKE_WEIGHT, liked_at or created[question_id], now)
+        for question_id, answered_at in Answer.objects.filter(question_id__in=created).values_list(
+                'question_id', 'created_at'):
+            scores[question_id] += decayed_weight(HOT_ANSWER_WEIGHT, answered_at, now)
+        self.bulk_update([
+            Question(id=question_id, hot_score=score if score >= HOT_MIN_SCORE else 0.0)
+            for question_id, score in scores.items()
+        ], ['hot_score'])
+        return len(scores)
 
 
 # 1. Profile
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(default='default.jpg', upload_to='profile_pics')
+    # хеш содержимого аватара, для которого готовы миниатюры (questions/avatars.py); пусто — ещё нет
+    avatar_hash = models.CharField(max_length=16, blank=True, default='')
 
     def __str__(self):
         return self.user.username
@@ -40,15 +123,24 @@ class Question(models.Model):
     tags = models.ManyToManyField(Tag, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # Денормализованные счётчики, обновляются вместе с лайками/ответами
+    likes_count = models.PositiveIntegerField(default=0)
+    answers_count = models.PositiveIntegerField(default=0)
+    hot_score = models.FloatField(default=HOT_NEW_QUESTION_WEIGHT)
     
     objects = QuestionManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-hot_score', '-id'], name='question_hot_idx'),
+            models.Index(fields=['-created_at', '-id'], name='question_new_idx'),
+        ]
+
     def __str__(self):
         return self.title
     def get_url(self):
         return f"/question/{self.id}/"
-    def likes_count(self):
-        return self.likes.count()
 
 
 
@@ -62,16 +154,24 @@ class Answer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    likes_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # список ответов на странице вопроса: ORDER BY -is_correct, -created_at, id
+            models.Index(fields=['question', '-is_correct', '-created_at', 'id'], name='answer_list_idx'),
+        ]
+
     def __str__(self):
         return self.text[:50]
-    def likes_count(self):
-        return self.likes.count()
 
 
 # 5. Лайки
 class QuestionLike(models.Model):
     user = models.ForeignKey(Profile, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='likes')
+    # снятый лайк вычитает из hot_score свой погашенный вес; NULL — лайк старше этого поля
+    created_at = models.DateTimeField(null=True, db_default=Now())
 
     class Meta:
         unique_together = ('user', 'question')
@@ -83,3 +183,19 @@ class AnswerLike(models.Model):
 
     class Meta:
         unique_together = ('user', 'answer')
+
+
+# 6. Похожие вопросы: заранее посчитанные соседи по общим тегам (questions/related.py)
+class RelatedQuestion(models.Model):
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'related'], name='related_question_unique'),
+        ]
+        indexes = [
+            # блок на странице вопроса: WHERE question_id = ? ORDER BY score DESC, related_id DESC LIMIT K
+            models.Index(fields=['question', '-score', '-related'], name='related_question_idx'),
+        ]
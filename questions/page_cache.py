@@ -0,0 +1,222 @@
+"""
+Кеш целых страниц для анонимных читателей.
+
+Каждая запись помечена суррогатными ключами ('feed:new', 'tag:python',
+'question:42', 'answer:7'). У ключа в кеше лежит счётчик версии; запись
+хранит версии на момент рендеринга и считается устаревшей, как только
+любой из её ключей сбросили (purge_surrogate_keys увеличивает счётчик).
+
+Пока один процесс перерисовывает устаревшую страницу (блокировка через
+cache.add), остальные отдают прежнюю версию, поэтому сброс популярной
+страницы не вызывает лавину одинаковых рендеров.
+"""
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+PAGE_CACHE_TIMEOUT = 60
+# столько ещё можно отдавать устаревшую страницу, пока её перерисовывают
+PAGE_CACHE_STALE_GRACE = 300
+PAGE_CACHE_LOCK_TIMEOUT = 10
+# сколько ждать чужого рендера, если отдать нечего (первый запрос после запуска)
+PAGE_CACHE_WAIT = 2.0
+PAGE_CACHE_WAIT_STEP = 0.05
+
+_stats = {'hits': 0, 'stale': 0, 'misses': 0, 'bypass': 0, 'purges': 0}
+
+
+def _hash(value):
+    return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def _version_key(surrogate_key):
+    return f'questions:surrogate:{_hash(surrogate_key)}'
+
+
+def add_surrogate_keys(request, *keys):
+    """Вызывается из view: какие данные попали на страницу."""
+    if not hasattr(request, 'surrogate_keys'):
+        request.surrogate_keys = set()
+    request.surrogate_keys.update(str(key) for key in keys)
+
+
+def purge_surrogate_keys(*keys):
+    """Сбросить все страницы с этими ключами — после коммита текущей транзакции."""
+    def purge():
+        for key in keys:
+            version_key = _version_key(key)
+            if not cache.add(version_key, 1, None):
+                try:
+                    cache.incr(version_key)
+                except ValueError:
+                    # ключ успел истечь/вытесниться между add и incr
+                    cache.set(version_key, 1, None)
+        _stats['purges'] += len(keys)
+
+    transaction.on_commit(purge)
+
+
+def _current_versions(keys):
+    found = cache.get_many([_version_key(key) for key in keys])
+    return {key: found.get(_version_key(key), 0) for key in keys}
+
+
+async def _acurrent_versions(keys):
+    found = await cache.aget_many([_version_key(key) for key in keys])
+    return {key: found.get(_version_key(key), 0) for key in keys}
+
+
+def _is_fresh(entry):
+    if time.time() - entry['stored_at'] > PAGE_CACHE_TIMEOUT:
+        return False
+    return _current_versions(entry['versions']) == entry['versions']
+
+
+async def _ais_fresh(entry):
+    if time.time() - entry['stored_at'] > PAGE_CACHE_TIMEOUT:
+        return False
+    return await _acurrent_versions(entry['versions']) == entry['versions']
+
+
+def _cacheable_request(request):
+    # у вошедших пользователей всегда есть cookie сессии; проверка cookie,
+    # а не request.user, не загружает сессию из базы
+    return request.method in ('GET', 'HEAD') and settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # страница содержит csrf-токен конкретного посетителя
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def _from_entry(entry, status):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for name, value in entry['headers']:
+        response[name] = value
+    response['X-Page-Cache'] = status
+    return response
+
+
+def _page_key(request):
+    return f'questions:page:{_hash(request.get_host() + request.get_full_path())}'
+
+
+def _entry(response, versions):
+    return {
+        'content': response.content,
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'versions': versions,
+        'stored_at': time.time(),
+    }
+
+
+def anonymous_page_cache(view):
+    if iscoroutinefunction(view):
+        return _async_page_cache(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            _stats['bypass'] += 1
+            response = view(request, *args, **kwargs)
+            response['X-Page-Cache'] = 'BYPASS'
+            return response
+
+        key = _page_key(request)
+        lock_key = f'{key}:lock'
+        entry = cache.get(key)
+        if entry is not None and _is_fresh(entry):
+            _stats['hits'] += 1
+            return _from_entry(entry, 'HIT')
+
+        locked = cache.add(lock_key, 1, PAGE_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            if entry is not None:
+                _stats['stale'] += 1
+                return _from_entry(entry, 'STALE')
+            deadline = time.monotonic() + PAGE_CACHE_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(PAGE_CACHE_WAIT_STEP)
+                entry = cache.get(key)
+                if entry is not None:
+                    _stats['hits'] += 1
+                    return _from_entry(entry, 'HIT')
+
+        _stats['misses'] += 1
+        try:
+            response = view(request, *args, **kwargs)
+            if _cacheable_response(request, response):
+                # ключи известны только после запросов view; сброс, пришедший во время
+                # рендеринга, проживёт не дольше PAGE_CACHE_TIMEOUT
+                versions = _current_versions(getattr(request, 'surrogate_keys', ()))
+                cache.set(key, _entry(response, versions), PAGE_CACHE_TIMEOUT + PAGE_CACHE_STALE_GRACE)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def _async_page_cache(view):
+    """То же для async-view (questions/async_views.py): кеш через a*-методы, ожидание — asyncio.sleep."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            _stats['bypass'] += 1
+            response = await view(request, *args, **kwargs)
+            response['X-Page-Cache'] = 'BYPASS'
+            return response
+
+        key = _page_key(request)
+        lock_key = f'{key}:lock'
+        entry = await cache.aget(key)
+        if entry is not None and await _ais_fresh(entry):
+            _stats['hits'] += 1
+            return _from_entry(entry, 'HIT')
+
+        locked = await cache.aadd(lock_key, 1, PAGE_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            if entry is not None:
+                _stats['stale'] += 1
+                return _from_entry(entry, 'STALE')
+            deadline = time.monotonic() + PAGE_CACHE_WAIT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(PAGE_CACHE_WAIT_STEP)
+                entry = await cache.aget(key)
+                if entry is not None:
+                    _stats['hits'] += 1
+                    return _from_entry(entry, 'HIT')
+
+        _stats['misses'] += 1
+        try:
+            response = await view(request, *args, **kwargs)
+            if _cacheable_response(request, response):
+                versions = await _acurrent_versions(getattr(request, 'surrogate_keys', ()))
+                await cache.aset(key, _entry(response, versions), PAGE_CACHE_TIMEOUT + PAGE_CACHE_STALE_GRACE)
+        finally:
+            if locked:
+                await cache.adelete(lock_key)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def page_cache_stats():
+    return dict(_stats)
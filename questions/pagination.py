@@ -0,0 +1,159 @@
+import datetime
+import json
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+CURSOR_SALT = 'questions.pagination.cursor'
+
+
+def _encode_value(value):
+    # полная точность: DjangoJSONEncoder обрезает микросекунды, и курсор перестаёт совпадать
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+class CursorSerializer:
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), default=_encode_value).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+class CursorPage:
+    """Страница keyset-пагинации: без COUNT(*) и OFFSET, переходы по ?after= / ?before=."""
+
+    def __init__(self, object_list, params, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.params = params
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _query(self, key, cursor):
+        params = self.params.copy()
+        for name in ('page', 'after', 'before'):
+            params.pop(name, None)
+        params[key] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.previous_cursor)
+
+
+def encode_cursor(obj, ordering):
+    values = [getattr(obj, name.lstrip('-')) for name in ordering]
+    return signing.dumps(values, salt=CURSOR_SALT, serializer=CursorSerializer, compress=True)
+
+
+def decode_cursor(token, model, ordering):
+    try:
+        values = signing.loads(token, salt=CURSOR_SALT, serializer=CursorSerializer)
+    except (signing.BadSignature, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    fields = [model._meta.get_field(name.lstrip('-')) for name in ordering]
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except ValidationError:
+        return None
+
+
+def keyset_filter(ordering, values, backwards=False):
+    """(a, b, c) > (x, y, z) в терминах ORDER BY, с учётом направления каждого поля."""
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        descending = name.startswith('-') != backwards
+        lookup = 'lt' if descending else 'gt'
+        condition |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    if len(ordering) > 1:
+        # избыточное a <= x (или >=) превращает OR в один проход по диапазону индекса,
+        # без него SQLite/PostgreSQL склеивают несколько поисков и сортируют результат
+        field = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-') != backwards
+        condition = Q(**{f"{field}__{'lte' if descending else 'gte'}": values[0]}) & condition
+    return condition
+
+
+def reverse_ordering(ordering):
+    return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+
+def _cursor_query(queryset, request, ordering, per_page):
+    """Запрос строк страницы и функция, собирающая из них CursorPage."""
+    model = queryset.model
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    if before:
+        values = decode_cursor(before, model, ordering)
+        if values is not None:
+            def backward_page(rows):
+                has_previous = len(rows) > per_page
+                rows = rows[:per_page][::-1]
+                return CursorPage(
+                    rows,
+                    request.GET,
+                    next_cursor=encode_cursor(rows[-1], ordering) if rows else None,
+                    previous_cursor=encode_cursor(rows[0], ordering) if rows and has_previous else None,
+                )
+
+            rows = (
+                queryset.filter(keyset_filter(ordering, values, backwards=True))
+                .order_by(*reverse_ordering(ordering))[:per_page + 1]
+            )
+            return rows, backward_page
+
+    values = decode_cursor(after, model, ordering) if after else None
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+
+    def forward_page(rows):
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        return CursorPage(
+            rows,
+            request.GET,
+            next_cursor=encode_cursor(rows[-1], ordering) if rows and has_next else None,
+            previous_cursor=encode_cursor(rows[0], ordering) if rows and values is not None else None,
+        )
+
+    return queryset.order_by(*ordering)[:per_page + 1], forward_page
+
+
+def paginate_cursor(queryset, request, ordering, per_page=10):
+    """Keyset-пагинация по (ordering..., id): стоимость страницы не зависит от её номера."""
+    rows, page = _cursor_query(queryset, request, ordering, per_page)
+    return page(list(rows))
+
+
+async def apaginate_cursor(queryset, request, ordering, per_page=10):
+    """paginate_cursor для асинхронных view."""
+    rows, page = _cursor_query(queryset, request, ordering, per_page)
+    return page([row async for row in rows])
@@ -0,0 +1,272 @@
+"""
+Похожие вопросы на странице вопроса: top-K соседей по общим тегам.
+
+Сходство — косинус векторов тегов, где вес тега — обратная частота
+idf = log(N / df): общий редкий тег значит больше, чем общий популярный.
+Соседи считаются заранее (python manage.py build_related) и лежат
+в RelatedQuestion; страница читает их одним запросом по индексу
+(question, -score, -related).
+
+Считается без матриц, по обратным спискам тег -> вопросы: кандидаты
+вопроса — вопросы из списков его тегов, вес пары накапливается по тегам.
+Теги популярнее RELATED_MAX_POSTINGS вопросов кандидатов не порождают
+(их idf близок к нулю, а пар — квадрат частоты), но в сходство входят.
+Теги и списки лежат в плоских array, а build_all читает пары потоком и пишет
+соседей пачками: на 1M вопросов это десятки мегабайт, а не сотни.
+
+При назначении тегов (m2m_changed, attach_tags) после коммита id вопросов
+попадают в очередь; один фоновый поток забирает их пачками до RELATED_REFRESH_BATCH
+и refresh() пересчитывает списки этих вопросов и вставляет их в списки соседей —
+запрос, назначивший теги, этого не ждёт. idf остальных тегов при этом
+не пересчитывается (N берётся из кеша), веса выравнивает build_related.
+"""
+import heapq
+import logging
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, router, transaction
+from django.db.models import Count, F, Min, Window
+from django.db.models.functions import RowNumber
+from questions.models import Question, RelatedQuestion
+
+logger = logging.getLogger(__name__)
+
+RELATED_TOP_K = 5
+RELATED_MAX_POSTINGS = 2000
+BATCH_SIZE = 5000
+RELATED_REFRESH_BATCH = 500
+# N для idf: точное значение не важно, а count(*) — проход по всей таблице
+RELATED_TOTAL_KEY = 'questions:related:total'
+RELATED_TOTAL_SECONDS = 60 * 60
+
+QuestionTag = Question.tags.through
+
+
+class TagIndex:
+    """
+    Теги вопросов в плоских массивах: ids — id вопросов по возрастанию, теги вопроса ids[i] —
+    tags[offsets[i]:offsets[i + 1]]; postings — тег -> позиции вопросов (кроме популярных тегов).
+    df — число вопросов тега во всей базе, а не только в pairs.
+    """
+
+    def __init__(self, pairs, df, total):
+        """pairs — (id вопроса, id тега) по возрастанию id вопроса, без повторов."""
+        self.ids = array('q')
+        self.offsets = array('q', [0])
+        self.tags = array('q')
+        self.postings = defaultdict(partial(array, 'q'))
+        for question_id, tag_id in pairs:
+            if not self.ids or self.ids[-1] != question_id:
+                if self.ids:
+                    self.offsets.append(len(self.tags))
+                self.ids.append(question_id)
+            self.tags.append(tag_id)
+            if df.get(tag_id, 0) <= RELATED_MAX_POSTINGS:
+                self.postings[tag_id].append(len(self.ids) - 1)
+        if self.ids:
+            self.offsets.append(len(self.tags))
+        self.df = df
+        self.weight = {tag: math.log(total / count) ** 2 for tag, count in df.items() if count}
+        self.norms = array('d', (
+            math.sqrt(sum(self.weight.get(tag, 0) for tag in self.tags_at(i))) for i in range(len(self.ids))
+        ))
+
+    def tags_at(self, i):
+        return self.tags[self.offsets[i]:self.offsets[i + 1]]
+
+    def position(self, question_id):
+        i = bisect_left(self.ids, question_id)
+        return i if i < len(self.ids) and self.ids[i] == question_id else None
+
+    def scores(self, question_id):
+        """{сосед: косинус} для всех вопросов с общим тегом (не слишком популярным)."""
+        i = self.position(question_id)
+        if i is None or not self.norms[i]:
+            return {}
+        shared = Counter()
+        popular = []
+        for tag in self.tags_at(i):
+            if self.df.get(tag, 0) > RELATED_MAX_POSTINGS:
+                popular.append(tag)
+                continue
+            weight = self.weight.get(tag, 0)
+            for other in self.postings[tag]:
+                shared[other] += weight
+        shared.pop(i, None)
+        for tag in popular:
+            weight = self.weight.get(tag, 0)
+            for other in shared:
+                if tag in self.tags_at(other):
+                    shared[other] += weight
+        norm = self.norms[i]
+        return {self.ids[other]: weight / (norm * self.norms[other]) for other, weight in shared.items() if weight > 0}
+
+    def neighbours(self, question_id, k=RELATED_TOP_K):
+        """[(счёт, id соседа)] по убыванию; при равном счёте — более новые вопросы."""
+        scores = self.scores(question_id)
+        return heapq.nlargest(k, ((score, other) for other, score in scores.items()))
+
+
+def _tag_counts(tag_ids=None):
+    links = QuestionTag.objects.all() if tag_ids is None else QuestionTag.objects.filter(tag_id__in=tag_ids)
+    return dict(links.values('tag_id').annotate(count=Count('question_id')).values_list('tag_id', 'count'))
+
+
+def _total_questions():
+    return cache.get_or_set(RELATED_TOTAL_KEY, Question.objects.count, RELATED_TOTAL_SECONDS)
+
+
+def build_all(k=RELATED_TOP_K):
+    """Пересчитывает всю таблицу RelatedQuestion; возвращает число записанных пар."""
+    total = Question.objects.count()
+    cache.set(RELATED_TOTAL_KEY, total, RELATED_TOTAL_SECONDS)
+    pairs = QuestionTag.objects.order_by('question_id', 'tag_id').values_list('question_id', 'tag_id')
+    index = TagIndex(pairs.iterator(chunk_size=BATCH_SIZE), _tag_counts(), total)
+    written = 0
+    with transaction.atomic(using=router.db_for_write(RelatedQuestion)):
+        RelatedQuestion.objects.all().delete()
+        batch = []
+        for question_id in index.ids:
+            batch += [
+                RelatedQuestion(question_id=question_id, related_id=other, score=score)
+                for score, other in index.neighbours(question_id, k)
+            ]
+            if len(batch) >= BATCH_SIZE:
+                RelatedQuestion.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        RelatedQuestion.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def refresh(question_ids, k=RELATED_TOP_K):
+    """Списки вопросов question_ids заново и их место в списках соседей."""
+    question_ids = set(question_ids)
+    own = list(QuestionTag.objects.filter(question_id__in=question_ids).values_list('question_id', 'tag_id'))
+    df = _tag_counts({tag_id for _, tag_id in own})
+    rare = [tag_id for tag_id, count in df.items() if count <= RELATED_MAX_POSTINGS]
+    candidates = QuestionTag.objects.filter(tag_id__in=rare).values('question_id')
+    pairs = own + list(QuestionTag.objects.filter(question_id__in=candidates).values_list('question_id', 'tag_id'))
+    df.update(_tag_counts({tag_id for _, tag_id in pairs} - df.keys()))
+    index = TagIndex(sorted(set(pairs)), df, _total_questions())
+
+    links = {}
+    incoming = defaultdict(dict)
+    for question_id in question_ids:
+        scores = index.scores(question_id)
+        for score, other in heapq.nlargest(k, ((score, other) for other, score in scores.items())):
+            links[(question_id, other)] = score
+        # косинус симметричен: вопрос может войти в списки всех своих кандидатов
+        for other, score in scores.items():
+            if other not in question_ids:
+                incoming[other][question_id] = score
+
+    with transaction.atomic(using=router.db_for_write(RelatedQuestion)):
+        RelatedQuestion.objects.filter(question_id__in=question_ids).delete()
+        # старые ссылки на эти вопросы: общие теги могли пропасть
+        RelatedQuestion.objects.filter(related_id__in=question_ids).delete()
+        lists = {
+            row['question_id']: (row['count'], row['lowest'])
+            for row in RelatedQuestion.objects.filter(question_id__in=incoming).values('question_id')
+            .annotate(count=Count('id'), lowest=Min('score'))
+        }
+        touched = set()
+        for other, scores in incoming.items():
+            count, lowest = lists.get(other, (0, 0))
+            for question_id, score in scores.items():
+                if count < k or score > lowest:
+                    links[(other, question_id)] = score
+                    touched.add(other)
+        RelatedQuestion.objects.bulk_create([
+            RelatedQuestion(question_id=question_id, related_id=other, score=score)
+            for (question_id, other), score in links.items()
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+        if touched:
+            _trim(touched, k)
+    return len(links)
+
+
+def _trim(question_ids, k):
+    """Оставляет в списках вопросов только k лучших соседей."""
+    ranked = RelatedQuestion.objects.filter(question_id__in=question_ids).annotate(
+        rank=Window(RowNumber(), partition_by=[F('question_id')], order_by=[F('score').desc(), F('related_id').desc()]),
+    ).filter(rank__gt=k)
+    RelatedQuestion.objects.filter(id__in=list(ranked.values_list('id', flat=True))).delete()
+
+
+def _refresh_quietly(question_ids):
+    try:
+        refresh(question_ids)
+    except Exception:
+        # похожие вопросы — не повод ронять уже выполненный запрос; build_related всё поправит
+        logger.exception('related questions refresh failed for %s', sorted(question_ids)[:10])
+
+
+_pending = set()
+_pending_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # один поток: пачки не пересчитывают одни и те же списки параллельно
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='related')
+        return _executor
+
+
+def _drain():
+    """Пересчитывает накопленные вопросы пачками, пока очередь не опустеет."""
+    while True:
+        with _pending_lock:
+            batch = set(islice(_pending, RELATED_REFRESH_BATCH))
+            _pending.difference_update(batch)
+        if not batch:
+            return
+        _refresh_quietly(batch)
+
+
+def _drain_in_worker():
+    # у потока пула свои соединения с БД: закрываем их, как это делает обработчик запроса
+    close_old_connections()
+    try:
+        _drain()
+    finally:
+        close_old_connections()
+
+
+def _enqueue(question_ids):
+    if getattr(settings, 'RELATED_REFRESH_SYNC', False):
+        _refresh_quietly(question_ids)
+        return
+    with _pending_lock:
+        # поток уже запущен, если очередь не пуста: он заберёт и эти вопросы
+        idle = not _pending
+        _pending.update(question_ids)
+    if idle:
+        _get_executor().submit(_drain_in_worker)
+
+
+def schedule_refresh(question_ids):
+    """После коммита: теги вопросов изменились, списки пересчитает фоновый поток."""
+    question_ids = set(question_ids)
+    if question_ids:
+        transaction.on_commit(partial(_enqueue, question_ids))
+
+
+def related_questions(question_id, k=RELATED_TOP_K):
+    """Запрос блока «Похожие вопросы»: один проход по индексу related_question_idx."""
+    return (RelatedQuestion.objects.filter(question_id=question_id)
+            .select_related('related').only('related__id', 'related__title', 'related__answers_count')
+            .order_by('-score', '-related_id')[:k])
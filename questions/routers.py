@@ -0,0 +1,79 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+С реплик читаются только модели приложения questions (лента, теги, ответы)
+и только в GET/HEAD-запросах, которые ReplicaRoutingMiddleware разрешил.
+Сессии и пользователи, команды manage.py, транзакции и все запросы после
+записи идут в default. Пользователь, который только что что-то записал,
+получает cookie и следующие PRIMARY_PIN_SECONDS читает тоже из default —
+так он видит свой вопрос/ответ/лайк, даже если реплика отстаёт.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_APPS = {'questions'}
+
+
+class RoutingState:
+    def __init__(self, use_replicas=False):
+        self.use_replicas = use_replicas
+        self.replica = None
+        self.wrote = False
+
+
+# состояние текущего запроса; вне запросов (команды, shell) реплики не используются
+_state = ContextVar('questions_db_routing', default=None)
+
+
+def start_request(use_replicas):
+    return _state.set(RoutingState(use_replicas))
+
+
+def finish_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def pin_to_primary():
+    """Остаток текущего запроса читает из default."""
+    state = _state.get()
+    if state is not None:
+        state.use_replicas = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if (
+            state is None
+            or not state.use_replicas
+            or not replicas
+            or model._meta.app_label not in REPLICA_APPS
+            # внутри транзакции читаем то, что сами только что записали
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            # одна реплика на весь запрос: страница собрана из одного среза данных
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label in REPLICA_APPS:
+            state.wrote = True
+            state.use_replicas = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии default, объекты с любой из них можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема попадает на реплики через репликацию
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,177 @@
+"""
+Полнотекстовый поиск по вопросам.
+
+PostgreSQL: генерируемая колонка search_vector (tsvector) + GIN-индекс,
+обновляется самой базой при любом INSERT/UPDATE.
+SQLite: внешняя FTS5-таблица, которую поддерживают триггеры.
+Колонки/таблицы нет в модели Question, поэтому запросы написаны на SQL.
+"""
+import re
+
+from django.db.models import Q
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'questions_question_fts'
+# bm25/ts_rank считаются для каждой ранжируемой строки, поэтому ранжируются не больше
+# RANKED_RESULTS_LIMIT самых новых совпадений: для слов вроде «вопрос» — лучшие среди
+# 5000 последних вопросов с этим словом. Столько же показывает и счётчик («5000+»).
+RANKED_RESULTS_LIMIT = 5000
+
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE questions_question ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(text, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS question_search_idx ON questions_question USING GIN (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS question_search_idx",
+    "ALTER TABLE questions_question DROP COLUMN IF EXISTS search_vector",
+]
+
+# Триггеры пересоздаются после каждой миграции: SQLite теряет их,
+# когда schema editor пересобирает таблицу questions_question.
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON questions_question BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON questions_question BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, text ON questions_question BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END
+    """,
+]
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def install_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+            created = cursor.fetchone() is None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"title, text, content='questions_question', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            for sql in SQLITE_TRIGGERS:
+                cursor.execute(sql)
+            if created:
+                # совпадение в заголовке весит как 'A' против 'B' у PostgreSQL
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    statements = {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def fts5_query(query):
+    # каждое слово — отдельная фраза с префиксным поиском, операторы FTS5 из ввода не проходят
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+class SearchResults:
+    """
+    Ранжированная выдача, которую понимает django.core.paginator.Paginator:
+    count() и срез выполняют по одному запросу к индексу, а вопросы
+    потом загружаются по id вместе с авторами и тегами.
+    count() не больше RANKED_RESULTS_LIMIT; capped — совпадений было больше.
+    """
+
+    def __init__(self, queryset, query, connection):
+        self.queryset = queryset
+        self.query = query.strip()
+        self.connection = connection
+        self._count = None
+        self.capped = False
+
+    def _sql(self, select, order_and_limit=''):
+        vendor = self.connection.vendor
+        if vendor == 'postgresql':
+            return (
+                f"SELECT {select} FROM questions_question, websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS query "
+                f"WHERE search_vector @@ query {order_and_limit}",
+                [self.query],
+            )
+        if vendor == 'sqlite':
+            return (
+                f"SELECT {select} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {order_and_limit}",
+                [fts5_query(self.query)],
+            )
+        return None
+
+    def _has_terms(self):
+        return bool(re.search(r'\w', self.query))
+
+    def count(self):
+        if self._count is None:
+            self._count = 0
+            sql = self._sql('1', 'LIMIT %s')
+            if sql is None:
+                self._count = self._fallback().count()
+            elif self._has_terms():
+                # счёт останавливается на первой лишней строке, а не проходит все совпадения
+                query, params = sql
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM ({query}) AS matches', params + [RANKED_RESULTS_LIMIT + 1])
+                    found = cursor.fetchone()[0]
+                self.capped = found > RANKED_RESULTS_LIMIT
+                self._count = min(found, RANKED_RESULTS_LIMIT)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = min(item.stop if item.stop is not None else RANKED_RESULTS_LIMIT, RANKED_RESULTS_LIMIT)
+        # ранжируются самые новые RANKED_RESULTS_LIMIT совпадений (если их меньше — все)
+        if self.connection.vendor == 'postgresql':
+            key, rank = 'id', 'ts_rank_cd(search_vector, query) DESC'
+            sql = self._sql('id, search_vector, query', 'ORDER BY id DESC LIMIT %s')
+        else:
+            key, rank = 'rowid', 'rank'
+            sql = self._sql('rowid, rank', 'ORDER BY rowid DESC LIMIT %s')
+        if sql is None:
+            return list(self._fallback()[item])
+        if not self._has_terms() or start >= stop:
+            return []
+        query, params = sql
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {key} FROM ({query}) AS pool ORDER BY {rank}, {key} DESC LIMIT %s OFFSET %s',
+                params + [RANKED_RESULTS_LIMIT, stop - start, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        found = self.queryset.in_bulk(ids)
+        return [found[i] for i in ids if i in found]
+
+    def _fallback(self):
+        return self.queryset.filter(
+            Q(title__icontains=self.query) | Q(text__icontains=self.query)
+        ).order_by('-created_at', '-id')
@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from questions import like_buffer, live
+from questions.cache import invalidate_popular_tags
+from questions.liked import invalidate_liked
+from questions.models import (
+    Question, QuestionLike, Answer, AnswerLike, Tag, HOT_HALF_LIFE_HOURS, HOT_LIKE_WEIGHT, decayed_weight,
+)
+from questions.page_cache import purge_surrogate_keys
+from questions.related import schedule_refresh
+from questions.tag_suggest import invalidate_tag_suggest
+
+# PostgreSQL: снять или поставить лайк, поправить счётчик (и hot_score) и вернуть
+# новое значение одним запросом. Параллельные клики не задваивают лайк:
+# ON CONFLICT DO NOTHING, а счётчик меняется ровно на число реально изменённых строк.
+TOGGLE_SQL = """
+WITH deleted AS (
+    DELETE FROM {like_table} WHERE user_id = %(user)s AND {target_column} = %(target)s
+    RETURNING *
+), inserted AS (
+    INSERT INTO {like_table} (user_id, {target_column})
+    SELECT %(user)s, %(target)s WHERE NOT EXISTS (SELECT 1 FROM deleted)
+    ON CONFLICT (user_id, {target_column}) DO NOTHING
+    RETURNING 1
+), delta AS (
+    SELECT (SELECT count(*) FROM inserted) - (SELECT count(*) FROM deleted) AS value
+)
+UPDATE {target_table}
+SET likes_count = likes_count + (SELECT value FROM delta){extra_set}
+WHERE id = %(target)s
+RETURNING likes_count, NOT EXISTS (SELECT 1 FROM deleted), {question_column}
+"""
+# новый лайк добавляет полный вес, снятый — вычитает свой погашенный (models.decayed_weight);
+# лайк без времени считается ровесником вопроса, как в rebuild_hot_scores.
+# Степень в numeric и не больше 1000 периодов: float8 на исчезающе малых значениях падает с underflow
+HOT_SCORE_SET = """, hot_score = GREATEST(hot_score + %(weight)s * (
+    (SELECT count(*) FROM inserted) - COALESCE((
+        SELECT POWER(0.5, LEAST(
+            EXTRACT(EPOCH FROM now() - COALESCE(deleted.created_at, {target_table}.created_at)) / 3600 / %(half_life)s,
+            1000
+        ))::float8
+        FROM deleted
+    ), 0)
+), 0)"""
+
+
+def _toggle(like_model, target_model, target_field, profile_id, target_id, question_field, hot_weight=None):
+    """
+    Переключает лайк и возвращает (liked, likes_count, id вопроса); DoesNotExist, если цели нет.
+    question_field — поле цели с id вопроса, на странице которого виден счётчик.
+    """
+    connection = connections[router.db_for_write(target_model)]
+    with transaction.atomic(using=connection.alias):
+        if connection.vendor == 'postgresql':
+            sql = TOGGLE_SQL.format(
+                like_table=like_model._meta.db_table,
+                target_column=like_model._meta.get_field(target_field).column,
+                target_table=target_model._meta.db_table,
+                extra_set=HOT_SCORE_SET.format(target_table=target_model._meta.db_table) if hot_weight else '',
+                question_column=target_model._meta.get_field(question_field).column,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, {
+                    'user': profile_id, 'target': target_id, 'weight': hot_weight, 'half_life': HOT_HALF_LIFE_HOURS,
+                })
+                row = cursor.fetchone()
+            if row is None:
+                raise target_model.DoesNotExist
+            likes_count, liked, question_id = row
+            return liked, likes_count, question_id
+
+        # Остальные базы: те же шаги отдельными запросами внутри транзакции
+        lookup = {'user_id': profile_id, f'{target_field}_id': target_id}
+        targets = target_model.objects.filter(id=target_id)
+        hot_delta = hot_weight
+        if hot_weight:
+            liked_at = like_model.objects.filter(**lookup).values_list('created_at', flat=True).first()
+        deleted, _ = like_model.objects.filter(**lookup).delete()
+        if not deleted:
+            like_model.objects.bulk_create([like_model(**lookup)], ignore_conflicts=True)
+        elif hot_weight:
+            since = liked_at or targets.values_list('created_at', flat=True).first()
+            hot_delta = -decayed_weight(hot_weight, since, timezone.now()) if since else 0.0
+        delta = -1 if deleted else 1
+        changes = {'likes_count': F('likes_count') + delta}
+        if hot_weight:
+            changes['hot_score'] = Greatest(F('hot_score') + hot_delta, 0.0)
+        if not targets.update(**changes):
+            raise target_model.DoesNotExist
+        likes_count, question_id = targets.values_list('likes_count', question_field).get()
+        return not deleted, likes_count, question_id
+
+
+def toggle_question_like(profile_id, question_id):
+    if settings.LIKES_WRITE_BEHIND:
+        # страницы в кеше сбросит запись пачки (like_buffer.flush)
+        liked, likes, _ = like_buffer.toggle('question', profile_id, question_id)
+    else:
+        liked, likes, _ = _toggle(QuestionLike, Question, 'question', profile_id, question_id, 'id',
+                                  hot_weight=HOT_LIKE_WEIGHT)
+        purge_surrogate_keys(f'question:{question_id}')
+    invalidate_liked(profile_id)
+    live.publish(question_id, 'likes', target='question', id=question_id, likes=likes)
+    return liked, likes
+
+
+def toggle_answer_like(profile_id, answer_id):
+    if settings.LIKES_WRITE_BEHIND:
+        liked, likes, question_id = like_buffer.toggle('answer', profile_id, answer_id)
+    else:
+        liked, likes, question_id = _toggle(AnswerLike, Answer, 'answer', profile_id, answer_id, 'question')
+        purge_surrogate_keys(f'answer:{answer_id}')
+    invalidate_liked(profile_id)
+    live.publish(question_id, 'likes', target='answer', id=answer_id, likes=likes)
+    return liked, likes
+
+
+def upsert_tags(names):
+    """{имя: id} для всех имён одним INSERT ... ON CONFLICT (name) DO UPDATE ... RETURNING id."""
+    # одинаковый порядок блокировок строк у параллельных вставок: без взаимоблокировок
+    names = sorted(set(names))
+    if not names:
+        return {}
+    tags = Tag.objects.bulk_create(
+        [Tag(name=name) for name in names],
+        update_conflicts=True, unique_fields=['name'], update_fields=['name'],
+    )
+    if any(tag.pk is None for tag in tags):
+        # базы без RETURNING для upsert
+        return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+    return {tag.name: tag.pk for tag in tags}
+
+
+def attach_tags(tags_by_question):
+    """
+    {id вопроса: [имена тегов]} -> связи вопрос-тег одной вставкой.
+    bulk_create не отправляет m2m_changed, поэтому кеши сбрасываются и похожие вопросы пересчитываются здесь же.
+    """
+    tag_ids = upsert_tags(name for names in tags_by_question.values() for name in names)
+    through = Question.tags.through
+    through.objects.bulk_create([
+        through(question_id=question_id, tag_id=tag_ids[name])
+        for question_id, names in tags_by_question.items()
+        for name in set(names)
+    ], ignore_conflicts=True)
+    if tag_ids:
+        invalidate_popular_tags()
+        invalidate_tag_suggest()
+        purge_surrogate_keys(*(f'tag:{name}' for name in tag_ids))
+        schedule_refresh(tags_by_question)
+    return tag_ids
+
+
+def create_questions(profile, items):
+    """
+    Пакетное создание вопросов: items — [{'title', 'text', 'tags': [имена]}].
+    Все теги одним upsert, вопросы одним bulk_create, связи одной вставкой — в одной транзакции.
+    """
+    with transaction.atomic(using=router.db_for_write(Question)):
+        questions = Question.objects.bulk_create([
+            Question(title=item['title'], text=item['text'], user=profile) for item in items
+        ])
+        attach_tags({question.id: item['tags'] for question, item in zip(questions, items)})
+        purge_surrogate_keys('feed:new', 'feed:hot')
+    return questions
\ No newline at end of file
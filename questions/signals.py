@@ -0,0 +1,82 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from questions import metrics
+from questions.cache import invalidate_popular_tags, invalidate_user
+from questions.page_cache import purge_surrogate_keys
+from questions.related import schedule_refresh
+from questions.search import install_search_index
+from questions.tag_suggest import invalidate_tag_suggest
+from questions.models import Profile, Question, Tag
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_popular_tags()
+        invalidate_tag_suggest()
+    # после clear уже не узнать, какие связи были, поэтому для него — pre_clear
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        tag_names = [instance.name]
+        question_ids = list(pk_set if action != 'pre_clear' else instance.question_set.values_list('id', flat=True))
+    else:
+        tags = instance.tags.all() if action == 'pre_clear' else Tag.objects.filter(pk__in=pk_set)
+        tag_names = list(tags.values_list('name', flat=True))
+        question_ids = [instance.pk]
+
+    # теги видны на карточке вопроса и на страницах тегов
+    Question.objects.touch(question_ids)
+    purge_surrogate_keys(*(f'tag:{name}' for name in tag_names), *(f'question:{pk}' for pk in question_ids))
+    # похожие вопросы пересчитываются после коммита, когда связи (и после pre_clear) уже изменены
+    schedule_refresh(question_ids)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    invalidate_tag_suggest()
+    if not created:
+        Question.objects.touch(instance.question_set.values('id'))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    Question.objects.touch(instance.question_set.values('id'))
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Tag)
+def tagged_object_deleted(sender, **kwargs):
+    invalidate_popular_tags()
+    invalidate_tag_suggest()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # настройки, смена пароля (новый хеш сессии), last_login при входе
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    # SQLite теряет триггеры FTS при пересборке таблицы в миграциях
+    connection = connections[using]
+    if sender.name == 'questions' and 'questions_question' in connection.introspection.table_names():
+        install_search_index(connection)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    metrics.count_connect(connection.alias)
+
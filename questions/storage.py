@@ -0,0 +1,98 @@
+"""
+Статика с хешем содержимого в имени (bootstrap.min.3f2a….css) и заранее
+сжатыми копиями рядом: .gz всегда, .br — если установлен пакет brotli.
+
+collectstatic один раз сжимает файлы с максимальной степенью; при отдаче
+(views.static_files) остаётся выбрать готовый вариант по Accept-Encoding.
+"""
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.functional import cached_property
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.html', '.xml')
+# мельче этого выигрыш не окупает лишний файл
+MIN_COMPRESS_SIZE = 512
+
+
+def _gzip(data):
+    # mtime=0: одинаковый вход даёт одинаковый .gz при каждом collectstatic
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+# Content-Encoding -> (суффикс файла, функция сжатия); порядок — предпочтение при отдаче
+ENCODINGS = {'br': ('.br', _brotli if brotli else None), 'gzip': ('.gz', _gzip)}
+
+
+def _without_sourcemaps(patterns):
+    return tuple(
+        (extension, tuple(p for p in rules if 'sourceMappingURL' not in (p if isinstance(p, str) else p[0])))
+        for extension, rules in patterns
+    )
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # сторонние файлы (bootstrap.min.*) лежат как у апстрима, со ссылками на .map, которых мы не поставляем:
+    # ссылки на sourcemap не переписываются, иначе collectstatic падает на отсутствующем файле
+    patterns = _without_sourcemaps(ManifestStaticFilesStorage.patterns)
+
+    def stored_name(self, name):
+        # collectstatic ещё не запускали: ссылки на файлы без хеша — только при разработке и в тестах,
+        # в продакшене забытый collectstatic — ошибка (ValueError), а не статика без хеша и кеша
+        if not self.hashed_files and settings.STATICFILES_UNHASHED_FALLBACK:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        self.__dict__.pop('immutable_names', None)
+        for original, name in sorted(self.hashed_files.items()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                for compressed in self.compress(name):
+                    yield original, compressed, True
+
+    def compress(self, name):
+        """Пишет сжатые копии файла; возвращает их имена."""
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+        written = []
+        for suffix, compressor in ENCODINGS.values():
+            if compressor is None:
+                continue
+            compressed = compressor(data)
+            if len(compressed) >= len(data):
+                continue
+            path = self.path(name + suffix)
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            written.append(name + suffix)
+        return written
+
+    @cached_property
+    def immutable_names(self):
+        """Файлы с хешем в имени: их содержимое никогда не меняется."""
+        return set(self.hashed_files.values())
+
+    def is_immutable(self, name):
+        return name in self.immutable_names
+
+    def compressed_variant(self, name, accepted):
+        """(путь, Content-Encoding) лучшего готового варианта для клиента; None — отдать как есть."""
+        for encoding, (suffix, _) in ENCODINGS.items():
+            if encoding in accepted and self.exists(name + suffix):
+                return self.path(name + suffix), encoding
+        return None
@@ -0,0 +1,182 @@
+"""
+Подсказки тегов для формы вопроса: /tags/suggest/?prefix=dj -> самые популярные теги с этим началом.
+
+Индекс живёт в памяти процесса и на запрос не ходит ни в базу, ни в кеш:
+  * имена отсортированы без учёта регистра и лежат одной строкой байтов
+    со смещениями в array — на 1M тегов это десятки мегабайт, а не сотни,
+    как у списка str; диапазон префикса ищется bisect'ом (два раза по ~20 сравнений);
+  * число вопросов у тега — в array рядом с именами;
+  * для коротких префиксов с большим диапазоном (> SCAN_LIMIT тегов) лучшие
+    теги посчитаны при построении, для остальных диапазон просматривается целиком.
+
+Индекс строится при первом запросе процесса. Изменения тегов (invalidate_tag_suggest)
+увеличивают версию в общем кеше; процесс сверяет её не чаще раза в SUGGEST_CHECK_SECONDS
+и перестраивает индекс в фоновом потоке не чаще раза в SUGGEST_MIN_REFRESH_SECONDS —
+до конца перестроения запросы отвечает прежний индекс.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count
+from questions.models import Tag
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 10
+SCAN_LIMIT = 256
+SUGGEST_VERSION_KEY = 'questions:tag_suggest:version'
+SUGGEST_CHECK_SECONDS = 5
+SUGGEST_MIN_REFRESH_SECONDS = 60
+
+
+class Names:
+    """Последовательность имён поверх одной строки байтов: для bisect хватает __len__ и __getitem__."""
+
+    def __init__(self, names):
+        encoded = [name.encode() for name in names]
+        self.blob = b''.join(encoded)
+        self.offsets = array('L', [0])
+        for name in encoded:
+            self.offsets.append(self.offsets[-1] + len(name))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode()
+
+    def nbytes(self):
+        return len(self.blob) + self.offsets.itemsize * len(self.offsets)
+
+
+class TagSuggestIndex:
+    def __init__(self, rows):
+        """rows — [(имя, число вопросов)]."""
+        rows = sorted(rows, key=lambda row: (row[0].lower(), row[0]))
+        self.names = Names(name for name, _ in rows)
+        self.counts = array('L', (count for _, count in rows))
+        # префикс (в нижнем регистре) -> индексы лучших тегов, только для широких диапазонов;
+        # имена в нижнем регистре нужны только на время построения
+        self.top = {}
+        self._precompute([name.lower() for name, _ in rows], 0, len(rows), '')
+
+    def _best(self, lo, hi, limit):
+        counts = self.counts
+        return heapq.nlargest(limit, range(lo, hi), key=lambda i: (counts[i], -i))
+
+    def _precompute(self, keys, lo, hi, prefix):
+        if hi - lo <= SCAN_LIMIT:
+            return
+        self.top[prefix] = tuple(self._best(lo, hi, SUGGEST_LIMIT))
+        depth = len(prefix) + 1
+        start = lo
+        current = keys[lo][:depth]
+        for i in range(lo + 1, hi):
+            key = keys[i][:depth]
+            if key != current:
+                # имя, совпадающее с самим префиксом, дальше не делится
+                if len(current) == depth:
+                    self._precompute(keys, start, i, current)
+                start, current = i, key
+        if len(current) == depth:
+            self._precompute(keys, start, hi, current)
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """[(имя, число вопросов)] по убыванию популярности, при равенстве — по алфавиту."""
+        prefix = prefix.lower()
+        limit = min(limit, SUGGEST_LIMIT)
+        lo = bisect_left(self.names, prefix, key=str.lower)
+        hi = bisect_right(self.names, prefix, lo=lo, key=lambda name: name.lower()[:len(prefix)])
+        top = self.top.get(prefix) if hi - lo > SCAN_LIMIT else None
+        best = top[:limit] if top is not None else self._best(lo, hi, limit)
+        return [(self.names[i], self.counts[i]) for i in best]
+
+    def __len__(self):
+        return len(self.counts)
+
+    def nbytes(self):
+        return self.names.nbytes() + self.counts.itemsize * len(self.counts)
+
+
+def tag_rows():
+    return Tag.objects.annotate(num_questions=Count('question')).values_list('name', 'num_questions').iterator()
+
+
+_index = None
+_lock = threading.Lock()
+_first_build_lock = threading.Lock()
+# версия в общем кеше, из которой построен индекс; когда её проверяли и когда строили
+_state = {'version': None, 'checked_at': 0.0, 'built_at': 0.0, 'refreshing': False}
+_stats = {'builds': 0, 'build_seconds': 0.0}
+
+
+def _current_version():
+    return cache.get(SUGGEST_VERSION_KEY, 0)
+
+
+def load():
+    """Строит индекс по базе и подменяет текущий; возвращает его."""
+    global _index
+    version = _current_version()
+    start = time.perf_counter()
+    index = TagSuggestIndex(tag_rows())
+    with _lock:
+        _index = index
+        _state.update(version=version, built_at=time.monotonic(), checked_at=time.monotonic())
+        _stats['builds'] += 1
+        _stats['build_seconds'] = time.perf_counter() - start
+    return index
+
+
+def _refresh_in_background():
+    close_old_connections()
+    try:
+        load()
+    except Exception:
+        logger.exception('tag suggest index refresh failed')
+    finally:
+        _state['refreshing'] = False
+        close_old_connections()
+
+
+def get_index():
+    """Индекс процесса: при первом вызове строится сразу, дальше обновляется в фоне."""
+    index = _index
+    if index is None:
+        with _first_build_lock:
+            if _index is None:
+                load()
+        return _index
+
+    now = time.monotonic()
+    if now - _state['checked_at'] >= SUGGEST_CHECK_SECONDS:
+        _state['checked_at'] = now
+        if (_current_version() != _state['version'] and not _state['refreshing']
+                and now - _state['built_at'] >= SUGGEST_MIN_REFRESH_SECONDS):
+            _state['refreshing'] = True
+            threading.Thread(target=_refresh_in_background, name='tag-suggest', daemon=True).start()
+    return index
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    return get_index().suggest(prefix, limit)
+
+
+def invalidate_tag_suggest():
+    """Теги или их связи изменились: индексы всех процессов перестроятся в фоне."""
+    if not cache.add(SUGGEST_VERSION_KEY, 1, None):
+        try:
+            cache.incr(SUGGEST_VERSION_KEY)
+        except ValueError:
+            cache.set(SUGGEST_VERSION_KEY, 1, None)
+
+
+def tag_suggest_stats():
+    return {**_stats, 'tags': len(_index) if _index is not None else 0,
+            'bytes': _index.nbytes() if _index is not None else 0}
@@ -0,0 +1,25 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        if request is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            # include/extends рендерятся внутри и отдельно не считаются
+            request.template_seconds = getattr(request, 'template_seconds', 0.0) + time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который копит время рендеринга в request.template_seconds (для PerformanceMiddleware)."""
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
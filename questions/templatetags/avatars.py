@@ -0,0 +1,35 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from questions.avatars import AVATAR_SIZES, has_custom_avatar, thumbnail_name
+
+register = template.Library()
+
+
+def _srcset(digest, size, extension):
+    urls = [f'{default_storage.url(thumbnail_name(digest, size, extension))} 1x']
+    retina = next((s for s in AVATAR_SIZES if s >= size * 2), None)
+    if retina:
+        urls.append(f'{default_storage.url(thumbnail_name(digest, retina, extension))} 2x')
+    return ', '.join(urls)
+
+
+@register.inclusion_tag('questions/blocks/avatar.html')
+def avatar(profile, size, css_class='img-fluid'):
+    """<picture> с миниатюрой нужного размера (WebP, иначе JPEG) и 2x-вариантом для плотных экранов."""
+    if size not in AVATAR_SIZES:
+        size = min((s for s in AVATAR_SIZES if s >= size), default=AVATAR_SIZES[-1])
+    context = {'size': size, 'css_class': css_class}
+    if profile is not None and profile.avatar_hash:
+        digest = profile.avatar_hash
+        context.update(
+            webp_srcset=_srcset(digest, size, 'webp'),
+            jpeg_srcset=_srcset(digest, size, 'jpg'),
+            src=default_storage.url(thumbnail_name(digest, size, 'jpg')),
+        )
+    elif profile is not None and has_custom_avatar(profile):
+        # миниатюры ещё строятся
+        context['src'] = profile.avatar.url
+    else:
+        context['src'] = static('questions/images/image.png')
+    return context
@@ -0,0 +1,46 @@
+from django import template
+from django.db.models import prefetch_related_objects
+from django.utils.safestring import mark_safe
+from questions.cache import get_cards, set_cards
+from questions.like_buffer import merge_pending
+from questions.liked import liked_loader
+
+register = template.Library()
+
+CARD_TEMPLATE = 'questions/blocks/question_card.html'
+LIKE_TEMPLATE = 'questions/blocks/question_like.html'
+LIKE_PLACEHOLDER = '<!--question-like-->'
+
+
+@register.simple_tag(takes_context=True)
+def question_cards(context, questions):
+    """
+    Лента карточек: готовый HTML берётся из кеша одним get_many, рендерятся
+    только недостающие карточки (и только для них загружаются теги).
+    Виджет лайков зависит от пользователя, поэтому вставляется при каждом показе.
+    """
+    questions = list(questions)
+    cards = get_cards(questions)
+    engine = context.template.engine
+
+    missing = [question for question in questions if question.id not in cards]
+    if missing:
+        prefetch_related_objects(missing, 'tags')
+        card_template = engine.get_template(CARD_TEMPLATE)
+        rendered = {}
+        for question in missing:
+            with context.push(q=question, like_widget=mark_safe(LIKE_PLACEHOLDER)):
+                rendered[question] = card_template.render(context)
+        set_cards(rendered)
+        cards.update((question.id, html) for question, html in rendered.items())
+
+    merge_pending('question', questions)
+    # состояние «лайкнуто мной» для всей ленты — одним запросом при первой проверке в виджете
+    liked_loader(context['request']).add('question', questions)
+    like_template = engine.get_template(LIKE_TEMPLATE)
+    html = []
+    for question in questions:
+        with context.push(q=question):
+            like_widget = like_template.render(context)
+        html.append(cards[question.id].replace(LIKE_PLACEHOLDER, like_widget, 1))
+    return mark_safe(''.join(html))
@@ -1,3 +1,1408 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from PIL import Image
+
+from questions import (
+    async_views, like_buffer, liked, live, metrics, page_cache, related, routers, tag_suggest, urls as question_urls,
+)
+from questions.cache import card_cache_stats, get_popular_tags, invalidate_popular_tags, popular_tags_stats
+from questions.forms import QuestionForm
+from questions.services import attach_tags, toggle_answer_like, toggle_question_like
+from questions.middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware
+from questions.management.commands.recount_counters import recount_counters
+from questions.models import (
+    Profile, Tag, Question, Answer, QuestionLike, AnswerLike, RelatedQuestion,
+    HOT_ANSWER_WEIGHT, HOT_HALF_LIFE_HOURS, HOT_LIKE_WEIGHT, HOT_MIN_SCORE, HOT_NEW_QUESTION_WEIGHT,
+)
+
+
+def seed(num_users=5, num_questions=25, answers_per_question=3):
+    users = [User.objects.create_user(f'user_{i}', f'user_{i}@example.com', 'test123') for i in range(num_users)]
+    profiles = [Profile.objects.create(user=user) for user in users]
+    tags = [Tag.objects.create(name=name) for name in ('python', 'django', 'sql')]
+
+    questions = []
+    for i in range(num_questions):
+        question = Question.objects.create(
+            title=f'Question number {i}',
+            text='Some question text long enough',
+            user=profiles[i % num_users],
+        )
+        question.tags.set(tags[:1 + i % len(tags)])
+        questions.append(question)
+
+    for question in questions:
+        for j in range(answers_per_question):
+            answer = Answer.objects.create(question=question, text=f'Answer {j}', user=profiles[j % num_users])
+            AnswerLike.objects.create(user=profiles[j % num_users], answer=answer)
+        QuestionLike.objects.create(user=profiles[0], question=question)
+    recount_counters()
+    return users, questions
+
+
+BULK_PAYLOAD = [
+    {'title': f'Imported question {i}', 'text': 'Imported from the old system', 'tags': ['python', f'import-{i}']}
+    for i in range(20)
+]
+
+
+class QueryBudgetTests(TestCase):
+    """Каждая страница укладывается в фиксированное число запросов, не зависящее от размера страницы."""
+
+    # url name -> (method, anonymous budget, authenticated budget)
+    # у вошедшего пользователя лайки страницы ещё не в кеше: +1 запрос на вид (questions/liked.py)
+    BUDGETS = {
+        'new_questions': ('get', 2, 6),
+        'hot_questions': ('get', 2, 6),
+        'tag': ('get', 2, 6),
+        'question': ('get', 4, 9),
+        'question_events': ('get', 0, 0),
+        'ask': ('get', None, 3),
+        'signup': ('get', 0, 3),
+        'login': ('get', 0, 3),
+        'settings': ('get', None, 3),
+        'logout': ('get', None, 4),
+        'like_question': ('post', None, 9),
+        'like_answer': ('post', None, 9),
+        'like_question_json': ('post', None, 9),
+        'like_answer_json': ('post', None, 9),
+        'search': ('get', 4, 7),
+        'tag_suggest': ('get', 0, 0),
+        'metrics': ('get', 0, 0),
+        'bulk_questions_json': ('post', None, 10),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed()
+        cls.question = cls.questions[-1]
+        cls.answer = cls.question.answer_set.first()
+
+    def setUp(self):
+        # бюджеты считаются для прогретого кеша тегов и индекса подсказок
+        cache.clear()
+        invalidate_popular_tags()
+        get_popular_tags()
+        tag_suggest.load()
+
+    def url_for(self, name):
+        kwargs = {
+            'question': {'question_id': self.question.id},
+            'question_events': {'question_id': self.question.id},
+            'like_question': {'question_id': self.question.id},
+            'like_answer': {'answer_id': self.answer.id},
+            'like_question_json': {'question_id': self.question.id},
+            'like_answer_json': {'answer_id': self.answer.id},
+            'tag': {'tag': 'python'},
+        }.get(name, {})
+        query = {'search': '?q=question', 'tag_suggest': '?prefix=py'}.get(name, '')
+        return reverse(f'questions:{name}', kwargs=kwargs) + query
+
+    def assert_budget(self, name, budget):
+        method, *_ = self.BUDGETS[name]
+        kwargs = {}
+        if name == 'bulk_questions_json':
+            kwargs = {'data': {'questions': BULK_PAYLOAD}, 'content_type': 'application/json'}
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(self.url_for(name), **kwargs)
+        self.assertIn(response.status_code, (200, 201, 204, 302))
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            f'{name}: {len(ctx.captured_queries)} queries, budget {budget}\n'
+            + '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+
+    def test_every_route_has_budget(self):
+        names = {pattern.name for pattern in question_urls.urlpatterns}
+        self.assertEqual(names - set(self.BUDGETS), set())
+
+    def test_anonymous_budgets(self):
+        for name, (_, budget, _) in self.BUDGETS.items():
+            if budget is not None:
+                with self.subTest(name=name):
+                    self.assert_budget(name, budget)
+
+    def test_authenticated_budgets(self):
+        for name, (_, _, budget) in self.BUDGETS.items():
+            with self.subTest(name=name):
+                self.client.force_login(self.users[1])
+                self.assert_budget(name, budget)
+
+    def test_budget_does_not_grow_with_page_size(self):
+        url = reverse('questions:new_questions')
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(url)
+        Question.objects.exclude(id__in=[q.id for q in self.questions[-2:]]).delete()
+        cache.clear()
+        get_popular_tags()
+        with CaptureQueriesContext(connection) as short_page:
+            self.client.get(url)
+        self.assertEqual(len(full_page.captured_queries), len(short_page.captured_queries))
+
+
+# URLconf со страницами чтения из async_views — как под ASGI (ROOT_URLCONF='questions.tests')
+urlpatterns = [path('', include((question_urls.build_urlpatterns(async_views), 'questions')))]
+
+
+@override_settings(ROOT_URLCONF='questions.tests')
+class AsyncQueryBudgetTests(QueryBudgetTests):
+    """Те же бюджеты для async-версий ленты, тегов и страницы вопроса."""
+
+    def test_views_are_async(self):
+        for name in ('new_questions', 'hot_questions', 'tag', 'question'):
+            match = self.client.get(self.url_for(name)).resolver_match
+            self.assertTrue(asyncio.iscoroutinefunction(match.func), name)
+
+    def test_answer_post(self):
+        self.client.force_login(self.users[1])
+        url = self.url_for('question')
+        response = self.client.post(url, {'text': 'An async answer long enough'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.question.answer_set.filter(text='An async answer long enough').exists())
+        self.assertEqual(self.client.post(url, {'text': 'short'}).status_code, 200)
+
+    async def test_asgi_request(self):
+        client = AsyncClient()
+        response = await client.get(self.url_for('question'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.question.title, response.content.decode())
+        # PerformanceMiddleware в асинхронной цепочке видит запросы async ORM
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+        self.assertEqual((await client.get('/question/999999/')).status_code, 404)
+
+
+class LikeToggleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=2, answers_per_question=1)
+        cls.question = cls.questions[0]
+        cls.answer = cls.question.answer_set.get()
+
+    def test_json_toggle_returns_state_and_count(self):
+        self.client.force_login(self.users[3])
+        url = reverse('questions:like_question_json', args=[self.question.id])
+        before = Question.objects.get(id=self.question.id).likes_count
+
+        self.assertEqual(self.client.post(url).json(), {'liked': True, 'likes': before + 1})
+        self.assertEqual(self.client.post(url).json(), {'liked': False, 'likes': before})
+        self.assertEqual(QuestionLike.objects.filter(question=self.question).count(), before)
+
+        url = reverse('questions:like_answer_json', args=[self.answer.id])
+        data = self.client.post(url).json()
+        self.assertTrue(data['liked'])
+        self.assertEqual(data['likes'], AnswerLike.objects.filter(answer=self.answer).count())
+
+    def test_json_errors(self):
+        url = reverse('questions:like_question_json', args=[self.question.id])
+        self.assertEqual(self.client.post(url).status_code, 401)
+        self.client.force_login(self.users[3])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        missing = reverse('questions:like_question_json', args=[10 ** 6])
+        self.assertEqual(self.client.post(missing).status_code, 404)
+        self.assertFalse(QuestionLike.objects.filter(question_id=10 ** 6).exists())
+
+
+class LikeWriteBehindMixin:
+    """Лайки через буфер: клик виден сразу, в таблицы попадает пачкой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=2, answers_per_question=1)
+        cls.question = cls.questions[0]
+        cls.answer = cls.question.answer_set.get()
+
+    def setUp(self):
+        cache.clear()
+        like_buffer.get_buffer.cache_clear()
+        self.addCleanup(like_buffer.get_buffer.cache_clear)
+
+    def click(self, user, name, target_id):
+        self.client.force_login(user)
+        return self.client.post(reverse(f'questions:{name}', args=[target_id])).json()
+
+    def test_clicks_are_buffered_and_flushed(self):
+        question = Question.objects.get(id=self.question.id)
+        answer_likes = Answer.objects.get(id=self.answer.id).likes_count
+        liker, other = self.users[3], self.users[4]
+
+        self.assertEqual(self.click(liker, 'like_question_json', question.id),
+                         {'liked': True, 'likes': question.likes_count + 1})
+        self.assertEqual(self.click(liker, 'like_question_json', question.id),
+                         {'liked': False, 'likes': question.likes_count})
+        self.assertEqual(self.click(liker, 'like_question_json', question.id),
+                         {'liked': True, 'likes': question.likes_count + 1})
+        self.assertEqual(self.click(other, 'like_question_json', question.id)['likes'], question.likes_count + 2)
+        self.assertEqual(self.click(other, 'like_answer_json', self.answer.id),
+                         {'liked': True, 'likes': answer_likes + 1})
+        # в базе пока ничего, но страницы уже показывают клики
+        self.assertFalse(QuestionLike.objects.filter(user__user__in=[liker, other], question=question).exists())
+        response = self.client.get(reverse('questions:question', args=[question.id]))
+        self.assertContains(response, f'value="{question.likes_count + 2}" data-likes="question-{question.id}"')
+        self.assertContains(response, f'value="{answer_likes + 1}" data-likes="answer-{self.answer.id}"')
+        # и отмечают их как лайкнутые этим пользователем
+        self.assertContains(response, f'data-likes="answer-{self.answer.id}" type="number" class="form-control border-primary"')
+        self.assertContains(response, f'data-likes="question-{question.id}" type="number" class="form-control border-primary"')
+
+        before = like_buffer.flush_stats()
+        self.assertEqual(like_buffer.flush_all(), 5)
+        after = like_buffer.flush_stats()
+        self.assertEqual((after['ops'] - before['ops'], after['rows'] - before['rows']), (5, 3))
+
+        question_after = Question.objects.get(id=question.id)
+        self.assertEqual(question_after.likes_count, question.likes_count + 2)
+        self.assertEqual(question_after.likes_count, QuestionLike.objects.filter(question=question).count())
+        self.assertAlmostEqual(question_after.hot_score, question.hot_score + 2 * HOT_LIKE_WEIGHT, places=3)
+        self.assertEqual(Answer.objects.get(id=self.answer.id).likes_count, answer_likes + 1)
+        self.assertEqual(like_buffer.get_buffer().pending_deltas('question', [question.id]), {})
+        # записанный клик остаётся отмеченным: в кеше лайков — состояние с учётом буфера, а не база до записи
+        response = self.client.get(reverse('questions:question', args=[question.id]))
+        self.assertContains(response, f'data-likes="answer-{self.answer.id}" type="number" class="form-control border-primary"')
+
+        # следующий клик переключает относительно уже записанного состояния
+        self.assertEqual(self.click(liker, 'like_question_json', question.id),
+                         {'liked': False, 'likes': question.likes_count + 1})
+        like_buffer.flush_all()
+        self.assertEqual(Question.objects.get(id=question.id).likes_count, question.likes_count + 1)
+        self.assertIn('questions_like_flush_batch_count', self.client.get(reverse('questions:metrics')).content.decode())
+
+    def test_missing_target(self):
+        self.client.force_login(self.users[3])
+        response = self.client.post(reverse('questions:like_question_json', args=[10 ** 6]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(like_buffer.flush_all(), 0)
+
+    def test_flush_between_read_and_toggle(self):
+        buffer = like_buffer.get_buffer()
+        liker = self.users[3]
+        before = Question.objects.get(id=self.question.id).likes_count
+        self.assertTrue(self.click(liker, 'like_question_json', self.question.id)['liked'])
+
+        def flush_then_toggle(*args):
+            # пачка записалась после того, как клик прочитал бы базу, но до переключения в буфере
+            like_buffer.flush_all()
+            return type(buffer).toggle(buffer, *args)
+
+        with mock.patch.object(buffer, 'toggle', flush_then_toggle):
+            self.assertEqual(self.click(liker, 'like_question_json', self.question.id),
+                             {'liked': False, 'likes': before})
+        like_buffer.flush_all()
+        self.assertEqual(Question.objects.get(id=self.question.id).likes_count, before)
+
+    def test_deleted_target_does_not_block_flushes(self):
+        answer = Answer.objects.create(question=self.question, user=self.users[0].profile, text='Deleted soon enough')
+        self.click(self.users[3], 'like_answer_json', answer.id)
+        answer.delete()
+        self.click(self.users[3], 'like_question_json', self.question.id)
+        with self.assertLogs('questions.like_buffer', 'WARNING'):
+            self.assertEqual(like_buffer.flush_all(), 2)
+        self.assertTrue(QuestionLike.objects.filter(user=self.users[3].profile, question=self.question).exists())
+
+    def test_failing_batch_is_dropped_after_retries(self):
+        self.click(self.users[3], 'like_question_json', self.question.id)
+        with mock.patch('questions.like_buffer.apply', side_effect=DatabaseError('down')):
+            for _ in range(like_buffer.FLUSH_ATTEMPTS - 1):
+                with self.assertRaises(DatabaseError):
+                    like_buffer.flush()
+            with self.assertRaises(DatabaseError), self.assertLogs('questions.like_buffer', 'ERROR'):
+                like_buffer.flush()
+        # пачка выброшена вместе с ожидающим счётчиком: следующие клики пишутся как обычно
+        self.assertEqual(like_buffer.flush_all(), 0)
+        self.assertEqual(like_buffer.get_buffer().pending_deltas('question', [self.question.id]), {})
+
+
+@override_settings(LIKES_WRITE_BEHIND=True, LIKES_FLUSH_MS=0)
+class LocalLikeBufferTests(LikeWriteBehindMixin, TestCase):
+    pass
+
+
+class SlowCache:
+    """Кеш, который задерживает чтение: гонка между чтением и записью становится воспроизводимой."""
+
+    def __getattr__(self, name):
+        return getattr(cache, name)
+
+    def get(self, *args, **kwargs):
+        value = cache.get(*args, **kwargs)
+        time.sleep(0.01)
+        return value
+
+
+@override_settings(LIKES_WRITE_BEHIND=True, LIKES_FLUSH_MS=0, LIKES_BUFFER='questions.like_buffer.CacheBuffer')
+class CacheLikeBufferTests(LikeWriteBehindMixin, TestCase):
+    def test_simultaneous_clicks_alternate(self):
+        buffer = like_buffer.get_buffer()
+        profile_id = self.users[3].profile.id
+        with mock.patch('questions.like_buffer.cache', SlowCache()), ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: buffer.toggle('question', profile_id, self.question.id, lambda: False), range(4)))
+        # клики одного пользователя по одной цели переключают по очереди, а не все в «лайкнуто»
+        self.assertEqual(sorted(liked for liked, _ in results), [False, False, True, True])
+        self.assertEqual(buffer.pending_states('question', profile_id, [self.question.id]), {self.question.id: False})
+        self.assertEqual(buffer.pending_deltas('question', [self.question.id]), {})
+
+
+class PopularTagsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=3, answers_per_question=0)
+
+    def setUp(self):
+        cache.clear()
+        invalidate_popular_tags()
+
+    def test_steady_state_costs_no_queries(self):
+        get_popular_tags()
+        before = popular_tags_stats()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('questions:login'))
+            get_popular_tags()
+        after = popular_tags_stats()
+        self.assertEqual(after['misses'], before['misses'])
+        self.assertGreater(after['memo_hits'], before['memo_hits'])
+
+    def test_saving_tags_invalidates(self):
+        self.assertNotIn('rust', [t.name for t in get_popular_tags()])
+        form = QuestionForm(
+            {'title': 'A brand new question', 'text': 'Question text that is long enough', 'tags': 'rust'},
+            user=self.users[0],
+        )
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertIn('rust', [t.name for t in get_popular_tags()])
+
+
+class TagSuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # python — у всех 12 вопросов, django — у 8, sql — у 4
+        cls.users, cls.questions = seed(num_questions=12, answers_per_question=0)
+        cls.questions[0].tags.add(Tag.objects.create(name='pydantic'))
+        Tag.objects.create(name='Pytest')
+
+    def setUp(self):
+        tag_suggest.load()
+
+    def suggest(self, prefix):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('questions:tag_suggest'), {'prefix': prefix})
+        return [(tag['name'], tag['questions']) for tag in response.json()['tags']]
+
+    def test_ranked_by_question_count_ignoring_case(self):
+        self.assertEqual(self.suggest('PY'), [('python', 12), ('pydantic', 1), ('Pytest', 0)])
+        self.assertEqual(self.suggest('dj'), [('django', 8)])
+        self.assertEqual(self.suggest('nothing'), [])
+        self.assertEqual(self.suggest('')[:2], [('python', 12), ('django', 8)])
+
+    def test_wide_prefixes_match_full_scan(self):
+        rows = [(f'{a}{b}{i}', (i * 7919) % 101) for a in 'ab' for b in 'xyz' for i in range(300)] + [('a', 5)]
+        index = tag_suggest.TagSuggestIndex(rows)
+        self.assertIn('ax', index.top)
+        for prefix in ('', 'a', 'ax', 'bz1', 'bz29', 'c'):
+            matches = sorted((row for row in rows if row[0].startswith(prefix)), key=lambda row: (-row[1], row[0]))
+            self.assertEqual(index.suggest(prefix), matches[:tag_suggest.SUGGEST_LIMIT], prefix)
+
+    def test_tag_changes_refresh_in_background(self):
+        self.questions[1].tags.add(Tag.objects.create(name='pyramid'))
+        # до перестроения отвечает прежний индекс, перестроение уходит в поток
+        self.assertNotIn('pyramid', dict(self.suggest('py')))
+        tag_suggest._state.update(checked_at=0.0, built_at=0.0)
+        with mock.patch.object(tag_suggest.threading, 'Thread') as thread:
+            tag_suggest.get_index()
+        self.assertIs(thread.call_args.kwargs['target'], tag_suggest._refresh_in_background)
+        tag_suggest.load()
+        self.assertIn(('pyramid', 1), self.suggest('py'))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, _ = seed(num_questions=0)
+        profile = cls.users[0].profile
+        cls.exact = Question.objects.create(title='Postgres index tuning', text='How to tune GIN indexes', user=profile)
+        cls.body = Question.objects.create(title='Slow queries', text='My postgres server is slow', user=profile)
+        cls.other = Question.objects.create(title='Django forms', text='Widgets and validation', user=profile)
+
+    def test_ranks_title_matches_first(self):
+        results = Question.objects.search('postgres')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual([q.id for q in results[:10]], [self.exact.id, self.body.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        Question.objects.filter(id=self.other.id).update(title='Postgres forms')
+        self.assertEqual(Question.objects.search('postgres').count(), 3)
+        self.exact.delete()
+        self.assertEqual(Question.objects.search('postgres').count(), 2)
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(Question.objects.search('postgres" (*').count(), 2)
+        self.assertEqual(Question.objects.search('  ').count(), 0)
+
+    def test_view_paginates_results(self):
+        response = self.client.get(reverse('questions:search'), {'q': 'postgres'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+        self.assertContains(response, 'Postgres index tuning')
+
+    def test_common_terms_rank_the_newest_matches(self):
+        profile = self.users[0].profile
+
+        def filler(i):
+            return Question.objects.create(title=f'Filler {i}', text='postgres mention', user=profile)
+
+        filler(0)
+        older = filler(1)
+        strong = Question.objects.create(title='Postgres vacuum', text='Postgres autovacuum tuning', user=profile)
+        newest = filler(2)
+        with mock.patch('questions.search.RANKED_RESULTS_LIMIT', 3):
+            results = Question.objects.search('postgres')
+            self.assertEqual((results.count(), results.capped), (3, True))
+            ids = [q.id for q in results[:10]]
+            # ранжируются три самых новых совпадения, первым — совпадение в заголовке, а не самое новое
+            self.assertEqual(ids[0], strong.id)
+            self.assertEqual(set(ids), {older.id, strong.id, newest.id})
+            self.assertNotIn(self.exact.id, ids)
+            response = self.client.get(reverse('questions:search'), {'q': 'postgres'})
+        self.assertContains(response, '3+ found')
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=25)
+
+    def setUp(self):
+        # все страницы обходятся с холодным кешем карточек и тёплым кешем тегов
+        cache.clear()
+        get_popular_tags()
+
+    def walk(self, url, direction='next', query=''):
+        seen, queries = [], []
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(f'{url}?{query}')
+            queries.append(len(ctx.captured_queries))
+            page = response.context['page_obj']
+            seen.append([q.id for q in page])
+            if not getattr(page, f'has_{direction}')():
+                return seen, queries, page
+            query = getattr(page, f'{direction}_query')
+
+    def test_forward_and_back_cover_feed_once(self):
+        url = reverse('questions:new_questions')
+        pages, queries, last = self.walk(url)
+        ids = [i for page in pages for i in page]
+        expected = list(Question.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(set(queries)), 1)
+
+        back, _, _ = self.walk(url, 'previous', last.previous_query)
+        self.assertEqual(back[::-1], pages[:-1])
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('questions:tag', args=['python']))
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in ctx.captured_queries))
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        url = reverse('questions:new_questions')
+        first = [q.id for q in self.client.get(url).context['page_obj']]
+        tampered = [q.id for q in self.client.get(url, {'after': 'garbage'}).context['page_obj']]
+        self.assertEqual(first, tampered)
+
+    def test_answers_follow_correct_first_ordering(self):
+        question = self.questions[0]
+        Answer.objects.filter(question=question).update(is_correct=False)
+        correct = Answer.objects.filter(question=question).order_by('created_at').first()
+        Answer.objects.filter(id=correct.id).update(is_correct=True)
+        url = reverse('questions:question', args=[question.id])
+        page = self.client.get(url).context['page_obj']
+        self.assertEqual(page.object_list[0].id, correct.id)
+
+
+class HotScoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=5, answers_per_question=0)
+
+    def test_like_and_answer_bump_score(self):
+        question = self.questions[0]
+        before = Question.objects.get(id=question.id).hot_score
+        self.client.force_login(self.users[2])
+        self.client.post(reverse('questions:like_question', args=[question.id]))
+        self.client.post(reverse('questions:question', args=[question.id]), {'text': 'A long enough answer'})
+        after = Question.objects.get(id=question.id).hot_score
+        self.assertAlmostEqual(after - before, HOT_LIKE_WEIGHT + HOT_ANSWER_WEIGHT)
+        self.assertEqual(Question.objects.hot().first().id, question.id)
+
+        # снятый лайк вычитает свой вес, погашенный за прошедшие миллисекунды
+        self.client.post(reverse('questions:like_question', args=[question.id]))
+        self.assertAlmostEqual(Question.objects.get(id=question.id).hot_score, after - HOT_LIKE_WEIGHT, places=4)
+
+    def test_decay_halves_scores_and_drops_tiny_ones(self):
+        Question.objects.update(hot_score=4.0)
+        Question.objects.filter(id=self.questions[0].id).update(hot_score=HOT_MIN_SCORE)
+        Question.objects.decay_hot_scores(HOT_HALF_LIFE_HOURS)
+        self.assertEqual(Question.objects.get(id=self.questions[0].id).hot_score, 0)
+        self.assertAlmostEqual(Question.objects.get(id=self.questions[1].id).hot_score, 2.0)
+
+    def test_rebuild_prefers_liked_questions(self):
+        QuestionLike.objects.bulk_create([QuestionLike(user=user.profile, question=self.questions[0]) for user in self.users[1:]])
+        Question.objects.rebuild_hot_scores()
+        self.assertEqual(Question.objects.hot().first().id, self.questions[0].id)
+
+    def age_likes(self, question):
+        # seed(): users[0] лайкнул каждый вопрос; пусть это было два периода полураспада назад
+        QuestionLike.objects.filter(question=question).update(
+            created_at=timezone.now() - timedelta(hours=2 * HOT_HALF_LIFE_HOURS),
+        )
+
+    def unlike_old_like(self, question):
+        self.age_likes(question)
+        Question.objects.filter(id=question.id).update(hot_score=1.0)
+        self.assertFalse(toggle_question_like(self.users[0].profile.id, question.id)[0])
+
+    def test_unlike_subtracts_decayed_weight(self):
+        self.unlike_old_like(self.questions[1])
+        self.assertAlmostEqual(Question.objects.get(id=self.questions[1].id).hot_score, 1.0 - HOT_LIKE_WEIGHT / 4, places=3)
+
+    @override_settings(LIKES_WRITE_BEHIND=True, LIKES_FLUSH_MS=0)
+    def test_buffered_unlike_subtracts_decayed_weight(self):
+        like_buffer.get_buffer.cache_clear()
+        self.addCleanup(like_buffer.get_buffer.cache_clear)
+        self.unlike_old_like(self.questions[2])
+        like_buffer.flush_all()
+        self.assertAlmostEqual(Question.objects.get(id=self.questions[2].id).hot_score, 1.0 - HOT_LIKE_WEIGHT / 4, places=3)
+
+    def test_rebuild_matches_incremental_score(self):
+        question = self.questions[3]
+        self.age_likes(question)
+        Question.objects.rebuild_hot_scores()
+        toggle_question_like(self.users[1].profile.id, question.id)
+        toggle_question_like(self.users[0].profile.id, question.id)
+        incremental = Question.objects.get(id=question.id).hot_score
+        Question.objects.rebuild_hot_scores()
+        self.assertAlmostEqual(Question.objects.get(id=question.id).hot_score, incremental, places=3)
+        self.assertAlmostEqual(incremental, HOT_NEW_QUESTION_WEIGHT + HOT_LIKE_WEIGHT, places=3)
+
+
+class BenchCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(num_questions=30)
+
+    def test_reports_every_page(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as report:
+            stderr = StringIO()
+            call_command('bench', iterations=2, warmup=0, json=report.name, stdout=StringIO(), stderr=stderr)
+            results = json.load(open(report.name))['results']
+
+        self.assertEqual(stderr.getvalue(), '')
+        self.assertEqual({row['status'] for row in results}, {200})
+        names = {row['name'] for row in results}
+        for name in ('new [first]', 'new [last]', 'hot [middle]', 'tag popular [first]',
+                     'question most answers [first]', 'search', 'tag suggest', 'ask', 'login'):
+            self.assertIn(name, names)
+        for row in results:
+            self.assertLessEqual(row['p50'], row['p99'])
+            self.assertGreater(row['bytes'], 0)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(num_questions=3)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get(reverse('questions:new_questions'))
+        timing = response['Server-Timing']
+        for name in ('db;dur=', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(name, timing)
+        self.assertNotIn('desc="0 queries"', timing)
+
+        body = self.client.get(reverse('questions:metrics')).content.decode()
+        self.assertIn('questions_request_duration_seconds_count{view="questions:new_questions"} 1', body)
+        self.assertIn('questions_db_queries_bucket{view="questions:new_questions",le="+Inf"} 1', body)
+        self.assertIn('questions_popular_tags_cache_total{result="misses"}', body)
+
+    def test_connection_metrics(self):
+        # закрыть соединение внутри транзакции теста нельзя — сигнал отправляем как при подключении
+        connection_created.send(sender=connection.__class__, connection=connection)
+        body = metrics.render_metrics()
+        self.assertIn('questions_db_connections_total{alias="default"} 1', body)
+        pools = metrics.pool_stats()
+        if connection.settings_dict['OPTIONS'].get('pool'):
+            self.assertIn('questions_db_pool_checkouts_total{alias="default"}', body)
+        else:
+            self.assertEqual(pools, {})
+            self.assertNotIn('questions_db_pool_', body)
+
+    def test_metrics_only_for_allowed_ips_and_staff(self):
+        url = reverse('questions:metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 403)
+        user = User.objects.create_user('metrics-admin', password='x', is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+    @override_settings(PERF_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('questions:new_questions'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.client.get(reverse('questions:metrics')).status_code, 404)
+
+
+class QuestionCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=12)
+
+    def setUp(self):
+        cache.clear()
+        get_popular_tags()
+        # вошедший пользователь проходит мимо кеша страниц, карточки рендерятся каждый раз
+        self.client.force_login(self.users[1])
+
+    def test_second_render_comes_from_cache(self):
+        url = reverse('questions:new_questions')
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        before = card_cache_stats()
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url)
+        after = card_cache_stats()
+
+        self.assertEqual(after['hits'] - before['hits'], 10)
+        self.assertEqual(after['misses'], before['misses'])
+        # теги загружаются только для отрендеренных заново карточек, лайки и сам пользователь — из кеша
+        self.assertEqual(len(warm.captured_queries), len(cold.captured_queries) - 3)
+
+    def test_card_changes_with_tags_and_answers(self):
+        url = reverse('questions:new_questions')
+        question = self.questions[-1]
+        self.client.get(url)
+
+        question.tags.add(Tag.objects.create(name='caching'))
+        self.assertContains(self.client.get(url), '> caching <')
+
+        self.client.post(reverse('questions:question', args=[question.id]), {'text': 'A long enough answer'})
+        self.assertContains(self.client.get(url), 'Answers (4)')
+
+        Tag.objects.filter(name='caching').delete()
+        self.assertNotContains(self.client.get(url), '> caching <')
+
+    def test_like_widget_is_per_user(self):
+        url = reverse('questions:new_questions')
+        self.assertNotContains(self.client_class().get(url), 'name="csrfmiddlewaretoken"')
+        response = self.client.get(url)
+        self.assertContains(response, 'name="csrfmiddlewaretoken"', count=10)
+        self.assertNotContains(response, '<!--question-like-->')
+
+
+class LikedStateTests(TestCase):
+    """Лайки пользователя на странице: один запрос на вид, потом — из кеша."""
+
+    LIKED = 'class="form-control border-primary"'
+
+    @classmethod
+    def setUpTestData(cls):
+        # users[0] лайкнул все вопросы, users[1] — второй ответ каждого вопроса
+        cls.users, cls.questions = seed(num_questions=12)
+        cls.question = cls.questions[-1]
+
+    def setUp(self):
+        cache.clear()
+        get_popular_tags()
+
+    def like_queries(self, ctx):
+        tables = ('FROM "questions_questionlike"', 'FROM "questions_answerlike"')
+        return [q['sql'] for q in ctx.captured_queries if q['sql'].split(' WHERE ')[0].endswith(tables)]
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, ctx
+
+    def test_feed_marks_liked_questions(self):
+        url = reverse('questions:new_questions')
+        self.client.force_login(self.users[0])
+        response, cold = self.get(url)
+        self.assertContains(response, self.LIKED, count=10)
+        self.assertEqual(len(self.like_queries(cold)), 1)
+
+        response, warm = self.get(url)
+        self.assertContains(response, self.LIKED, count=10)
+        self.assertEqual(self.like_queries(warm), [])
+        # пользователь с профилем уже в кеше (CachedUserMiddleware): дороже анонимной только сессия из базы
+        self.client.logout()
+        response, anonymous = self.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertEqual(len(warm.captured_queries), len(anonymous.captured_queries) + 1)
+
+        self.client.force_login(self.users[2])
+        self.assertNotContains(self.get(url)[0], self.LIKED)
+
+    def test_question_page_loads_both_kinds_once(self):
+        url = reverse('questions:question', args=[self.question.id])
+        liked_answer = self.question.answer_set.order_by('id')[1]
+        self.client.force_login(self.users[1])
+        response, cold = self.get(url)
+        self.assertEqual(len(self.like_queries(cold)), 2)
+        self.assertContains(response, self.LIKED, count=1)
+        self.assertContains(response, f'data-likes="answer-{liked_answer.id}" type="number" '
+                                      f'class="form-control border-primary"')
+        self.assertEqual(self.like_queries(self.get(url)[1]), [])
+
+    def test_toggle_invalidates_cached_state(self):
+        url = reverse('questions:new_questions')
+        self.client.force_login(self.users[2])
+        self.client.get(url)
+        like_url = reverse('questions:like_question_json', args=[self.question.id])
+        self.assertTrue(self.client.post(like_url).json()['liked'])
+
+        response, ctx = self.get(url)
+        self.assertContains(response, self.LIKED, count=1)
+        self.assertEqual(len(self.like_queries(ctx)), 1)
+        self.assertEqual(self.like_queries(self.get(url)[1]), [])
+        self.client.post(like_url)
+        self.assertNotContains(self.client.get(url), self.LIKED)
+
+    def test_load_that_raced_a_click_is_not_read_back(self):
+        url = reverse('questions:new_questions')
+        self.client.force_login(self.users[2])
+        profile_id = self.users[2].profile.id
+        # загрузка прочитала базу до клика, а в кеш пишет уже после него
+        stale_key = liked._cache_key('question', profile_id, liked._version(profile_id))
+        self.client.post(reverse('questions:like_question_json', args=[self.question.id]))
+        cache.set(stale_key, {self.question.id: False})
+        self.assertContains(self.client.get(url), self.LIKED, count=1)
+
+
+class CachedUserTests(TestCase):
+    """Вошедший пользователь и профиль — из кеша, сессия — из SESSION_ENGINE."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=12)
+        cls.user = cls.users[1]
+
+    def setUp(self):
+        cache.clear()
+        get_popular_tags()
+        self.url = reverse('questions:new_questions')
+
+    def tables(self, url=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url or self.url)
+        return response, [q['sql'].split(' FROM ')[1].split()[0].strip('"') for q in ctx.captured_queries]
+
+    def test_user_and_profile_come_from_cache(self):
+        self.client.force_login(self.user)
+        _, cold = self.tables()
+        self.assertIn('auth_user', cold)
+        self.assertNotIn('questions_profile', cold)
+        response, warm = self.tables()
+        self.assertContains(response, f'<div class="content__name">{self.user.username}</div>')
+        self.assertEqual(warm, ['questions_question', 'django_session'])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_cached_session_costs_as_much_as_anonymous(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        _, warm = self.tables()
+        self.client.logout()
+        response, anonymous = self.tables()
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertEqual(warm, anonymous)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_session(self):
+        response = self.client.post(reverse('questions:login'), {'username': self.user.username, 'password': 'test123'})
+        self.assertEqual(response.status_code, 302)
+        self.client.get(self.url)
+        response, warm = self.tables()
+        self.assertContains(response, 'Log out')
+        self.assertNotIn('django_session', warm)
+
+    def test_settings_save_invalidates(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('questions:settings'), {
+                'username': 'renamed', 'email': 'renamed@example.com', 'first_name': '', 'last_name': '',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertContains(self.client.get(self.url), '<div class="content__name">renamed</div>')
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(id=self.user.id)
+            user.set_password('another123')
+            user.save()
+        response = self.client.get(reverse('questions:settings'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('questions:login'), response['Location'])
+
+    def test_inactive_user_is_logged_out(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        # неактивный пользователь из кеша не проходит: решение за ModelBackend
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        cache.set(f'questions:user:{self.user.id}', User.objects.select_related('profile').get(id=self.user.id))
+        self.assertNotContains(self.client.get(self.url), 'Log out')
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=12)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, len(ctx.captured_queries)
+
+    def test_hit_needs_no_queries(self):
+        url = reverse('questions:question', args=[self.questions[0].id])
+        first, _ = self.get(url)
+        second, queries = self.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertEqual(second['X-Page-Cache'], 'HIT')
+        self.assertEqual(queries, 0)
+        self.assertEqual(first.content, second.content)
+        self.assertNotContains(second, 'name="csrfmiddlewaretoken"')
+
+    def test_logged_in_users_bypass(self):
+        url = reverse('questions:new_questions')
+        self.client.get(url)
+        self.client.force_login(self.users[0])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'BYPASS')
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_writes_purge_only_affected_pages(self):
+        question = self.questions[-1]
+        other = self.questions[0]
+        feed = reverse('questions:new_questions')
+        page = reverse('questions:question', args=[question.id])
+        other_page = reverse('questions:question', args=[other.id])
+        for url in (feed, page, other_page):
+            self.client.get(url)
+
+        author = self.client_class()
+        author.force_login(self.users[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            author.post(page, {'text': 'A long enough answer'})
+
+        self.assertEqual(self.client.get(other_page)['X-Page-Cache'], 'HIT')
+        for url in (feed, page):
+            response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'MISS')
+            self.assertContains(response, 'A long enough answer' if url == page else 'Answers (4)')
+
+        answer = question.answer_set.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            author.post(reverse('questions:like_answer_json', args=[answer.id]))
+        self.assertEqual(self.client.get(page)['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(feed)['X-Page-Cache'], 'HIT')
+
+    def test_stale_page_served_while_another_render_runs(self):
+        url = reverse('questions:hot_questions')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            page_cache.purge_surrogate_keys('feed:hot')
+        cache.add(f'questions:page:{page_cache._hash("testserver" + url)}:lock', 1)
+        response, queries = self.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        self.assertEqual(queries, 0)
+
+
+class BulkQuestionsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=2)
+
+    def setUp(self):
+        self.client.force_login(self.users[0])
+
+    def post(self, questions):
+        return self.client.post(
+            reverse('questions:bulk_questions_json'), {'questions': questions}, content_type='application/json',
+        )
+
+    def test_creates_questions_and_tags(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(BULK_PAYLOAD)
+        self.assertEqual(response.status_code, 201)
+        ids = response.json()['ids']
+        self.assertEqual(len(ids), 20)
+        self.assertEqual(Tag.objects.filter(name='python').count(), 1)
+        self.assertEqual(Question.objects.filter(id__in=ids, tags__name='python').count(), 20)
+        self.assertEqual(Question.objects.get(id=ids[3]).tags.count(), 2)
+        self.assertEqual(response.json()['tags'][3], ['python', 'import-3'])
+        # сессия, пользователь, профиль + вопросы, теги, связи — не зависит от размера пачки
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 6)
+
+    def test_invalid_item_rejects_whole_batch(self):
+        before = Question.objects.count()
+        response = self.post([BULK_PAYLOAD[0], {'title': 'short', 'text': 'short', 'tags': []}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['1']), {'title', 'text'})
+        self.assertEqual(Question.objects.count(), before)
+        self.assertEqual(self.post({'title': 'not a list'}).status_code, 400)
+
+    def test_tags_stay_a_list(self):
+        item = {'title': 'A question with odd tags', 'text': 'Long enough question text', 'tags': [' c++ ', 'c++']}
+        response = self.post([item])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['tags'], [['c++']])
+        # имя с запятой не превращается в два тега
+        response = self.post([{**item, 'tags': ['bulk-a,bulk-b']}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']['0']), {'tags'})
+        self.assertFalse(Tag.objects.filter(name__startswith='bulk-').exists())
+
+    def test_form_uses_batched_tags(self):
+        form = QuestionForm(
+            {'title': 'A question with tags', 'text': 'Long enough question text', 'tags': 'a, b, c, d, e, a'},
+            user=self.users[0],
+        )
+        self.assertTrue(form.is_valid())
+        with CaptureQueriesContext(connection) as ctx:
+            question = form.save()
+        self.assertEqual(sorted(question.tags.values_list('name', flat=True)), ['a', 'b', 'c', 'd', 'e'])
+        self.assertLessEqual(len([q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]), 4)
+
+
+@override_settings(RELATED_REFRESH_SYNC=True)
+class RelatedQuestionsTests(TestCase):
+    """Похожие вопросы: соседи по общим тегам, редкий общий тег весит больше популярного."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=12, answers_per_question=0)
+        # python есть у всех вопросов (idf = 0), django — у двух третей, orm — только у двух
+        cls.first, cls.second = cls.questions[1], cls.questions[4]
+        orm = Tag.objects.create(name='orm')
+        cls.first.tags.add(orm)
+        cls.second.tags.add(orm)
+
+    def related_ids(self, question):
+        return [link.related_id for link in related.related_questions(question.id)]
+
+    def test_rare_shared_tag_ranks_first(self):
+        self.assertEqual(related.build_all(), RelatedQuestion.objects.count())
+        self.assertEqual(self.related_ids(self.first)[0], self.second.id)
+        self.assertEqual(len(self.related_ids(self.first)), related.RELATED_TOP_K)
+        links = list(related.related_questions(self.first.id))
+        self.assertEqual([link.score for link in links], sorted((link.score for link in links), reverse=True))
+
+    def test_page_reads_one_indexed_lookup(self):
+        related.build_all()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('questions:question', args=[self.first.id]))
+        self.assertContains(response, 'Related Questions')
+        self.assertContains(response, f'href="/question/{self.second.id}/">{self.second.title}</a>')
+        lookups = [q['sql'] for q in ctx.captured_queries if 'questions_relatedquestion' in q['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertNotIn('questions_tag', lookups[0])
+
+    def test_tag_assignment_refreshes_lists(self):
+        related.build_all()
+        question = Question.objects.create(title='Another ORM question', text='Some text', user=self.first.user)
+        # N для idf берётся из кеша; для точного сравнения с полным пересчётом — свежий
+        cache.delete(related.RELATED_TOTAL_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            question.tags.add(Tag.objects.get(name='orm'))
+        self.assertEqual(set(self.related_ids(question)), {self.first.id, self.second.id})
+        self.assertIn(question.id, self.related_ids(self.first))
+        self.assertLessEqual(len(self.related_ids(self.first)), related.RELATED_TOP_K)
+
+        # списки вопроса после обновления на месте — такие же, как после полного пересчёта
+        incremental = list(RelatedQuestion.objects.filter(question=question).values_list('related_id', 'score'))
+        related.build_all()
+        full = list(RelatedQuestion.objects.filter(question=question).values_list('related_id', 'score'))
+        self.assertEqual(sorted(incremental), sorted(full))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.tags.clear()
+        self.assertEqual(self.related_ids(question), [])
+        self.assertNotIn(question.id, self.related_ids(self.first))
+
+    def test_bulk_import_refreshes(self):
+        imported = Question.objects.create(title='Imported ORM question', text='Some text', user=self.first.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            attach_tags({imported.id: ['orm']})
+        self.assertEqual(set(self.related_ids(imported)), {self.first.id, self.second.id})
+
+    @override_settings(RELATED_REFRESH_SYNC=False)
+    def test_refresh_runs_in_background_batches(self):
+        related.build_all()
+        imported = Question.objects.create(title='Imported ORM question', text='Some text', user=self.first.user)
+        asked = Question.objects.create(title='Asked ORM question', text='Some text', user=self.first.user)
+        with mock.patch.object(related, '_get_executor') as executor, self.captureOnCommitCallbacks(execute=True):
+            attach_tags({imported.id: ['orm']})
+            asked.tags.add(Tag.objects.get(name='orm'))
+        # запрос только ставит вопросы в очередь; оба попадут в одну пачку одного потока
+        executor.return_value.submit.assert_called_once_with(related._drain_in_worker)
+        self.assertFalse(RelatedQuestion.objects.filter(question__in=[imported, asked]).exists())
+        related._drain()
+        self.assertEqual(set(self.related_ids(imported)), {self.first.id, self.second.id, asked.id})
+        self.assertIn(imported.id, self.related_ids(asked))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_related', top=2, stdout=out)
+        self.assertIn('Пар записано', out.getvalue())
+        self.assertEqual(len(self.related_ids(self.first)), 2)
+
+
+class ExplainHotPathsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed(num_questions=30)
+
+    def test_new_feed_uses_index(self):
+        out = StringIO()
+        call_command('explain_hot_paths', only='new()', stdout=out)
+        self.assertIn('question_new_idx', out.getvalue())
+        if connection.vendor == 'sqlite':
+            # PostgreSQL на 30 строках честно выбирает полный проход вместо индекса
+            self.assertIn('Запросов с подозрительными планами: 0', out.getvalue())
+
+    def test_reports_every_path(self):
+        out = StringIO()
+        call_command('explain_hot_paths', stdout=out)
+        for name in ('hot() середина ленты', 'by_tag(', 'ответы на вопрос', 'похожие вопросы', 'get_popular_tags()', 'search('):
+            self.assertIn(name, out.getvalue())
+
+
+def make_image(size=(320, 240), color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+
+class AvatarThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=2)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        overrides = override_settings(MEDIA_ROOT=media.name, AVATAR_THUMBNAILS_SYNC=True)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.users[0])
+
+    def upload(self, color='red'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('questions:settings'), {
+                'username': self.users[0].username,
+                'email': self.users[0].email,
+                'avatar': make_image(color=color),
+            })
+        self.assertEqual(response.status_code, 302)
+        return Profile.objects.get(user=self.users[0])
+
+    def test_upload_builds_all_sizes(self):
+        profile = self.upload()
+        self.assertEqual(len(profile.avatar_hash), 16)
+        files = sorted(os.listdir(os.path.join(self.media_root, 'avatars')))
+        self.assertEqual(len(files), 6)
+        with Image.open(os.path.join(self.media_root, 'avatars', f'{profile.avatar_hash}-50.webp')) as image:
+            self.assertEqual(image.size, (50, 50))
+
+        html = self.client.get(reverse('questions:settings')).content.decode()
+        self.assertIn(f'/media/avatars/{profile.avatar_hash}-200.webp 1x', html)
+        self.assertIn('type="image/webp"', html)
+
+        response = self.client.get(f'/media/avatars/{profile.avatar_hash}-100.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_new_avatar_gets_new_name(self):
+        first = self.upload('red').avatar_hash
+        second = self.upload('blue').avatar_hash
+        self.assertNotEqual(first, second)
+
+    def test_backfill_command(self):
+        profile = self.upload()
+        Profile.objects.filter(id=profile.id).update(avatar_hash='')
+        out = StringIO()
+        call_command('build_avatars', workers=1, stdout=out)
+        self.assertIn('Готово: 1', out.getvalue())
+        self.assertEqual(Profile.objects.get(id=profile.id).avatar_hash, profile.avatar_hash)
+
+
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.TemporaryDirectory()
+        cls.overrides = override_settings(STATIC_ROOT=cls.static_root.name)
+        cls.overrides.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.overrides.disable()
+        cls.static_root.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hashed_and_precompressed(self):
+        url = static('questions/bootstrap.min.css')
+        self.assertRegex(url, r'^/static/questions/bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertIn(response['Content-Encoding'], ('br', 'gzip'))
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        compressed = b''.join(response.streaming_content)
+        self.assertLess(len(compressed), 60_000)
+
+        plain = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        body = b''.join(plain.streaming_content)
+        self.assertGreater(len(body), 200_000)
+        # сторонний файл копируется как есть, вместе со ссылкой на sourcemap
+        self.assertTrue(body.endswith(b'/*# sourceMappingURL=bootstrap.min.css.map */'))
+
+    def test_unhashed_name_is_revalidated(self):
+        response = self.client.get('/static/questions/bootstrap.min.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        not_modified = self.client.get(
+            '/static/questions/bootstrap.min.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_missing_manifest_fails_outside_development(self):
+        with tempfile.TemporaryDirectory() as empty, override_settings(STATIC_ROOT=empty):
+            self.assertEqual(static('questions/bootstrap.min.css'), '/static/questions/bootstrap.min.css')
+            with override_settings(STATICFILES_UNHASHED_FALLBACK=False), self.assertRaises(ValueError):
+                static('questions/bootstrap.min.css')
+
+    def test_pages_link_hashed_assets(self):
+        seed(num_questions=1)
+        html = self.client.get(reverse('questions:new_questions')).content.decode()
+        self.assertIn(static('questions/bootstrap.min.css'), html)
+        self.assertIn(static('questions/images/image.png'), html)
+        self.assertNotIn('"/static/questions/images/image.png"', html)
+
+        out = StringIO()
+        call_command('page_weight', '/', stdout=out)
+        self.assertIn('тёплая: 1 запросов', out.getvalue())
+
+
+class FillDbTests(TransactionTestCase):
+    # fill_db закрывает соединения перед запуском процессов — внутри транзакции TestCase так нельзя
+    def test_fills_every_table(self):
+        call_command('fill_db', 1, workers=1, stdout=StringIO())
+        self.assertEqual(Profile.objects.count(), User.objects.count())
+        self.assertEqual(Question.objects.count(), 10)
+        self.assertEqual(Answer.objects.count(), 100)
+        # время сгенерированных лайков неизвестно: для hot_score они ровесники вопроса
+        self.assertFalse(QuestionLike.objects.filter(created_at__isnull=False).exists())
+
+
+# RELATED_REFRESH_SYNC: seed() назначает теги вне транзакции, похожие вопросы пересчитываются сразу, а не в потоке
+@override_settings(DATABASE_REPLICAS=['replica1'], PRIMARY_PIN_SECONDS=10, RELATED_REFRESH_SYNC=True)
+class ReplicaRoutingTests(TransactionTestCase):
+    # TestCase держит тест в транзакции, а внутри транзакции роутер всегда выбирает default
+
+    def setUp(self):
+        cache.clear()
+        self.users, self.questions = seed(num_questions=2)
+
+    def run_request(self, method='get', cookies=None, view=None):
+        """Прогоняет запрос через middleware; view получает управление внутри него."""
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        seen = {}
+
+        def get_response(request):
+            if view:
+                view()
+            seen['questions'] = Question.objects.new().db
+            seen['tags'] = Tag.objects.all().db
+            seen['users'] = User.objects.all().db
+            with transaction.atomic():
+                seen['in_transaction'] = Question.objects.all().db
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return seen, response
+
+    def test_reads_go_to_replica(self):
+        seen, response = self.run_request()
+        self.assertEqual(seen, {
+            'questions': 'replica1', 'tags': 'replica1', 'users': 'default', 'in_transaction': 'default',
+        })
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+        # вне запросов (команды, shell) — только основная база
+        self.assertEqual(Question.objects.all().db, 'default')
+
+    def test_write_pins_to_primary(self):
+        question = self.questions[0]
+        seen, response = self.run_request(view=lambda: Question.objects.touch([question.id]))
+        self.assertEqual(seen['questions'], 'default')
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]['max-age'], 10)
+
+        seen, _ = self.run_request(cookies={PRIMARY_PIN_COOKIE: '1'})
+        self.assertEqual(seen['questions'], 'default')
+        seen, _ = self.run_request(method='post')
+        self.assertEqual(seen['questions'], 'default')
+
+    def test_like_sets_pin_cookie(self):
+        self.client.force_login(self.users[1])
+        response = self.client.post(reverse('questions:like_question_json', args=[self.questions[0].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertIsNone(routers._state.get())
+
+
+class SSEClient:
+    """Подписчик live.asgi_router: принятые куски тела и отключение по команде."""
+
+    def __init__(self, question_id):
+        self.scope = {'type': 'http', 'method': 'GET', 'path': f'/question/{question_id}/events/'}
+        self.messages = asyncio.Queue()
+        self.gone = asyncio.Event()
+        self.task = asyncio.create_task(live.asgi_router(None)(self.scope, self.receive, self.messages.put))
+
+    async def receive(self):
+        await self.gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def read(self):
+        message = await asyncio.wait_for(self.messages.get(), 5)
+        return message.get('body', message.get('status'))
+
+    async def read_event(self):
+        while True:
+            chunk = await self.read()
+            if chunk.startswith(b'event:'):
+                return json.loads(chunk.split(b'data: ', 1)[1])
+
+    async def disconnect(self):
+        self.gone.set()
+        await asyncio.wait_for(self.task, 5)
+
+
+class LiveEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.questions = seed(num_questions=2, answers_per_question=1)
+        cls.question = cls.questions[0]
+        cls.answer = cls.question.answer_set.get()
+
+    def committed(self, func, *args):
+        """Вызывает func и выполняет её on_commit-колбэки, как после настоящего коммита."""
+        # соединения у каждого потока свои: перехватывать колбэки нужно там же, где идёт запись
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args)
+
+    def test_like_fans_out_to_subscribers(self):
+        @async_to_sync
+        async def scenario():
+            clients = [SSEClient(self.question.id) for _ in range(3)]
+            other = SSEClient(self.questions[1].id)
+            for client in clients + [other]:
+                self.assertEqual(await client.read(), 200)
+                self.assertEqual(await client.read(), b'retry: 5000\n\n')
+            self.assertEqual(live.hub.connections(), 4)
+
+            liked, likes = await sync_to_async(self.committed)(
+                toggle_answer_like, self.users[2].profile.id, self.answer.id,
+            )
+            for client in clients:
+                self.assertEqual(await client.read_event(),
+                                 {'type': 'likes', 'target': 'answer', 'id': self.answer.id, 'likes': likes})
+            self.assertTrue(other.messages.empty())
+
+            for client in clients + [other]:
+                await client.disconnect()
+            self.assertEqual(live.hub.connections(), 0)
+
+        scenario()
+
+    def test_new_answer_event_after_commit(self):
+        self.client.force_login(self.users[1])
+        url = reverse('questions:question', args=[self.question.id])
+
+        @async_to_sync
+        async def scenario():
+            client = SSEClient(self.question.id)
+            await client.read()
+            await sync_to_async(self.committed)(self.client.post, url, {'text': 'A live answer long enough'})
+            answer = Answer.objects.filter(text='A live answer long enough')
+            self.assertEqual(await client.read_event(),
+                             {'type': 'answer', 'id': await answer.values_list('id', flat=True).aget()})
+            await client.disconnect()
+
+        scenario()
+
+    def test_page_subscribes_and_wsgi_declines(self):
+        response = self.client.get(reverse('questions:question', args=[self.question.id]))
+        events_url = reverse('questions:question_events', args=[self.question.id])
+        self.assertContains(response, f"new EventSource('{events_url}')")
+        self.assertContains(response, f'data-likes="answer-{self.answer.id}"')
+        self.assertEqual(self.client.get(events_url).status_code, 204)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY есть только в PostgreSQL')
+@override_settings(LIVE_EVENTS_BACKEND='questions.live.PostgresBackend')
+class PostgresLiveEventsTests(TransactionTestCase):
+    def setUp(self):
+        live.get_backend.cache_clear()
+        self.addCleanup(live.get_backend.cache_clear)
+
+    def test_notify_reaches_subscribers(self):
+        @async_to_sync
+        async def scenario():
+            queue = live.hub.subscribe(42)
+            try:
+                # LISTEN устанавливается в фоне: публикуем, пока событие не дойдёт
+                for _ in range(50):
+                    await sync_to_async(live.get_backend().publish)(42, {'type': 'likes', 'likes': 1})
+                    try:
+                        return await asyncio.wait_for(queue.get(), 0.2)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                live.hub.unsubscribe(42, queue)
+                live.hub.listener_task.cancel()
+
+        self.assertEqual(scenario(), {'type': 'likes', 'likes': 1})
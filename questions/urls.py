@@ -1,19 +1,34 @@
+from django.conf import settings
 from django.urls import path
 
-from questions import views
+from questions import async_views, views
 
 app_name = 'questions'
 
-urlpatterns = [
-    path('', views.index, name="new_questions"),
-    path('hot/', views.hot_questions, name="hot_questions"),
-    path('ask/', views.ask, name="ask"),
-    path('signup/', views.signup, name="signup"),
-    path('login/', views.login, name="login"),
-    path('logout/', views.logout, name="logout"),
-    path('settings/', views.settings, name="settings"),
-    path('question/<int:question_id>/', views.question, name="question"),
-    path('question/<int:question_id>/like/', views.like_question, name='like_question'),
-    path('answer/<int:answer_id>/like/', views.like_answer, name='like_answer'),
-    path('tag/<str:tag>/', views.tag, name='tag'),
-]
\ No newline at end of file
+
+def build_urlpatterns(read_views):
+    """read_views — модуль со страницами чтения (index, hot_questions, question, tag)."""
+    return [
+        path('', read_views.index, name="new_questions"),
+        path('hot/', read_views.hot_questions, name="hot_questions"),
+        path('ask/', views.ask, name="ask"),
+        path('signup/', views.signup, name="signup"),
+        path('login/', views.login, name="login"),
+        path('logout/', views.logout, name="logout"),
+        path('settings/', views.settings, name="settings"),
+        path('question/<int:question_id>/', read_views.question, name="question"),
+        path('question/<int:question_id>/events/', async_views.question_events, name='question_events'),
+        path('question/<int:question_id>/like/', views.like_question, name='like_question'),
+        path('answer/<int:answer_id>/like/', views.like_answer, name='like_answer'),
+        path('api/question/<int:question_id>/like/', views.like_question_json, name='like_question_json'),
+        path('api/answer/<int:answer_id>/like/', views.like_answer_json, name='like_answer_json'),
+        path('api/questions/bulk/', views.bulk_questions_json, name='bulk_questions_json'),
+        path('tags/suggest/', views.tag_suggest, name='tag_suggest'),
+        path('tag/<str:tag>/', read_views.tag, name='tag'),
+        path('search/', views.search, name='search'),
+        path('metrics', views.metrics, name='metrics'),
+    ]
+
+
+# под ASGI (project/asgi.py) страницы чтения асинхронные, под WSGI — обычные
+urlpatterns = build_urlpatterns(async_views if settings.ASYNC_VIEWS else views)
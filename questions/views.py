@@ -1,13 +1,43 @@
+import json
+import mimetypes
+import os
+from functools import wraps
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation, ValidationError
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import serve as static_serve, was_modified_since
 from django.contrib.auth import login as auth_login, logout as auth_logout, authenticate
-from django.db import models
-from django.contrib.auth.models import User
 from django.urls import reverse
-from questions.models import Question, QuestionLike, Profile, Answer, AnswerLike, Tag
-from questions.forms import LoginForm, SignUpForm, UserForm, ProfileForm, QuestionForm, AnswerForm
+from django.conf import settings as django_settings
+from questions.avatars import AVATAR_DIR
+from questions.models import Profile, Question, Answer
+from questions.forms import LoginForm, SignUpForm, UserForm, ProfileForm, QuestionForm, AnswerForm, clean_tag_names
+from questions.cache import get_popular_tags
+from questions.metrics import render_metrics
+from questions.like_buffer import merge_pending
+from questions.liked import liked_loader
+from questions.pagination import paginate_cursor
+from questions.related import related_questions
+from questions.tag_suggest import suggest
+from questions.page_cache import anonymous_page_cache, add_surrogate_keys
+from questions.services import toggle_question_like, toggle_answer_like, create_questions
+
+FEED_ORDERING = ('-created_at', '-id')
+HOT_ORDERING = ('-hot_score', '-id')
+ANSWERS_ORDERING = ('-is_correct', '-created_at', 'id')
+BULK_QUESTIONS_LIMIT = 500
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# файлы без хеша в имени (ссылки не через {% static %}) браузер перепроверяет
+STATIC_CACHE_CONTROL = 'public, max-age=3600'
 
 
 def paginate(objects_list, request, per_page=10):
@@ -24,12 +54,11 @@ def paginate(objects_list, request, per_page=10):
     return page
 
 
-def get_popular_tags():
-    return Tag.objects.annotate(
-        num_questions=models.Count('question')
-    ).order_by('-num_questions')[:15]
+def question_keys(page):
+    return [f'question:{q.id}' for q in page]
 
 
+@anonymous_page_cache
 def index(request):
     tag_name = request.GET.get("tag")
 
@@ -38,7 +67,8 @@ def index(request):
     else:
         questions = Question.objects.new()
 
-    page = paginate(questions, request)
+    page = paginate_cursor(questions, request, FEED_ORDERING)
+    add_surrogate_keys(request, f'tag:{tag_name}' if tag_name else 'feed:new', *question_keys(page))
 
     return render(request, 'questions/index.html', {
         'questions': page.object_list,
@@ -48,9 +78,12 @@ def index(request):
     })
 
 
+@anonymous_page_cache
 def hot_questions(request):
-    questions = Question.objects.hot()  
-    page = paginate(questions, request, per_page=3)
+    questions = Question.objects.hot()
+    page = paginate_cursor(questions, request, HOT_ORDERING, per_page=3)
+    # порядок меняют и лайки вопросов с других страниц: это видно через PAGE_CACHE_TIMEOUT
+    add_surrogate_keys(request, 'feed:hot', *question_keys(page))
 
     return render(request, 'questions/hot.html', {
         'page_obj': page,
@@ -146,17 +179,25 @@ def settings(request):
     })
 
 
+@anonymous_page_cache
 def question(request, question_id):
-    current_question = get_object_or_404(Question, id=question_id)
-    answers = current_question.answer_set.all().order_by('-is_correct', '-created_at')
-    page = paginate(answers, request, per_page=5)
+    current_question = get_object_or_404(Question.objects.with_card_data(), id=question_id)
+    answers = current_question.answer_set.select_related('user')
+    page = paginate_cursor(answers, request, ANSWERS_ORDERING, per_page=5)
+    add_surrogate_keys(request, f'question:{question_id}', *(f'answer:{a.id}' for a in page))
+    merge_pending('question', [current_question])
+    merge_pending('answer', page.object_list)
+    liked = liked_loader(request)
+    liked.add('question', [current_question])
+    liked.add('answer', page.object_list)
     
     if request.method == 'POST' and request.user.is_authenticated:
         form = AnswerForm(request.POST, user=request.user, question=current_question)
         if form.is_valid():
             answer = form.save()
-            page_num = request.GET.get('page', 1)
-            return redirect(reverse('questions:question', args=[question_id]) + f'?page={page_num}#answer-{answer.id}')
+            query = request.GET.urlencode()
+            url = reverse('questions:question', args=[question_id])
+            return redirect(url + (f'?{query}' if query else '') + f'#answer-{answer.id}')
     else:
         form = AnswerForm(user=request.user, question=current_question)
     
@@ -166,42 +207,205 @@ def question(request, question_id):
         'page_obj': page,
         'form': form,
         'tags': get_popular_tags(),
+        'related': related_questions(question_id),
     })
 
 
 @login_required
+@require_POST
 def like_question(request, question_id):
-    question = get_object_or_404(Question, id=question_id)
-    profile = request.user.profile
-    
-    like, created = QuestionLike.objects.get_or_create(user=profile, question=question)
-    
-    if not created:
-        like.delete()
-    
+    try:
+        toggle_question_like(request.user.profile.id, question_id)
+    except Question.DoesNotExist:
+        raise Http404
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
 @login_required
+@require_POST
 def like_answer(request, answer_id):
-    answer = get_object_or_404(Answer, id=answer_id)
-    profile = request.user.profile 
+    try:
+        toggle_answer_like(request.user.profile.id, answer_id)
+    except Answer.DoesNotExist:
+        raise Http404
+    return redirect(request.META.get('HTTP_REFERER', '/'))
 
-    like, created = AnswerLike.objects.get_or_create(user=profile, answer=answer)
 
-    if not created:
-        like.delete()
+def json_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@json_login_required
+@require_POST
+def like_question_json(request, question_id):
+    try:
+        liked, likes = toggle_question_like(request.user.profile.id, question_id)
+    except Question.DoesNotExist:
+        return JsonResponse({'error': 'not found'}, status=404)
+    return JsonResponse({'liked': liked, 'likes': likes})
+
+
+@json_login_required
+@require_POST
+def like_answer_json(request, answer_id):
+    try:
+        liked, likes = toggle_answer_like(request.user.profile.id, answer_id)
+    except Answer.DoesNotExist:
+        return JsonResponse({'error': 'not found'}, status=404)
+    return JsonResponse({'liked': liked, 'likes': likes})
+
+
+@json_login_required
+@require_POST
+def bulk_questions_json(request):
+    """
+    Импорт пачки вопросов: {"questions": [{"title": ..., "text": ..., "tags": ["python", ...]}, ...]}.
+    Каждый вопрос проверяется QuestionForm; при любой ошибке не создаётся ничего.
+    Ответ: {"ids": [...], "tags": [["python", ...], ...]} — теги каждого вопроса после нормализации.
+    """
+    try:
+        items = json.loads(request.body)['questions']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'expected {"questions": [...]}'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'questions must be a non-empty list'}, status=400)
+    if len(items) > BULK_QUESTIONS_LIMIT:
+        return JsonResponse({'error': f'at most {BULK_QUESTIONS_LIMIT} questions per request'}, status=400)
+
+    cleaned, errors = [], {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('tags', []), list):
+            errors[index] = {'__all__': ['expected {"title", "text", "tags": [...]}']}
+            continue
+        form = QuestionForm(data={'title': item.get('title', ''), 'text': item.get('text', '')})
+        valid = form.is_valid()
+        # теги остаются списком, а не склеиваются в строку для поля формы: имя с запятой — ошибка, а не два тега
+        try:
+            tags = clean_tag_names(str(tag) for tag in item.get('tags', []))
+        except ValidationError as error:
+            form.add_error('tags', error)
+            valid = False
+        if valid:
+            cleaned.append({**form.cleaned_data, 'tags': tags})
+        else:
+            errors[index] = form.errors
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    profile, _ = Profile.objects.get_or_create(user=request.user)
+    questions = create_questions(profile, cleaned)
+    return JsonResponse({
+        'ids': [question.id for question in questions],
+        'tags': [item['tags'] for item in cleaned],
+    }, status=201)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = paginate(Question.objects.search(query), request)
+
+    return render(request, 'questions/search.html', {
+        'questions': page.object_list,
+        'page_obj': page,
+        'query': query,
+        'tags': get_popular_tags(),
+    })
 
-    return redirect(request.META.get('HTTP_REFERER', '/'))
 
+@require_GET
+@cache_control(max_age=60)
+def tag_suggest(request):
+    """Подсказки тегов для формы вопроса: из индекса в памяти процесса, без базы."""
+    tags = suggest(request.GET.get('prefix', '').strip())
+    return JsonResponse({'tags': [{'name': name, 'questions': count} for name, count in tags]})
 
+
+@anonymous_page_cache
 def tag(request, tag):
     questions = Question.objects.by_tag(tag)
-    page = paginate(questions, request)
+    page = paginate_cursor(questions, request, FEED_ORDERING)
+    add_surrogate_keys(request, f'tag:{tag}', *question_keys(page))
 
     return render(request, 'questions/tag.html', {
         'questions': page.object_list,
         'page_obj': page,
         'tag': tag,
         'tags': get_popular_tags(),
-    })
\ No newline at end of file
+    })
+
+
+def metrics(request):
+    if not django_settings.PERF_METRICS:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in django_settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def media(request, path):
+    """
+    Загруженные файлы из MEDIA_ROOT. Миниатюры аватаров названы по хешу содержимого
+    и не меняются, поэтому кешируются навсегда. В продакшене /media/ лучше отдавать nginx
+    с теми же заголовками (см. README).
+    """
+    response = static_serve(request, path, document_root=django_settings.MEDIA_ROOT)
+    if path.startswith(f'{AVATAR_DIR}/'):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def static_files(request, path):
+    """
+    Статика после collectstatic (STATIC_ROOT): заранее сжатый вариант по Accept-Encoding,
+    файлы с хешем в имени — с Cache-Control: immutable. Под runserver с DEBUG=True
+    /static/ по-прежнему отдаёт django.contrib.staticfiles.
+    """
+    storage = staticfiles_storage
+    try:
+        full_path = storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    encoding = None
+    if hasattr(storage, 'compressed_variant'):
+        variant = storage.compressed_variant(path, accepted_encodings(request.headers.get('Accept-Encoding', '')))
+        if variant:
+            full_path, encoding = variant
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(path)
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        del response['Content-Disposition']
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    immutable = hasattr(storage, 'is_immutable') and storage.is_immutable(path)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else STATIC_CACHE_CONTROL
+    return response